@@ -1,19 +1,54 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.datastructures import Headers
+from typing import List, Union
 from dotenv import load_dotenv
 
 # Import internal services
-from backend.services.ingestion import ingest_files
-from backend.services.test_case_generator import generate_test_cases
-from backend.services.script_generator import generate_scripts
-from backend.services.knowledge_base import save_knowledge, load_knowledge, knowledge_summary
+from backend.services.ingestion import MAX_UPLOAD_REQUEST_BYTES, UploadTooLarge, ingest_files, delete_documents
+from backend.services.test_case_generator import astream_test_cases, generation_stats, prompt_report
+from backend.services.coverage import analyze_coverage
+from backend.services.dedup import DEDUP_MODES
+from backend.services.script_generator import SCRIPT_MODES
+from backend.models import ScriptGenerationRequest
+from backend.services.jobs import FINISHED_STATUSES, JOB_WORKERS, job_store, worker_loop, worker_name
+from backend.services.test_runner import DRIVER_FACTORIES, RUNNER_WORKERS
+from backend.services.knowledge_base import save_knowledge, load_knowledge, knowledge_exists, knowledge_summary
+from backend.services.storage import (
+    DEFAULT_PROJECT, project_dir, project_lock, read_json, scripts_file, test_cases_file, write_json,
+)
+from backend.utils import metrics
+from backend.utils.log import configure_logging, log_event, request_id
+from backend.utils.response_cache import response_cache
 
 # Load environment variables (Gemini API key etc.)
 load_dotenv()
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In-process job workers; run `python -m backend.worker` for dedicated ones
+    stop = asyncio.Event()
+    workers = [asyncio.create_task(worker_loop(job_store, worker_name(f"api-{i}"), stop))
+               for i in range(JOB_WORKERS)]
+    yield
+    stop.set()
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
 
 # Initialize FastAPI application
-app = FastAPI(title="Autonomous QA Agent Backend")
+app = FastAPI(title="Autonomous QA Agent Backend", lifespan=lifespan)
 
 # Configure CORS to allow frontend access
 app.add_middleware(
@@ -24,6 +59,102 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class UploadLimitMiddleware:
+    """
+    Rejects /ingest requests over `max_bytes` with 413: up front from Content-Length,
+    otherwise (chunked bodies) as soon as the streamed body passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES, paths=("/ingest",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the limit of {self.max_bytes} bytes per request."},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        length = Headers(scope=scope).get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            return await self.reject(scope, receive, send)
+
+        received = 0
+        exceeded = started = False
+
+        async def counting_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Abort the body parser; the rest of the body is never read
+                    exceeded = True
+                    raise UploadTooLarge(f"Upload exceeds the limit of {self.max_bytes} bytes per request.")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # The app turns the aborted body into its own error (FastAPI: 400); 413 is sent instead
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, guarded_send)
+        except UploadTooLarge:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            await self.reject(scope, receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware)
+
+
+@app.middleware("http")
+async def log_requests(request: Request, call_next):
+    # Registered last, so it runs first: times the whole request, rejected uploads included
+    rid = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id.set(rid)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        # Route template (/jobs/{job_id}), not the raw path, keeps label cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status))
+        metrics.HTTP_DURATION.observe(duration, method=request.method, route=route)
+        log_event("request", method=request.method, path=request.url.path, route=route, status=status,
+                  duration_ms=round(duration * 1000, 1), project_id=request.query_params.get("project_id"))
+        request_id.reset(token)
+
+
+def project(project_id: str = DEFAULT_PROJECT) -> str:
+    """
+    `?project_id=` query parameter shared by all endpoints: each project (team)
+    has its own knowledge base, test cases, scripts and reports.
+    """
+    try:
+        project_dir(project_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return project_id
+
+
 # ──────────────────────────────
 # 1️⃣ Health Check
 # ──────────────────────────────
@@ -36,13 +167,25 @@ async def health():
 # 2️⃣ Ingest Docs + HTML
 # ──────────────────────────────
 @app.post("/ingest")
-async def ingest_api(files: List[UploadFile] = File(...)):
+async def ingest_api(files: List[UploadFile] = File(...), prune: bool = False,
+                     project_id: str = Depends(project)):
     """
-    Upload support docs + HTML to build knowledge base.
+    Upload support docs + HTML to build (or incrementally update) the knowledge base.
+    Unchanged files are skipped; with `prune`, previously ingested files that are
+    not part of this upload are removed. Files are streamed to disk; uploads over
+    MAX_UPLOAD_FILE_BYTES / MAX_UPLOAD_REQUEST_BYTES are rejected with 413.
     """
     try:
-        knowledge = await ingest_files(files)
-        save_knowledge(knowledge)
+        async with project_lock(project_id):
+            try:
+                existing = await run_in_threadpool(load_knowledge, project_id, False)
+            except FileNotFoundError:
+                existing = None
+
+            knowledge = await ingest_files(files, existing, prune=prune, project_id=project_id)
+            report = knowledge["last_ingest"]
+            if report["added"] or report["updated"] or report["deleted"] or existing is not knowledge:
+                await run_in_threadpool(save_knowledge, knowledge, project_id)
 
         return {
             "status": "success",
@@ -50,73 +193,263 @@ async def ingest_api(files: List[UploadFile] = File(...)):
             "knowledge_summary": knowledge_summary(knowledge),
         }
 
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion error: {str(e)}")
 
 
+@app.delete("/documents/{filename}")
+async def delete_document_api(filename: str, project_id: str = Depends(project)):
+    """
+    Remove one ingested document (and its chunks) from the knowledge base.
+    """
+    async with project_lock(project_id):
+        try:
+            knowledge = await run_in_threadpool(load_knowledge, project_id, False)
+        except FileNotFoundError:
+            raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
+
+        documents = knowledge.get("documents", {})
+        if filename not in documents:
+            raise HTTPException(status_code=404, detail=f"Document not found: {filename}")
+        # Same rule as ingestion: the knowledge base keeps at least one HTML page
+        if documents[filename]["kind"] == "html" and \
+                not any(doc["kind"] == "html" for name, doc in documents.items() if name != filename):
+            raise HTTPException(status_code=400, detail="⚠ Cannot delete the last HTML page; at least one is required.")
+
+        delete_documents(knowledge, [filename])
+
+        knowledge["last_ingest"] = {"added": [], "updated": [], "unchanged": [], "deleted": [filename]}
+        await run_in_threadpool(save_knowledge, knowledge, project_id)
+    return {
+        "status": "success",
+        "message": f"Removed {filename} from the knowledge base.",
+        "knowledge_summary": knowledge_summary(knowledge),
+    }
+
+
 # ──────────────────────────────
 # 3️⃣ Generate Test Cases using Gemini
 # ──────────────────────────────
-@app.post("/generate-test-cases")
-async def generate_test_cases_api():
+def dedup_mode(dedup: str = None) -> str:
     """
-    Generate grounded test cases using Gemini strictly based on knowledge base.
+    `?dedup=` handling of near-duplicate test cases: merge, drop or off (default DEDUP_MODE).
     """
-    try:
-        knowledge = load_knowledge()
+    if dedup is not None and dedup not in DEDUP_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown dedup mode '{dedup}'. Choose one of: {list(DEDUP_MODES)}")
+    return dedup
 
-        test_cases = generate_test_cases(knowledge)
 
-        # Save generated cases
-        with open("backend/data/test_cases.json", "w") as f:
-            import json
-            json.dump(test_cases, f, indent=2)
+@app.post("/generate-test-cases", status_code=202)
+async def generate_test_cases_api(force_regenerate: bool = False, dedup: str = Depends(dedup_mode),
+                                  project_id: str = Depends(project)):
+    """
+    Queue a job that generates grounded test cases using Gemini strictly based
+    on the knowledge base. Poll /jobs/{job_id} for progress and fetch the
+    generated cases from /jobs/{job_id}/result. Identical knowledge bases are
+    served from the response cache unless `force_regenerate` is set.
+    Near-duplicate test cases are merged or dropped before they are saved (`dedup`).
+    """
+    if not knowledge_exists(project_id):
+        raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
+
+    payload = {"force_regenerate": force_regenerate, "dedup": dedup, "project_id": project_id}
+    job_id = await run_in_threadpool(job_store.enqueue, "generate_test_cases", payload)
+    return {"status": "queued", "job_id": job_id}
 
-        return {
-            "status": "success",
-            "total_test_cases": len(test_cases.get("test_cases", [])),
-            "test_cases": test_cases,
-        }
 
+@app.post("/generate-test-cases/stream")
+async def stream_test_cases_api(force_regenerate: bool = False, dedup: str = Depends(dedup_mode),
+                                project_id: str = Depends(project)):
+    """
+    Inline alternative to the /generate-test-cases job: streams each validated
+    test case as a Server-Sent Event (`event: test_case`) as soon as Gemini has
+    produced it. Failed shards arrive as `event: shard_error`; the final
+    `event: done` carries the merged result, which is also saved like the job's.
+    """
+    try:
+        knowledge = await run_in_threadpool(load_knowledge, project_id)
     except FileNotFoundError:
         raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Test case generation error: {str(e)}")
+
+    async def event_stream():
+        try:
+            async for event, data in astream_test_cases(knowledge, force=force_regenerate, dedup=dedup):
+                if event == "done":
+                    async with project_lock(project_id):
+                        await run_in_threadpool(write_json, test_cases_file(project_id), data)
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            error = {"error": f"Test case generation error: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache-stats")
+async def cache_stats_api():
+    """
+    Hit/miss counters and size of the test case response cache.
+    """
+    return await run_in_threadpool(response_cache.stats)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_api():
+    """
+    Per-stage counters and latency histograms of this process, in the
+    Prometheus text format (ingest, HTML parsing, prompts, LLM calls,
+    response parsing, validation, script generation, jobs, HTTP requests).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/generation-stats")
+async def generation_stats_api():
+    """
+    LLM calls, follow-up retries and locally repaired / salvaged responses of
+    test case generation, with retries per successful shard.
+    """
+    return await run_in_threadpool(generation_stats)
+
+
+@app.get("/prompt-stats")
+async def prompt_stats_api(project_id: str = Depends(project)):
+    """
+    Estimated prompt tokens per generation shard, before and after compaction.
+    """
+    if not knowledge_exists(project_id):
+        raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
+    knowledge = await run_in_threadpool(load_knowledge, project_id)
+    return await run_in_threadpool(prompt_report, knowledge)
+
+
+@app.get("/coverage")
+async def coverage_api(project_id: str = Depends(project)):
+    """
+    Requirement coverage and step grounding of the project's generated test
+    cases: which requirement chunks each test covers, uncovered chunks,
+    unknown related_requirements and steps matching no UI element.
+    """
+    if not knowledge_exists(project_id):
+        raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
+    if not os.path.exists(test_cases_file(project_id)):
+        raise HTTPException(status_code=400, detail="Test cases not found. Please generate them first.")
+    knowledge = await run_in_threadpool(load_knowledge, project_id)
+    test_cases = await run_in_threadpool(read_json, test_cases_file(project_id))
+    return await run_in_threadpool(analyze_coverage, test_cases, knowledge)
 
 
 # ──────────────────────────────
 # 4️⃣ Generate Selenium Scripts
 # ──────────────────────────────
-@app.post("/generate-scripts")
-async def generate_scripts_api(selected_test_ids: List[str]):
+@app.post("/generate-scripts", status_code=202)
+async def generate_scripts_api(request: Union[List[str], ScriptGenerationRequest],
+                               project_id: str = Depends(project)):
     """
-    Given selected test case IDs, generate runnable Selenium Python scripts.
+    Given selected test case IDs, queue a job that generates runnable Selenium
+    Python scripts; the job result holds the code (see /jobs/{job_id}/result).
+    The body is either a plain list of IDs or a ScriptGenerationRequest with
+    a generation mode and (per-test) timeouts.
     """
-    try:
-        # Load knowledge + generated test cases
-        knowledge = load_knowledge()
+    if isinstance(request, list):
+        request = ScriptGenerationRequest(selected_test_ids=request)
 
-        import json
-        with open("backend/data/test_cases.json", "r") as f:
-            test_cases = json.load(f)
+    if request.mode not in SCRIPT_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown script mode '{request.mode}'. "
+                                                    f"Choose one of: {list(SCRIPT_MODES)}")
+    if not knowledge_exists(project_id):
+        raise HTTPException(status_code=400, detail="Knowledge base not found. Please ingest documents first.")
+    if not os.path.exists(test_cases_file(project_id)):
+        raise HTTPException(status_code=400, detail="Test cases not found. Please generate them first.")
 
-        scripts = generate_scripts(test_cases, knowledge, selected_test_ids)
+    payload = {**request.model_dump(), "project_id": project_id}
+    job_id = await run_in_threadpool(job_store.enqueue, "generate_scripts", payload)
+    return {"status": "queued", "job_id": job_id}
 
-        script_path = "backend/data/generated_scripts.py"
-        with open(script_path, "w") as f:
-            f.write(scripts)
 
-        return {
-            "status": "success",
-            "message": "Scripts generated successfully",
-            "generated_file": script_path,
-            "code": scripts,
-        }
+# ──────────────────────────────
+# 🧵 Background Jobs
+# ──────────────────────────────
+@app.get("/jobs")
+async def list_jobs_api(status: str = None, limit: int = 50, project_id: str = Depends(project)):
+    """
+    The project's most recent jobs first, optionally filtered by status.
+    """
+    return {"jobs": await run_in_threadpool(job_store.list, status, limit, project_id)}
 
-    except FileNotFoundError:
-        raise HTTPException(status_code=400, detail="Test cases not found. Please generate them first.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Script generation error: {str(e)}")
+
+async def project_job(job_id: str, project_id: str, with_result: bool = False) -> dict:
+    """
+    The job, or 404 if it does not exist or belongs to another project.
+    """
+    job = await run_in_threadpool(job_store.get, job_id, with_result)
+    if job is None or job["payload"].get("project_id", DEFAULT_PROJECT) != project_id:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status_api(job_id: str, project_id: str = Depends(project)):
+    """
+    Status (queued, running, succeeded, failed, cancelled), progress (0-1) and error of a job.
+    """
+    return await project_job(job_id, project_id)
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result_api(job_id: str, project_id: str = Depends(project)):
+    """
+    Result of a succeeded job (the same body the endpoint used to return inline).
+    """
+    job = await project_job(job_id, project_id, True)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, no result yet.")
+    return job["result"]
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job_api(job_id: str, project_id: str = Depends(project)):
+    """
+    Cancel a queued job immediately, or ask the worker running it to stop.
+    """
+    await project_job(job_id, project_id)
+    job = await run_in_threadpool(job_store.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job["status"] in FINISHED_STATUSES and job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}.")
+    return job
+
+
+# ──────────────────────────────
+# 5️⃣ Run Generated Selenium Scripts
+# ──────────────────────────────
+@app.post("/run-tests", status_code=202)
+async def run_tests_api(workers: int = RUNNER_WORKERS, driver: str = "chrome",
+                        project_id: str = Depends(project)):
+    """
+    Queue a job that executes the generated suite headless, in its own
+    process, on a pool of browser sessions (at most RUNNER_WORKERS) and
+    writes JSON + JUnit reports. `driver=fake` runs without a browser (CI).
+    The job result holds the summary and per-test outcomes.
+    """
+    if driver not in DRIVER_FACTORIES:
+        raise HTTPException(status_code=400, detail=f"Unknown driver '{driver}'. "
+                                                    f"Choose one of: {sorted(DRIVER_FACTORIES)}")
+    if not os.path.exists(scripts_file(project_id)):
+        raise HTTPException(status_code=400, detail="Generated scripts not found. Please generate them first.")
+
+    payload = {"project_id": project_id, "workers": max(1, min(workers, RUNNER_WORKERS)), "driver": driver}
+    job_id = await run_in_threadpool(job_store.enqueue, "run_tests", payload)
+    return {"status": "queued", "job_id": job_id}
 
 
 # ──────────────────────────────
@@ -20,6 +20,9 @@ class UIElement(BaseModel):
     type: Optional[str]
     text: Optional[str]
     class_: Optional[str] = None  # "class" is reserved in Python
+    label: Optional[str] = None
+    placeholder: Optional[str] = None
+    page: Optional[str] = None  # HTML page the element was parsed from
 
 
 class KnowledgeBase(BaseModel):
@@ -39,11 +42,17 @@ class IngestionResponse(BaseModel):
 class TestCase(BaseModel):
     test_id: str
     title: str
+    page: Optional[str] = None  # HTML page the test runs against
     related_requirements: List[str]
     used_elements: List[str]
     preconditions: List[str]
     steps: List[str]
     expected_result: str
+    timeout: Optional[float] = None  # seconds per step wait in explicit script mode
+
+
+class TestCaseList(BaseModel):
+    test_cases: List[TestCase]  # response schema enforced on the LLM output
 
 
 class TestCaseGenerationResponse(BaseModel):
@@ -57,6 +66,9 @@ class TestCaseGenerationResponse(BaseModel):
 # ───────────────────────────────────────────────
 class ScriptGenerationRequest(BaseModel):
     selected_test_ids: List[str]
+    mode: str = "basic"  # "basic", "explicit" (WebDriverWait helpers) or "page_object"
+    default_timeout: float = 10
+    timeouts: Dict[str, float] = {}  # per test_id overrides, explicit / page_object modes
 
 
 class ScriptGenerationResponse(BaseModel):
@@ -64,6 +76,8 @@ class ScriptGenerationResponse(BaseModel):
     message: str
     generated_file: str
     code: str
+    helpers_file: Optional[str] = None
+    helpers_code: Optional[str] = None
 
 
 # ───────────────────────────────────────────────
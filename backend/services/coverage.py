@@ -0,0 +1,208 @@
+"""
+Coverage and grounding of generated test cases against the knowledge base.
+
+Test cases, requirement chunks, steps and UI element labels are turned into
+TF-IDF matrices (NumPy, no network) and compared in batches:
+
+  - which requirement chunks each test case covers (cosine similarity of its
+    title, steps and expected result with every chunk), and which chunks no
+    test case covers or declares in related_requirements;
+  - related_requirements that are not chunk IDs, or that the test case does not resemble;
+  - steps that match no UI element of the test case's page (ungrounded).
+"""
+import math
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from backend.services.knowledge_base import elements_by_page, knowledge_chunks, tokenize
+from backend.utils import metrics
+
+# Cosine similarity from which a test case counts as covering a requirement chunk
+COVERAGE_MIN_SIMILARITY = float(os.getenv("COVERAGE_MIN_SIMILARITY", "0.15"))
+# Cosine similarity from which a step counts as referring to a UI element
+GROUNDING_MIN_SIMILARITY = float(os.getenv("GROUNDING_MIN_SIMILARITY", "0.2"))
+# Best-matching chunks reported per test case, and rows multiplied at a time (bounds memory)
+COVERAGE_TOP_K = int(os.getenv("COVERAGE_TOP_K", "3"))
+COVERAGE_BATCH_ROWS = int(os.getenv("COVERAGE_BATCH_ROWS", "1024"))
+
+ELEMENT_FIELDS = ("id", "name", "text", "label", "placeholder", "data-testid")
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ TF-IDF
+# ───────────────────────────────────────────────
+def _tfidf(queries: List[Counter], documents: List[Counter]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    L2-normalised TF-IDF rows (sublinear tf, smoothed idf over both sides) for
+    `queries` and `documents`, over the terms they share only: other terms
+    cannot contribute to a dot product, so they only count towards the norms.
+    Keeps the matrices small even with large vocabularies.
+    """
+    df = Counter(term for counts in (*queries, *documents) for term in counts)
+    n = len(queries) + len(documents)
+    idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+    shared = set().union(*queries) & set().union(*documents) if queries and documents else set()
+    columns = {term: i for i, term in enumerate(sorted(shared))}
+
+    def matrix(rows: List[Counter]) -> np.ndarray:
+        weights = np.zeros((len(rows), len(columns)), dtype=np.float32)
+        norms = np.ones(len(rows), dtype=np.float32)
+        for r, counts in enumerate(rows):
+            norm = 0.0
+            for term, tf in counts.items():
+                weight = (1 + math.log(tf)) * idf[term]
+                norm += weight * weight
+                if term in columns:
+                    weights[r, columns[term]] = weight
+            norms[r] = math.sqrt(norm) or 1.0
+        return weights / norms[:, None]
+
+    return matrix(queries), matrix(documents)
+
+
+def _batches(count: int):
+    for start in range(0, count, COVERAGE_BATCH_ROWS):
+        yield start, min(start + COVERAGE_BATCH_ROWS, count)
+
+
+def _test_text(tc: Dict[str, Any]) -> str:
+    steps = tc.get("steps") or []
+    return " ".join([str(tc.get("title") or ""), *map(str, steps), str(tc.get("expected_result") or "")])
+
+
+def _element_text(elem: Dict[str, Any]) -> str:
+    values = [str(elem[key]) for key in ELEMENT_FIELDS if elem.get(key)]
+    if isinstance(elem.get("aria"), dict):
+        values.extend(str(value) for value in elem["aria"].values() if value)
+    return " ".join(values)
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Requirements covered per test case
+# ───────────────────────────────────────────────
+def _requirement_coverage(test_cases: List[Dict[str, Any]], chunks: List[Dict[str, str]],
+                          report: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Fills "requirements", "unknown_requirements" and "unsupported_requirements"
+    of every entry of `report`; returns which chunks are covered (matched or declared).
+    """
+    covered = np.zeros(len(chunks), dtype=bool)
+    if not chunks:
+        return covered
+    tests, reqs = _tfidf([Counter(tokenize(_test_text(tc))) for tc in test_cases],
+                         [Counter(tokenize(chunk["text"])) for chunk in chunks])
+    positions = {chunk["id"]: i for i, chunk in enumerate(chunks)}
+    k = min(COVERAGE_TOP_K, len(chunks))
+
+    for start, stop in _batches(len(test_cases)):
+        scores = tests[start:stop] @ reqs.T
+        covered |= (scores >= COVERAGE_MIN_SIMILARITY).any(axis=0)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, tc in enumerate(test_cases[start:stop]):
+            entry = report[start + row]
+            best = sorted(top[row], key=lambda col: -scores[row, col])
+            entry["requirements"] = [
+                {"id": chunks[col]["id"], "score": round(float(scores[row, col]), 3)}
+                for col in best if scores[row, col] >= COVERAGE_MIN_SIMILARITY
+            ]
+            for declared in tc.get("related_requirements") or []:
+                col = positions.get(declared)
+                if col is None:
+                    entry["unknown_requirements"].append(declared)
+                    continue
+                covered[col] = True
+                if scores[row, col] < COVERAGE_MIN_SIMILARITY:
+                    entry["unsupported_requirements"].append(declared)
+    return covered
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Steps grounded in UI elements
+# ───────────────────────────────────────────────
+def _step_grounding(test_cases: List[Dict[str, Any]], knowledge: Dict[str, Any],
+                    report: List[Dict[str, Any]]) -> int:
+    """
+    Fills "ungrounded_steps" of every entry of `report`; returns their total.
+    A step is grounded when it resembles a UI element of the test case's page
+    (all pages when it names none) or names the page itself ("Open checkout.html").
+    """
+    pages = elements_by_page(knowledge)
+    page_codes = {page: i for i, page in enumerate(pages)}
+    elements = [elem for page_elements in pages.values() for elem in page_elements]
+    element_pages = np.array([page_codes[page] for page, page_elements in pages.items() for _ in page_elements],
+                             dtype=np.int64)
+    default_page = knowledge.get("page")
+
+    steps = []  # (report index, step index, page code or -1 for any, text)
+    for i, tc in enumerate(test_cases):
+        page = tc.get("page") or default_page
+        for j, step in enumerate(tc.get("steps") or []):
+            step = str(step)
+            if page and page.lower() in step.lower():
+                continue
+            steps.append((i, j, page_codes.get(page, -1), step))
+    if not steps:
+        return 0
+
+    vectors, labels = _tfidf([Counter(tokenize(step[3])) for step in steps],
+                             [Counter(tokenize(_element_text(elem))) for elem in elements])
+    step_pages = np.array([step[2] for step in steps], dtype=np.int64)
+    ungrounded = 0
+    for start, stop in _batches(len(steps)):
+        scores = vectors[start:stop] @ labels.T
+        # Only elements on the step's own page count
+        same_page = (step_pages[start:stop, None] == -1) | (step_pages[start:stop, None] == element_pages[None, :])
+        grounded = ((scores >= GROUNDING_MIN_SIMILARITY) & same_page).any(axis=1)
+        for row in np.flatnonzero(~grounded):
+            i, j, _, text = steps[start + row]
+            report[i]["ungrounded_steps"].append({"index": j, "step": text})
+            ungrounded += 1
+    return ungrounded
+
+
+# ───────────────────────────────────────────────
+# 4️⃣ Report
+# ───────────────────────────────────────────────
+def analyze_coverage(test_cases: Dict[str, Any], knowledge: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Coverage report of a test_cases.json payload against its knowledge base:
+    a summary, the uncovered requirement chunks and, per test case, the
+    chunks it covers, its unknown / unsupported related_requirements and its
+    ungrounded steps. Scales to thousands of test cases and chunks.
+    """
+    started = time.perf_counter()
+    cases = [tc for tc in test_cases.get("test_cases", []) if isinstance(tc, dict)]
+    chunks = knowledge_chunks(knowledge)
+    report = [
+        {"test_id": tc.get("test_id"), "requirements": [], "unknown_requirements": [],
+         "unsupported_requirements": [], "ungrounded_steps": []}
+        for tc in cases
+    ]
+
+    covered = _requirement_coverage(cases, chunks, report)
+    ungrounded = _step_grounding(cases, knowledge, report)
+
+    uncovered = [
+        {"id": chunk["id"], "source": chunk.get("source"), "text": chunk["text"][:200]}
+        for chunk, hit in zip(chunks, covered) if not hit
+    ]
+    seconds = time.perf_counter() - started
+    metrics.COVERAGE_DURATION.observe(seconds)
+    return {
+        "summary": {
+            "test_cases": len(cases),
+            "requirements": len(chunks),
+            "covered_requirements": int(covered.sum()),
+            "coverage": round(float(covered.mean()), 3) if chunks else 0.0,
+            "tests_without_requirements": sum(1 for entry in report if not entry["requirements"]),
+            "unknown_requirements": sum(len(entry["unknown_requirements"]) for entry in report),
+            "ungrounded_steps": ungrounded,
+            "seconds": round(seconds, 3),
+        },
+        "uncovered_requirements": uncovered,
+        "test_cases": report,
+    }
@@ -0,0 +1,152 @@
+"""
+Near-duplicate test case detection (MinHash + LSH).
+
+LLM-generated suites often hold reworded copies of the same test (same
+elements, same actions). Each test case is reduced to a MinHash signature of
+its word 3-gram shingles over steps + used elements; signatures are split
+into LSH bands so only test cases sharing a band bucket are compared, which
+keeps clustering sub-quadratic. Candidates whose estimated Jaccard similarity
+reaches DEDUP_THRESHOLD (and that target the same page) are clustered; the
+first test case of each cluster is kept.
+"""
+import os
+import re
+import zlib
+from typing import Any, Dict, List
+
+import numpy as np
+
+from backend.utils import metrics
+
+# "merge" (keep the first case of a cluster with the others' requirements),
+# "drop" (keep the first case only) or "off"
+DEDUP_MODE = os.getenv("DEDUP_MODE", "merge")
+DEDUP_MODES = ("merge", "drop", "off")
+# Estimated Jaccard similarity (of step / element shingles) from which test cases are duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# MinHash permutations = LSH bands x rows per band
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_ROWS = int(os.getenv("DEDUP_ROWS", "4"))
+
+_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ MinHash signatures
+# ───────────────────────────────────────────────
+def shingles(tc: Dict[str, Any], size: int = 3) -> set:
+    """
+    Word `size`-grams of each step, plus one shingle per used element.
+    """
+    result = {f"element:{elem}" for elem in tc.get("used_elements") or []}
+    for step in tc.get("steps") or []:
+        words = _WORD_RE.findall(str(step).lower())
+        if len(words) < size:
+            result.add(" ".join(words))
+        result.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return result
+
+
+class MinHasher:
+    def __init__(self, permutations: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(permutations, 1), dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=(permutations, 1), dtype=np.uint64)
+
+    def signature(self, items: set) -> np.ndarray:
+        """
+        Min of (a*x + b) mod p over the items' hashes, for every permutation.
+        """
+        if not items:
+            return np.full(len(self.a), _PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) & _PRIME for item in items),
+                             dtype=np.uint64, count=len(items))
+        return ((self.a * hashes[None, :] + self.b) % _PRIME).min(axis=1)
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ LSH clustering
+# ───────────────────────────────────────────────
+def find_duplicates(test_cases: List[Dict[str, Any]], threshold: float = DEDUP_THRESHOLD,
+                    bands: int = DEDUP_BANDS, rows: int = DEDUP_ROWS) -> List[List[int]]:
+    """
+    Clusters (lists of positions, first = earliest) of near-duplicate test
+    cases; test cases without a duplicate are left out.
+    """
+    if len(test_cases) < 2:
+        return []
+    hasher = MinHasher(bands * rows)
+    signatures = np.stack([hasher.signature(shingles(tc)) for tc in test_cases])
+
+    parent = list(range(len(test_cases)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        for i, values in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            key = (test_cases[i].get("page"), values.tobytes())
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            # Each member is compared with the bucket's first one only: linear per bucket
+            first = members[0]
+            for other in members[1:]:
+                if find(first) == find(other):
+                    continue
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    parent[max(find(first), find(other))] = min(find(first), find(other))
+
+    clusters = {}
+    for i in range(len(test_cases)):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Pruning
+# ───────────────────────────────────────────────
+def _union(*lists) -> list:
+    return list(dict.fromkeys(item for items in lists for item in items or []))
+
+
+def dedup_test_cases(test_cases: Dict[str, Any], mode: str = DEDUP_MODE,
+                     threshold: float = DEDUP_THRESHOLD) -> Dict[str, Any]:
+    """
+    Remove near-duplicate test cases from a test_cases.json payload.
+
+    "merge" keeps the first case of each cluster, extended with the other
+    cases' related_requirements and their IDs / titles under
+    "merged_duplicates"; "drop" keeps the first case as is. Test IDs
+    are not renumbered. A "dedup" summary is added to the payload.
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode '{mode}'. Choose one of: {list(DEDUP_MODES)}")
+    cases = test_cases.get("test_cases")
+    if mode == "off" or not cases:
+        return test_cases
+
+    clusters = find_duplicates(cases, threshold)
+    removed = set()
+    kept = {}
+    for members in clusters:
+        first, duplicates = members[0], [cases[i] for i in members[1:]]
+        removed.update(members[1:])
+        if mode == "merge":
+            kept[first] = dict(
+                cases[first],
+                related_requirements=_union(cases[first].get("related_requirements"),
+                                            *(tc.get("related_requirements") for tc in duplicates)),
+                merged_duplicates=[{"test_id": tc.get("test_id"), "title": tc.get("title")} for tc in duplicates],
+            )
+
+    metrics.DEDUP_REMOVED.inc(len(removed), mode=mode)
+    return dict(
+        test_cases,
+        test_cases=[kept.get(i, tc) for i, tc in enumerate(cases) if i not in removed],
+        dedup={"mode": mode, "threshold": threshold, "clusters": len(clusters), "removed": len(removed)},
+    )
@@ -1,54 +1,377 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple
 from fastapi import UploadFile
-from backend.utils.file_loader import load_text_from_file
-from backend.utils.html_parser import parse_html_structure
+from backend.utils.file_loader import extract_pages, extractor_for
+from backend.utils.html_parser import parse_html_file
+from backend.utils.log import logger
+from backend.utils import metrics
+from backend.services.storage import (
+    DATA_DIR, DEFAULT_PROJECT, pages_dir, read_json, uploads_dir, write_json,
+)
 
-async def ingest_files(files: List[UploadFile]) -> Dict[str, Any]:
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1200"))
+
+# HTML pages are kept per project (storage.pages_dir) for Selenium and parsed in a process pool
+HTML_PARSE_WORKERS = int(os.getenv("HTML_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Document text is extracted in a process pool, in ranges of pages, and cached by
+# content hash (shared by all projects); bump the version when extractors change
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(DATA_DIR, "cache", "extracted"))
+EXTRACT_CACHE_VERSION = "1"
+
+# Uploads are streamed to disk in chunks; larger files / requests are rejected (HTTP 413)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(256 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+
+class UploadTooLarge(ValueError):
+    """
+    An upload exceeded MAX_UPLOAD_FILE_BYTES or MAX_UPLOAD_REQUEST_BYTES.
+    """
+
+
+def chunk_text(text: str, source: str, max_chars: int = CHUNK_MAX_CHARS) -> List[Dict[str, str]]:
+    """
+    Split a document into paragraph-aligned chunks of at most ~max_chars.
+    Oversized paragraphs are split on line boundaries (and overlong lines hard-wrapped).
+    """
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+        else:
+            for line in paragraph.splitlines():
+                line = line.strip()
+                pieces.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+
+    return [
+        {"id": f"{source}#{i}", "source": source, "text": chunk}
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def chunk_pages(pages: List[str], source: str, max_chars: int = CHUNK_MAX_CHARS) -> List[Dict[str, str]]:
+    """
+    chunk_text over a document's pages (chunks never span pages), numbered across the document.
+    """
+    chunks = []
+    for page in pages:
+        for chunk in chunk_text(page, source, max_chars):
+            chunk["id"] = f"{source}#{len(chunks)}"
+            chunks.append(chunk)
+    return chunks
+
+
+def _rebuild_requirements(knowledge: Dict[str, Any]) -> None:
+    """
+    Re-derive the per-document requirement texts from the chunks, in manifest order.
+    """
+    texts = {}
+    for chunk in knowledge["chunks"]:
+        texts.setdefault(chunk["source"], []).append(chunk["text"])
+    knowledge["requirements"] = [
+        "\n\n".join(texts[name]) for name in knowledge["documents"] if name in texts
+    ]
+
+
+def delete_documents(knowledge: Dict[str, Any], filenames: List[str]) -> List[str]:
     """
-    Ingest uploaded support documents and HTML file, extract useful info,
-    and build a structured knowledge base.
+    Remove documents (and their chunks) from the knowledge base in place.
+    Returns the names that were actually removed.
+    """
+    documents = knowledge.get("documents", {})
+    deleted = [name for name in filenames if name in documents]
+    if not deleted:
+        return []
+
+    for name in deleted:
+        if documents.pop(name)["kind"] == "html":
+            knowledge["pages"].pop(name, None)
+    knowledge["ui_elements"] = [elem for elem in knowledge["ui_elements"] if elem.get("page") not in deleted]
+    knowledge["chunks"] = [chunk for chunk in knowledge["chunks"] if chunk["source"] not in deleted]
+    _rebuild_requirements(knowledge)
+    return deleted
+
+
+def _timed_parse(path: str) -> Tuple[List[Dict[str, Any]], float]:
+    # Timed where it runs, so pool start-up and pickling are not counted as parse time
+    start = time.perf_counter()
+    ui_elements = parse_html_file(path)
+    return ui_elements, time.perf_counter() - start
+
+
+async def parse_pages(paths: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Parse several HTML pages concurrently. Returns {page name: ui_elements},
+    each element tagged with its page. A single page is parsed on a thread
+    to avoid the process start-up cost.
+    """
+    loop = asyncio.get_running_loop()
+    names = list(paths)
+    if len(names) <= 1 or HTML_PARSE_WORKERS <= 1:
+        timed = [await asyncio.to_thread(_timed_parse, paths[name]) for name in names]
+    else:
+        with ProcessPoolExecutor(max_workers=min(HTML_PARSE_WORKERS, len(names))) as pool:
+            timed = await asyncio.gather(
+                *(loop.run_in_executor(pool, _timed_parse, paths[name]) for name in names)
+            )
+
+    results = []
+    for ui_elements, seconds in timed:
+        metrics.HTML_PARSE_DURATION.observe(seconds)
+        metrics.HTML_ELEMENTS.inc(len(ui_elements))
+        results.append(ui_elements)
+
+    return {
+        name: [dict(elem, page=name) for elem in ui_elements]
+        for name, ui_elements in zip(names, results)
+    }
+
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def save_upload(file: UploadFile, directory: str, max_bytes: int = MAX_UPLOAD_FILE_BYTES) -> Tuple[str, str, int]:
+    """
+    Stream an upload into a temp file in `directory` (keeping the file's
+    extension), UPLOAD_CHUNK_BYTES at a time, hashing while writing (both off
+    the event loop). Returns (temp path, sha256, size); the caller renames or
+    removes the temp file. Raises UploadTooLarge as soon as more than
+    `max_bytes` have been read.
+    """
+    await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+    suffix = os.path.splitext(os.path.basename(file.filename or ""))[1]
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=suffix)
+    digest, size = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{file.filename} exceeds the upload limit of {max_bytes} bytes.")
+                await asyncio.to_thread(_write_chunk, out, digest, chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _extract_cache_path(digest: str) -> str:
+    return os.path.join(EXTRACT_CACHE_DIR, f"{digest}-v{EXTRACT_CACHE_VERSION}.json")
+
+
+def _read_extract_cache(digest: str):
+    path = _extract_cache_path(digest)
+    return read_json(path) if os.path.exists(path) else None
+
+
+def _page_ranges(path: str) -> List[Tuple[int, int]]:
+    count = max(1, extractor_for(path).page_count(path))
+    return [(start, min(start + EXTRACT_PAGES_PER_TASK, count)) for start in range(0, count, EXTRACT_PAGES_PER_TASK)]
+
+
+async def extract_documents(documents: Dict[str, Tuple[str, str]]) -> Dict[str, List[str]]:
+    """
+    Page texts of several documents, {name: (path, sha256)} -> {name: [page text]}.
+
+    Previously extracted content is read from the cache. The rest is split into
+    ranges of EXTRACT_PAGES_PER_TASK pages, and all ranges of all documents are
+    extracted concurrently in a process pool (a single range runs on a thread).
+    Unsupported formats yield no pages.
+    """
+    results, pending = {}, {}
+    for name, (path, digest) in documents.items():
+        if extractor_for(path) is None:
+            logger.warning(f"Unsupported file format: {os.path.splitext(path)[1]} ({path})")
+            results[name] = []
+            continue
+        cached = await asyncio.to_thread(_read_extract_cache, digest)
+        if cached is not None:
+            results[name] = cached
+        else:
+            pending[name] = path
+
+    tasks = []
+    for name, path in pending.items():
+        for start, stop in await asyncio.to_thread(_page_ranges, path):
+            tasks.append((name, path, start, stop))
+
+    if len(tasks) <= 1 or EXTRACT_WORKERS <= 1:
+        outputs = [await asyncio.to_thread(extract_pages, path, start, stop) for _, path, start, stop in tasks]
+    else:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(tasks))) as pool:
+            outputs = await asyncio.gather(
+                *(loop.run_in_executor(pool, extract_pages, path, start, stop) for _, path, start, stop in tasks)
+            )
+
+    for name in pending:
+        results[name] = []
+    for (name, _, _, _), pages in zip(tasks, outputs):
+        results[name].extend(pages)
+    for name in pending:
+        await asyncio.to_thread(write_json, _extract_cache_path(documents[name][1]), results[name], None)
+    return results
+
+
+def _commit_uploads(staged: Dict[str, str], pages: List[str], upload_dir: str, page_dir: str) -> None:
+    """
+    Move staged uploads ({filename: temp path}) into `upload_dir`, and copy the
+    HTML `pages` into `page_dir`. The page copies are made to temp files first,
+    so once they all succeeded only renames remain.
+    """
+    page_tmps = {}
+    try:
+        os.makedirs(page_dir, exist_ok=True)
+        for name in pages:
+            fd, page_tmps[name] = tempfile.mkstemp(dir=page_dir, prefix=".tmp-")
+            os.close(fd)
+            shutil.copyfile(staged[name], page_tmps[name])
+    except BaseException:
+        _remove_files(page_tmps.values())
+        raise
+    for name, tmp_path in page_tmps.items():
+        os.replace(tmp_path, os.path.join(page_dir, name))
+    for name, tmp_path in staged.items():
+        os.replace(tmp_path, os.path.join(upload_dir, name))
+
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def ingest_files(files: List[UploadFile], existing: Dict[str, Any] = None,
+                       prune: bool = False, project_id: str = DEFAULT_PROJECT) -> Dict[str, Any]:
+    """
+    Ingest uploaded support documents and HTML pages, extract useful info,
+    and update the structured knowledge base incrementally. Every HTML page
+    is kept (under the project's pages_dir) with its own elements, tagged by page name.
+
+    `existing` is the current knowledge base (if any). A manifest of content
+    hashes per document means unchanged uploads are skipped, changed documents
+    only replace their own chunks, and with `prune` documents that were not
+    re-uploaded are deleted. The outcome is recorded under "last_ingest".
+
+    Uploads are streamed to disk, never held in memory; UploadTooLarge is
+    raised when a file exceeds MAX_UPLOAD_FILE_BYTES or all files together
+    exceed MAX_UPLOAD_REQUEST_BYTES. Uploads stay in temp files until every
+    file was received, extracted and parsed; only then are they moved into
+    uploads/ and pages/, so a failing request leaves the project's files as they were.
     """
     if not files:
         raise ValueError("No files uploaded for ingestion.")
-    
-    docs_text = []
-    html_content = None
+    started = time.perf_counter()
 
-    upload_dir = "backend/data/uploaded_docs"
-    os.makedirs(upload_dir, exist_ok=True)
+    # Knowledge bases built before the manifest / multi-page support are rebuilt from scratch
+    if existing and "documents" in existing and "pages" in existing:
+        knowledge = existing
+    else:
+        knowledge = {"requirements": [], "chunks": [], "ui_elements": [], "pages": {}, "documents": {}}
+    documents = knowledge["documents"]
+    report = {"added": [], "updated": [], "unchanged": [], "deleted": []}
+    changed_pages = {}
+    changed_docs = {}
 
-    for file in files:
-        content = await file.read()  # Read only once!
+    upload_dir = uploads_dir(project_id)
+    page_dir = pages_dir(project_id)
 
-        # Save file as uploaded
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(content)
+    received = 0
+    staged = {}  # filename -> temp upload path, moved into place once the whole request succeeded
 
-        # If HTML file, save separately for Selenium
-        if file.filename.endswith(".html"):
-            html_path = "backend/data/checkout.html"
-            with open(html_path, "wb") as f:
-                f.write(content)
-            html_content = content.decode("utf-8")  # Convert bytes to string
+    try:
+        for file in files:
+            # Uploads never escape the project directory
+            filename = os.path.basename(file.filename)
+            kind = "html" if filename.endswith(".html") else "doc"
 
-        else:
-            text = load_text_from_file(file_path)
-            if text:
-                docs_text.append(text)
+            remaining = MAX_UPLOAD_REQUEST_BYTES - received
+            try:
+                tmp_path, digest, size = await save_upload(file, upload_dir, min(MAX_UPLOAD_FILE_BYTES, remaining))
+            except UploadTooLarge:
+                if remaining < MAX_UPLOAD_FILE_BYTES:
+                    raise UploadTooLarge(f"Upload exceeds the limit of {MAX_UPLOAD_REQUEST_BYTES} bytes per request.")
+                raise UploadTooLarge(f"{filename} exceeds the limit of {MAX_UPLOAD_FILE_BYTES} bytes per file.")
+            received += size
+            metrics.INGEST_BYTES.inc(size)
 
-    # Ensure HTML content exists
-    if not html_content:
-        raise ValueError("⚠ Checkout HTML file is required but missing!")
+            previous = documents.get(filename)
+            if previous and previous["sha256"] == digest:
+                await asyncio.to_thread(os.remove, tmp_path)
+                report["unchanged"].append(filename)
+                continue
+            report["updated" if previous else "added"].append(filename)
 
-    # Parse UI elements
-    ui_elements = parse_html_structure(html_content)
+            # The same name uploaded twice: the last copy wins
+            if filename in staged:
+                await asyncio.to_thread(os.remove, staged[filename])
+            staged[filename] = tmp_path
 
-    # Build structured knowledge base
-    knowledge = {
-        "requirements": docs_text,
-        "ui_elements": ui_elements
-    }
+            # HTML files are also kept separately for Selenium, and parsed below
+            if kind == "html":
+                changed_pages[filename] = tmp_path
+            else:
+                changed_docs[filename] = (tmp_path, digest)
+
+            documents[filename] = {"sha256": digest, "kind": kind, "size": size}
+
+        if changed_docs:
+            with metrics.EXTRACT_DURATION.time():
+                extracted = await extract_documents(changed_docs)
+            knowledge["chunks"] = [c for c in knowledge["chunks"] if c["source"] not in extracted]
+            for name, pages in extracted.items():
+                knowledge["chunks"].extend(chunk_pages(pages, name))
+
+        if changed_pages:
+            parsed = await parse_pages(changed_pages)
+            knowledge["ui_elements"] = [
+                elem for elem in knowledge["ui_elements"] if elem.get("page") not in parsed
+            ]
+            for name, ui_elements in parsed.items():
+                knowledge["ui_elements"].extend(ui_elements)
+                knowledge["pages"][name] = {"path": os.path.join(page_dir, name), "elements": len(ui_elements)}
+
+        if prune:
+            uploaded = {os.path.basename(file.filename) for file in files}
+            report["deleted"].extend(delete_documents(knowledge, [n for n in documents if n not in uploaded]))
+
+        # Ensure HTML content exists
+        if not any(doc["kind"] == "html" for doc in documents.values()):
+            raise ValueError("⚠ At least one HTML page is required but missing!")
+
+        await asyncio.to_thread(_commit_uploads, staged, list(changed_pages), upload_dir, page_dir)
+    except BaseException:
+        await asyncio.to_thread(_remove_files, staged.values())
+        raise
 
+    _rebuild_requirements(knowledge)
+    knowledge["last_ingest"] = report
+    for outcome in ("added", "updated", "unchanged", "deleted"):
+        if report[outcome]:
+            metrics.INGEST_FILES.inc(len(report[outcome]), outcome=outcome)
+    metrics.INGEST_DURATION.observe(time.perf_counter() - started)
     return knowledge
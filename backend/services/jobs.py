@@ -0,0 +1,436 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.services.knowledge_base import load_knowledge
+from backend.services.storage import (
+    DATA_DIR, DEFAULT_PROJECT, atomic_write, project_lock, read_json, reports_dir, scripts_file, test_cases_file,
+    write_json,
+)
+from backend.utils import metrics
+from backend.utils.log import log_event, request_id
+
+# Job queue shared by the API and worker processes (SQLite WAL, one row per job)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs", "jobs.sqlite3"))
+# Worker tasks started inside the API process; 0 leaves all jobs to `python -m backend.worker`
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# Jobs each worker runs at once (handlers are async: LLM calls and script jobs overlap)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+# Running jobs whose worker stopped heartbeating for this long are picked up again
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+# Repository root, put on the PYTHONPATH of test run subprocesses
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Persistent queue
+# ───────────────────────────────────────────────
+class JobStore:
+    """
+    SQLite-backed job queue. Like ResponseCache, every call opens its own
+    connection, so the API and any number of worker processes can share it.
+
+    Status flow: queued -> running -> succeeded | failed | cancelled.
+    A running job that stops heartbeating is requeued (up to JOB_MAX_ATTEMPTS).
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, stale_after: float = JOB_STALE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " progress REAL NOT NULL DEFAULT 0, message TEXT,"
+            " payload TEXT NOT NULL, result TEXT, error TEXT,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT, created_at REAL NOT NULL, started_at REAL,"
+            " heartbeat_at REAL, finished_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row, with_result: bool) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["has_result"] = job["result"] is not None
+        result = job.pop("result")
+        if with_result:
+            job["result"] = json.loads(result) if result is not None else None
+        return job
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        # Logs of the job carry the ID of the request that queued it
+        if request_id.get():
+            payload = dict(payload, request_id=request_id.get())
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time()),
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._to_dict(row, with_result) if row else None
+        finally:
+            conn.close()
+
+    def list(self, status: str = None, limit: int = 50, project_id: str = None) -> List[Dict[str, Any]]:
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if project_id:
+            conditions.append("COALESCE(json_extract(payload, '$.project_id'), ?) = ?")
+            params.extend([DEFAULT_PROJECT, project_id])
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM jobs {where}ORDER BY created_at DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+            return [self._to_dict(row, with_result=False) for row in rows]
+        finally:
+            conn.close()
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Atomically move the oldest queued job to running for `worker`.
+        Stale running jobs are requeued (or failed) first.
+        """
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding.', finished_at = ?"
+                " WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (now, now - self.stale_after, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL"
+                " WHERE status = 'running' AND heartbeat_at < ?",
+                (now - self.stale_after,),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,"
+                    " started_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (worker, now, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(row["id"]) if row is not None else None
+
+    def heartbeat(self, job_id: str, progress: float, message: Optional[str]) -> bool:
+        """
+        Record progress for a running job; returns True once cancellation was requested.
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, progress = ?, message = ? WHERE id = ? AND status = 'running'",
+                (time.time(), progress, message, job_id),
+            )
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return bool(row and row["cancel_requested"])
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: str = None,
+                message: str = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, message = COALESCE(?, message),"
+                " progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END, finished_at = ?"
+                " WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, message,
+                 status, time.time(), job_id),
+            )
+        finally:
+            conn.close()
+
+    def succeed(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._finish(job_id, "succeeded", result=result, message="Done")
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def mark_cancelled(self, job_id: str) -> None:
+        self._finish(job_id, "cancelled", message="Cancelled")
+
+    def release(self, job_id: str) -> None:
+        """
+        Put a running job back in the queue (its worker is shutting down).
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'", (job_id,)
+            )
+        finally:
+            conn.close()
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Queued jobs are cancelled at once; running jobs are flagged and
+        cancelled by their worker on its next heartbeat.
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', message = 'Cancelled', finished_at = ?"
+                " WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+
+# Shared queue for the backend
+job_store = JobStore()
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Handlers
+# ───────────────────────────────────────────────
+class JobContext:
+    """
+    Handed to a job handler to report progress; the worker persists it
+    with every heartbeat.
+    """
+
+    def __init__(self, job: Dict[str, Any]):
+        self.job_id = job["id"]
+        self.fraction = job.get("progress") or 0.0
+        self.message = job.get("message")
+
+    def progress(self, fraction: float, message: str = None) -> None:
+        self.fraction = max(0.0, min(1.0, fraction))
+        self.message = message
+
+
+JobHandler = Callable[[Dict[str, Any], JobContext], Awaitable[Dict[str, Any]]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    def register(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+@job_handler("generate_test_cases")
+async def generate_test_cases_job(payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from backend.services.test_case_generator import agenerate_test_cases
+
+    project_id = payload.get("project_id", DEFAULT_PROJECT)
+    knowledge = await asyncio.to_thread(load_knowledge, project_id)
+    ctx.progress(0.0, "Generating test cases")
+
+    def on_shard(done: int, total: int) -> None:
+        ctx.progress(done / total, f"{done}/{total} shards generated")
+
+    test_cases = await agenerate_test_cases(knowledge, force=payload.get("force_regenerate", False),
+                                            progress=on_shard, dedup=payload.get("dedup"))
+    async with project_lock(project_id):
+        await asyncio.to_thread(write_json, test_cases_file(project_id), test_cases)
+    return {
+        "status": "success",
+        "total_test_cases": len(test_cases.get("test_cases", [])),
+        "test_cases": test_cases,
+    }
+
+
+@job_handler("generate_scripts")
+async def generate_scripts_job(payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from backend.services.knowledge_base import knowledge_pages
+    from backend.services.script_generator import (
+        HELPERS_MODULE, case_page, generate_scripts, helpers_code, selected_test_cases,
+    )
+    from backend.services.selector_index import load_selector_index
+
+    project_id = payload.get("project_id", DEFAULT_PROJECT)
+    knowledge = await asyncio.to_thread(load_knowledge, project_id)
+    test_cases = await asyncio.to_thread(read_json, test_cases_file(project_id))
+
+    ctx.progress(0.2, "Building selector index")
+    pages = knowledge_pages(knowledge)
+    used_pages = {case_page(tc, pages) for tc in selected_test_cases(test_cases, payload["selected_test_ids"])}
+    index = await asyncio.to_thread(load_selector_index, knowledge, project_id, used_pages)
+    ctx.progress(0.5, "Generating scripts")
+    ambiguous = []
+    with metrics.SCRIPT_GENERATION_DURATION.time(mode=payload.get("mode", "basic")):
+        scripts = await asyncio.to_thread(
+            generate_scripts, test_cases, knowledge, payload["selected_test_ids"], index, ambiguous,
+            payload.get("mode", "basic"), payload.get("default_timeout", 10), payload.get("timeouts"),
+        )
+    script_path = scripts_file(project_id)
+
+    result = {
+        "status": "success",
+        "message": "Scripts generated successfully",
+        "generated_file": script_path,
+        "code": scripts,
+        "ambiguous_selectors": ambiguous,
+    }
+
+    async with project_lock(project_id):
+        await asyncio.to_thread(atomic_write, script_path, scripts)
+        # Explicit-wait scripts import a shared helpers module saved next to them
+        if payload.get("mode") == "explicit":
+            helpers_path = os.path.join(os.path.dirname(script_path), f"{HELPERS_MODULE}.py")
+            result["helpers_file"] = helpers_path
+            result["helpers_code"] = helpers_code()
+            await asyncio.to_thread(atomic_write, helpers_path, result["helpers_code"])
+    return result
+
+
+@job_handler("run_tests")
+async def run_tests_job(payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """
+    Run the project's generated suite in a child process
+    (`python -m backend.services.test_runner`), which also writes the reports:
+    the LLM-generated code and the helper modules it imports stay out of this
+    process, and concurrent runs do not share sys.path or sys.modules.
+    """
+    project_id = payload.get("project_id", DEFAULT_PROJECT)
+    ctx.progress(0.1, "Running tests")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.getenv("PYTHONPATH")])))
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "backend.services.test_runner", scripts_file(project_id),
+        "--workers", str(payload.get("workers", 1)), "--driver", payload.get("driver", "chrome"),
+        "--reports-dir", reports_dir(project_id),
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        details = stderr.decode("utf-8", "replace").strip().splitlines()[-5:]
+        raise RuntimeError(f"Test run exited with code {process.returncode}: " + "\n".join(details))
+
+    report = json.loads(stdout)
+    return {"status": "success", **report}
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Workers
+# ───────────────────────────────────────────────
+def worker_name(suffix: Any = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{suffix}"
+
+
+async def run_job(store: JobStore, job: Dict[str, Any], poll: float = JOB_POLL_SECONDS) -> None:
+    """
+    Run one claimed job, heartbeating its progress every `poll` seconds and
+    cancelling the handler as soon as cancellation is requested. If the worker
+    itself is cancelled (shutdown), the job goes back to the queue.
+    """
+    handler = JOB_HANDLERS.get(job["kind"])
+    if handler is None:
+        await asyncio.to_thread(store.fail, job["id"], f"Unknown job kind: {job['kind']}")
+        return
+
+    ctx = JobContext(job)
+    request_id.set(job["payload"].get("request_id"))
+    started = time.perf_counter()
+    task = asyncio.create_task(handler(job["payload"], ctx))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                break
+            if await asyncio.to_thread(store.heartbeat, job["id"], ctx.fraction, ctx.message):
+                task.cancel()
+    except asyncio.CancelledError:
+        task.cancel()
+        await asyncio.to_thread(store.release, job["id"])
+        raise
+
+    if task.cancelled():
+        status = "cancelled"
+        await asyncio.to_thread(store.mark_cancelled, job["id"])
+    elif task.exception() is not None:
+        status = "failed"
+        await asyncio.to_thread(store.fail, job["id"], f"{type(task.exception()).__name__}: {task.exception()}")
+    else:
+        status = "succeeded"
+        await asyncio.to_thread(store.succeed, job["id"], task.result())
+
+    duration = time.perf_counter() - started
+    metrics.JOB_DURATION.observe(duration, kind=job["kind"], status=status)
+    log_event("job", job_id=job["id"], kind=job["kind"], status=status, duration_ms=round(duration * 1000, 1),
+              project_id=job["payload"].get("project_id", DEFAULT_PROJECT))
+
+
+async def worker_loop(store: JobStore, name: str, stop: asyncio.Event, poll: float = JOB_POLL_SECONDS,
+                      concurrency: int = JOB_CONCURRENCY) -> None:
+    """
+    Claim jobs and run up to `concurrency` of them at once until `stop` is
+    set, then wait for the running ones. If the loop is cancelled, its
+    running jobs are cancelled too (and go back to the queue).
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    running = set()
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+            job = None if stop.is_set() else await asyncio.to_thread(store.claim, name)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=poll)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(run_job(store, job, poll))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+        await asyncio.gather(*running, return_exceptions=True)
+    except asyncio.CancelledError:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        raise
@@ -1,36 +1,206 @@
-import json
+import math
 import os
-from typing import Dict, Any
+import re
+from collections import Counter
+from typing import Dict, Any, List, Tuple
 
-KNOWLEDGE_FILE = "backend/data/knowledge.json"
+from backend.services.knowledge_db import load_knowledge_db, save_knowledge_db
+from backend.services.storage import (
+    DATA_DIR, DEFAULT_PROJECT, KNOWLEDGE_BACKEND, knowledge_cache, knowledge_file, read_json, write_json,
+)
 
 
-def save_knowledge(knowledge: Dict[str, Any]) -> None:
+def save_knowledge(knowledge: Dict[str, Any], project_id: str = DEFAULT_PROJECT) -> None:
     """
-    Save structured knowledge base to knowledge.json.
+    Save structured knowledge base to the project's knowledge file (atomically),
+    as JSON or SQLite depending on KNOWLEDGE_BACKEND.
     """
-    os.makedirs(os.path.dirname(KNOWLEDGE_FILE), exist_ok=True)
-    with open(KNOWLEDGE_FILE, "w") as f:
-        json.dump(knowledge, f, indent=2)
+    path = knowledge_file(project_id)
+    if KNOWLEDGE_BACKEND == "sqlite":
+        save_knowledge_db(path, knowledge)
+    else:
+        write_json(path, knowledge)
+    knowledge_cache.put(path, knowledge)
 
 
-def load_knowledge() -> Dict[str, Any]:
+def load_knowledge(project_id: str = DEFAULT_PROJECT, cached: bool = True) -> Dict[str, Any]:
     """
-    Load knowledge base from knowledge.json.
+    Load knowledge base from the project's knowledge file. With the SQLite
+    backend sections are read lazily on first access, and an existing
+    knowledge.json is migrated on first load.
+
+    Cached knowledge bases are shared between requests and must be treated as
+    read-only; pass `cached=False` for a private copy to modify and save.
     """
-    if not os.path.exists(KNOWLEDGE_FILE):
+    path = knowledge_file(project_id)
+    if KNOWLEDGE_BACKEND == "sqlite" and not os.path.exists(path):
+        migrate_knowledge(project_id)
+    if not os.path.exists(path):
         raise FileNotFoundError(
             "Knowledge base not found. Please run ingestion first."
         )
-    with open(KNOWLEDGE_FILE, "r") as f:
-        return json.load(f)
+    loader = load_knowledge_db if KNOWLEDGE_BACKEND == "sqlite" else read_json
+    return knowledge_cache.load(path, loader) if cached else loader(path)
+
+
+def knowledge_exists(project_id: str = DEFAULT_PROJECT) -> bool:
+    """
+    Whether load_knowledge will find a knowledge base (including one still to migrate).
+    """
+    if os.path.exists(knowledge_file(project_id)):
+        return True
+    return KNOWLEDGE_BACKEND == "sqlite" and os.path.exists(knowledge_file(project_id, "json"))
+
+
+def migrate_knowledge(project_id: str = DEFAULT_PROJECT) -> Dict[str, Any]:
+    """
+    Convert the project's knowledge.json to knowledge.sqlite3 (the JSON file is kept).
+    """
+    source = knowledge_file(project_id, "json")
+    target = knowledge_file(project_id, "sqlite")
+    if not os.path.exists(source):
+        return {"project_id": project_id, "migrated": False, "reason": "no knowledge.json"}
+    knowledge = read_json(source)
+    save_knowledge_db(target, knowledge)
+    return {
+        "project_id": project_id,
+        "migrated": True,
+        "target": target,
+        "ui_elements": len(knowledge.get("ui_elements", [])),
+        "chunks": len(knowledge.get("chunks", [])),
+    }
+
+
+_TOKEN_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "be", "by", "for", "in", "is", "it", "must", "of",
+    "on", "or", "should", "the", "to", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens; camelCase identifiers (e.g. "cardNumber") are split.
+    """
+    tokens = (token.lower() for token in _TOKEN_RE.findall(text or ""))
+    return [token for token in tokens if token not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 index over knowledge base chunks (no network, no external deps).
+    """
+
+    def __init__(self, chunks: List[Dict[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk["text"])) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if chunks else 0.0
+
+        doc_freq = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, int]]:
+        """
+        Return up to k (score, chunk_index) pairs with a positive score, best first.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        if not terms:
+            return []
+
+        scores = []
+        for idx, tf in enumerate(self.term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[idx] / (self.avg_length or 1))
+            score = sum(
+                self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+                for term in terms if term in tf
+            )
+            if score > 0:
+                scores.append((score, idx))
+
+        scores.sort(key=lambda pair: (-pair[0], pair[1]))
+        return scores[:k]
+
+
+def knowledge_chunks(knowledge: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Requirement chunks of a knowledge base. Knowledge bases ingested before
+    chunking existed are chunked on the fly from their raw requirement texts.
+    """
+    if "chunks" in knowledge:
+        return knowledge["chunks"]
+
+    from backend.services.ingestion import chunk_text
+
+    chunks = []
+    for i, text in enumerate(knowledge.get("requirements", [])):
+        chunks.extend(chunk_text(text, f"doc{i + 1}"))
+    return chunks
+
+
+def build_index(knowledge: Dict[str, Any]) -> LexicalIndex:
+    return LexicalIndex(knowledge_chunks(knowledge))
+
+
+# Where knowledge bases from before multi-page support kept their single page
+LEGACY_PAGE = "checkout.html"
+LEGACY_PAGE_PATH = os.path.join(DATA_DIR, LEGACY_PAGE)
+
+
+def knowledge_pages(knowledge: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Page name -> page info ({"path", "elements"}).
+    """
+    if "pages" in knowledge:
+        return knowledge["pages"]
+    return {LEGACY_PAGE: {"path": LEGACY_PAGE_PATH, "elements": len(knowledge.get("ui_elements", []))}}
+
+
+def elements_by_page(knowledge: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Per-page element index: page name -> its ui_elements, in document order.
+    """
+    index = {page: [] for page in knowledge_pages(knowledge)}
+    for elem in knowledge.get("ui_elements", []):
+        index.setdefault(elem.get("page", LEGACY_PAGE), []).append(elem)
+    return index
+
+
+def page_elements(knowledge: Dict[str, Any], page: str) -> List[Dict[str, Any]]:
+    """
+    UI elements of one page. Lazily loaded (SQLite) knowledge bases read only that page.
+    """
+    return pages_elements(knowledge, [page])[page]
+
+
+def pages_elements(knowledge: Dict[str, Any], pages) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Page name -> its UI elements, for `pages` only. Lazily loaded (SQLite)
+    knowledge bases read only those pages.
+    """
+    if hasattr(knowledge, "page_elements") and "pages" in knowledge:
+        return {page: knowledge.page_elements(page) for page in pages}
+    by_page = elements_by_page(knowledge)
+    return {page: by_page.get(page, []) for page in pages}
 
 
 def knowledge_summary(knowledge: Dict[str, Any]) -> Dict[str, int]:
     """
     Provides summary counts of knowledge base components.
     """
-    return {
+    summary = {
         "total_requirements": len(knowledge.get("requirements", [])),
+        "total_chunks": len(knowledge_chunks(knowledge)),
         "total_ui_elements": len(knowledge.get("ui_elements", [])),
+        "total_pages": len(knowledge_pages(knowledge)),
     }
+    # Outcome of the most recent incremental ingest, if any
+    for status, names in knowledge.get("last_ingest", {}).items():
+        summary[status] = len(names)
+    return summary
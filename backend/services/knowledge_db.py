@@ -0,0 +1,168 @@
+"""
+SQLite knowledge base backend (KNOWLEDGE_BACKEND=sqlite).
+
+Chunks and UI elements are stored one row each, every other top-level key
+(requirements, documents, pages, last_ingest, ...) as a JSON value in `meta`.
+LazyKnowledge only reads a section when it is first accessed, so e.g.
+script generation never parses the requirement chunks.
+
+    python -m backend.services.knowledge_db migrate --project default
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List
+
+# Sections stored as rows; everything else lives in meta
+ROW_SECTIONS = ("chunks", "ui_elements")
+
+
+class LazyKnowledge(MutableMapping):
+    """
+    Dict-like view of a knowledge.sqlite3 file that loads sections on demand.
+
+    Each load opens its own short-lived read-only connection, so cached
+    instances hold no file handles (and never block the os.replace of
+    save_knowledge_db). Sections are only read from the file this instance
+    was created for: a load after the knowledge base was saved (replaced)
+    raises RuntimeError. Assigned sections are kept in memory; save them
+    with save_knowledge_db.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._uri = f"file:{os.path.abspath(path)}?mode=ro"
+        self._lock = threading.Lock()
+        self._sections: Dict[str, Any] = {}
+        self._signature = None
+        self._keys: List[str] = [row[0] for row in self._query("SELECT key FROM meta ORDER BY position")]
+
+    @staticmethod
+    def _file_signature(path: str) -> tuple:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        conn = sqlite3.connect(self._uri, uri=True)
+        try:
+            # Checked once the file is open: a replaced file has a new inode / mtime
+            signature = self._file_signature(self.path)
+            if self._signature is None:
+                self._signature = signature
+            elif signature != self._signature:
+                raise RuntimeError(f"{self.path} was replaced after it was opened; load the knowledge base again.")
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _load(self, key: str) -> Any:
+        if key == "chunks":
+            rows = self._query("SELECT id, source, text FROM chunks ORDER BY seq")
+            return [{"id": chunk_id, "source": source, "text": text} for chunk_id, source, text in rows]
+        if key == "ui_elements":
+            return self._decode(self._query("SELECT data FROM ui_elements ORDER BY seq"))
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return json.loads(rows[0][0])
+
+    @staticmethod
+    def _decode(rows) -> List[Dict[str, Any]]:
+        # One json.loads over the joined rows is much faster than one per row
+        return json.loads("[" + ",".join(data for (data,) in rows) + "]")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._sections:
+            if key not in self._keys:
+                raise KeyError(key)
+            with self._lock:
+                if key not in self._sections:
+                    self._sections[key] = self._load(key)
+        return self._sections[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._sections[key] = value
+        if key not in self._keys:
+            self._keys.append(key)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._sections.pop(key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def page_elements(self, page: str) -> List[Dict[str, Any]]:
+        """
+        UI elements of one page, without loading the others.
+        """
+        if "ui_elements" in self._sections:
+            return [elem for elem in self._sections["ui_elements"] if elem.get("page") == page]
+        return self._decode(self._query("SELECT data FROM ui_elements WHERE page = ? ORDER BY seq", (page,)))
+
+
+def save_knowledge_db(path: str, knowledge: Dict[str, Any]) -> None:
+    """
+    Write the knowledge base to a new SQLite file and rename it over `path`
+    (atomic, like storage.atomic_write).
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".sqlite3")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(
+                "CREATE TABLE meta (key TEXT PRIMARY KEY, position INTEGER NOT NULL, value TEXT);"
+                "CREATE TABLE chunks (seq INTEGER PRIMARY KEY, id TEXT, source TEXT, text TEXT);"
+                "CREATE TABLE ui_elements (seq INTEGER PRIMARY KEY, page TEXT, data TEXT NOT NULL);"
+            )
+            for position, key in enumerate(knowledge):
+                value = None if key in ROW_SECTIONS else json.dumps(knowledge[key], separators=(",", ":"))
+                conn.execute("INSERT INTO meta VALUES (?, ?, ?)", (key, position, value))
+            conn.executemany(
+                "INSERT INTO chunks (id, source, text) VALUES (?, ?, ?)",
+                ((chunk.get("id"), chunk.get("source"), chunk.get("text")) for chunk in knowledge.get("chunks", [])),
+            )
+            conn.executemany(
+                "INSERT INTO ui_elements (page, data) VALUES (?, ?)",
+                ((elem.get("page"), json.dumps(elem, separators=(",", ":"))) for elem in knowledge.get("ui_elements", [])),
+            )
+            conn.execute("CREATE INDEX ui_elements_page ON ui_elements (page, seq)")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_knowledge_db(path: str) -> LazyKnowledge:
+    return LazyKnowledge(path)
+
+
+def main() -> None:
+    from backend.services.knowledge_base import migrate_knowledge
+
+    parser = argparse.ArgumentParser(description="Knowledge base storage tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="convert a project's knowledge.json to knowledge.sqlite3")
+    migrate.add_argument("--project", default="default")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(migrate_knowledge(args.project))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,471 @@
-def generate_scripts(test_cases: dict, knowledge: dict, selected_test_ids: list[str]) -> str:
-    import os  # Needed for path resolution
-
-    ui_elements = knowledge.get("ui_elements", [])
-    all_cases = test_cases.get("test_cases", [])
-    selected_cases = [tc for tc in all_cases if tc.get("test_id") in selected_test_ids]
-
-    input_mapping = {
-        "emailInput": "test@example.com",
-        "nameInput": "John Doe",
-        "cardNumber": "1234567890123456",
-        "expiryDate": "2025-12",
-        "cvvInput": "123",
-    }
-
-    script = """import unittest
+import os
+import re
+from contextlib import contextmanager
+
+from backend.services.knowledge_base import knowledge_pages, page_elements
+from backend.services.selector_index import add_pages, build_selector_index, resolve_selector
+
+# "basic": bare find_element calls; "explicit": WebDriverWait-based helpers module;
+# "page_object": one page class per HTML page with cached locators, browser shared per test class
+SCRIPT_MODES = ("basic", "explicit", "page_object")
+NO_PAGES_ERROR = "⚠ At least one HTML page is required but missing!"
+DEFAULT_STEP_TIMEOUT = 10
+
+# Source of the helpers module emitted next to scripts generated in "explicit" mode
+HELPERS_SOURCE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "utils", "selenium_helpers.py")
+HELPERS_MODULE = "selenium_helpers"
+
+CLICKABLE_TAGS = {"button", "a"}
+CLICKABLE_INPUT_TYPES = {"button", "submit", "reset", "checkbox", "radio"}
+
+INPUT_DATA = {
+    "emailInput": "test@example.com",
+    "nameInput": "John Doe",
+    "cardNumber": "1234567890123456",
+    "expiryDate": "2025-12",
+    "cvvInput": "123",
+}
+
+# Preconditions that need a browser of their own; other tests of a page share one (page_object mode)
+ISOLATED_PRECONDITION_RE = re.compile(
+    r"\b(fresh|new (browser|session|window)|first (visit|time)|incognito|"
+    r"(clean|clear(ed)?|empty) (browser|cache|storage|local ?storage|session))\b",
+    re.IGNORECASE,
+)
+
+
+def _is_clickable(element: str, ui: dict) -> bool:
+    if ui.get("tag") in CLICKABLE_TAGS or (ui.get("tag") == "input" and ui.get("type") in CLICKABLE_INPUT_TYPES):
+        return True
+    return "button" in element.lower() or "payNow" in element
+
+
+def helpers_code() -> str:
+    """
+    Source of the helpers module that "explicit" mode scripts import.
+    """
+    with open(HELPERS_SOURCE, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Code writer
+# ───────────────────────────────────────────────
+class CodeWriter:
+    """
+    Collects generated source line by line and joins it once in `render`,
+    instead of concatenating a growing string per statement.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._level = 0
+
+    def line(self, text: str = "") -> None:
+        if "\n" in text or "\r" in text:
+            raise ValueError(f"CodeWriter.line() takes a single line, got {text!r}")
+        self._lines.append("    " * self._level + text if text else "")
+
+    def lines(self, text: str) -> None:
+        for line in text.split("\n"):
+            self.line(line)
+
+    @contextmanager
+    def block(self, header: str = None):
+        if header:
+            self.line(header)
+        self._level += 1
+        try:
+            yield
+        finally:
+            self._level -= 1
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def comment(text: str) -> str:
+    """
+    `text` as a one-line "# ..." comment (whitespace, line breaks included, collapsed).
+    """
+    return "# " + " ".join(str(text).split())
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Selector resolution
+# ───────────────────────────────────────────────
+def _resolve_steps(tc: dict, page: str, index: dict, knowledge: dict, elements: dict, report: list = None) -> list:
+    """
+    One step per used element: {"element", "warning"} when it cannot be
+    resolved, else {"element", "by", "value", "clickable", "data"} plus a
+    "warning" when the reference is ambiguous (also listed in `report`).
+    `elements` caches page -> ui_elements across test cases.
+    """
+    steps = []
+    for element in tc.get("used_elements", []):
+        resolved = resolve_selector(index, page, element)
+        if not resolved:
+            steps.append({"element": element, "warning": f"⚠ Could not resolve element: {element}"})
+            continue
+
+        step = {"element": element, "by": resolved["by"], "value": resolved["value"]}
+        if resolved["matches"] > 1:
+            step["warning"] = (f"⚠ Ambiguous element: {element} matches {resolved['matches']} "
+                               f"elements by {resolved['matched_by']}, using the first")
+            if report is not None:
+                report.append({
+                    "test_id": tc.get("test_id"),
+                    "page": page,
+                    "element": element,
+                    "matched_by": resolved["matched_by"],
+                    "matches": resolved["matches"],
+                })
+
+        if page not in elements:
+            elements[page] = page_elements(knowledge, page)
+        ui = elements[page][resolved["position"]]
+        step["clickable"] = _is_clickable(element, ui)
+        step["data"] = INPUT_DATA.get(element, "test_data")
+        steps.append(step)
+    return steps
+
+
+def _step_timeout(tc: dict, timeouts: dict, default_timeout: float) -> float:
+    timeout = timeouts.get(tc.get("test_id"), tc.get("timeout"))
+    return default_timeout if timeout is None else timeout
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Inline modes (basic / explicit)
+# ───────────────────────────────────────────────
+INLINE_HEADER = """import unittest
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-import time
+from selenium.webdriver.support.ui import WebDriverWait
 import os
+{helpers_import}
+PAGES = {pages!r}
 
 class TestCheckout(unittest.TestCase):
+    # Set by backend.services.test_runner to reuse a pooled browser session
+    driver = None
+
     def setUp(self):
-        options = webdriver.ChromeOptions()
-        # options.add_argument("--headless")
-        self.driver = webdriver.Chrome(options=options)
-        html_path = os.path.abspath("backend/data/checkout.html")
-        self.driver.get(f"file:///{html_path}")
+        self._owns_driver = self.driver is None
+        if self._owns_driver:
+            options = webdriver.ChromeOptions()
+            # options.add_argument("--headless")
+            self.driver = webdriver.Chrome(options=options)
+
+    def open_page(self, page):
+        html_path = os.path.abspath(PAGES[page])
+        self.driver.get(f"file:///{{html_path}}")
+
+    def wait_for_page(self, timeout=10):
+        WebDriverWait(self.driver, timeout).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
 
     def tearDown(self):
-        self.driver.quit()
+        if self._owns_driver:
+            self.driver.quit()
 """
 
-    def resolve_selector(element):
-        for ui in ui_elements:
-            if element == ui.get("id"):
-                return "By.ID", ui.get("id")
-            if element == ui.get("name"):
-                return "By.NAME", ui.get("name")
-            if element == ui.get("text"):
-                return "By.XPATH", f"//*[text()='{ui.get('text')}']"
-        return None, None
-
-    for tc in selected_cases:
-        method_name = f"test_{tc.get('test_id').lower()}"
-        script += f"    def {method_name}(self):\n"
-        script += f"        print('Executing {tc.get('title')}')\n"
-        script += "        driver = self.driver\n\n"
-
-        for element in tc.get("used_elements", []):
-            selector, value = resolve_selector(element)
-            if not selector:
-                script += f"        # ⚠ Could not resolve element: {element}\n"
-                continue
+MAIN_FOOTER = """
+if __name__ == '__main__':
+    unittest.main()"""
 
-            if "button" in element.lower() or "payNow" in element:
-                script += f"        driver.find_element({selector}, '{value}').click()\n"
+
+def _write_inline_test(w: CodeWriter, tc: dict, page: str, steps: list, explicit: bool, timeout: float) -> None:
+    with w.block(f"def test_{tc.get('test_id').lower()}(self):"):
+        w.line(f"print({'Executing ' + str(tc.get('title'))!r})")
+        if explicit:
+            w.line(f"timeout = {timeout!r}")
+            w.line(f"qa.open_page(self.driver, PAGES[{page!r}], timeout)")
+        else:
+            w.line(f"self.open_page({page!r})")
+        w.line("driver = self.driver")
+        w.line()
+
+        for step in steps:
+            if step.get("warning"):
+                w.line(comment(step["warning"]))
+            if "by" not in step:
+                continue
+            selector, value = step["by"], step["value"]
+            if explicit and step["clickable"]:
+                w.line(f"qa.click(driver, {selector}, {value!r}, timeout)")
+            elif explicit:
+                w.line(f"qa.fill(driver, {selector}, {value!r}, {step['data']!r}, timeout)")
+            elif step["clickable"]:
+                w.line(f"driver.find_element({selector}, {value!r}).click()")
             else:
-                test_data = input_mapping.get(element, "test_data")
-                script += f"        driver.find_element({selector}, '{value}').send_keys('{test_data}')\n"
+                w.line(f"driver.find_element({selector}, {value!r}).send_keys({step['data']!r})")
 
-        script += "\n        time.sleep(2)\n"
-        script += "        # Example assertion:\n"
-        script += "        # self.assertIn('Payment Successful', driver.page_source)\n\n"
+        w.line()
+        w.line("qa.wait_for_page(driver, timeout)" if explicit else "self.wait_for_page()")
+        w.line("# Example assertion:")
+        w.line("# self.assertIn('Payment Successful', driver.page_source)")
+        w.line()
 
-    script += """
-if __name__ == '__main__':
-    unittest.main()
+
+# ───────────────────────────────────────────────
+# 4️⃣ Page-object mode
+# ───────────────────────────────────────────────
+PAGE_OBJECT_HEADER = """import os
+import unittest
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+PAGES = {pages!r}
+
+
+def new_driver():
+    options = webdriver.ChromeOptions()
+    # options.add_argument("--headless")
+    return webdriver.Chrome(options=options)
+
+
+class BasePage:
+    # (By, value) of every element the suite uses on the page
+    PATH = None
+    LOCATORS = {{}}
+
+    def __init__(self, driver, timeout=10):
+        self.driver = driver
+        self.timeout = timeout
+        self._elements = {{}}  # name -> element found since the page was last opened
+
+    def open(self):
+        self.driver.get(f"file:///{{os.path.abspath(self.PATH)}}")
+        self.wait_until_loaded()
+        self._elements.clear()
+        return self
+
+    def wait_until_loaded(self):
+        WebDriverWait(self.driver, self.timeout).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+
+    def element(self, name, condition=EC.presence_of_element_located):
+        if name not in self._elements:
+            self._elements[name] = WebDriverWait(self.driver, self.timeout).until(condition(self.LOCATORS[name]))
+        return self._elements[name]
+
+    def _act(self, name, condition, action):
+        try:
+            return action(self.element(name, condition))
+        except StaleElementReferenceException:
+            # The page changed under a cached element: look it up again once
+            self._elements.pop(name, None)
+            return action(self.element(name, condition))
+
+    def click(self, name):
+        self._act(name, EC.element_to_be_clickable, lambda element: element.click())
+
+    def fill(self, name, text):
+        def fill(element):
+            element.clear()
+            element.send_keys(text)
+        self._act(name, EC.visibility_of_element_located, fill)
 """
-    return script
+
+SHARED_TEST_CLASS = '''class {name}(unittest.TestCase):
+    """
+    Tests of {page} whose preconditions allow sharing one browser;
+    each test clears cookies and opens the page again.
+    """
+    # Shared by the class; set per test by backend.services.test_runner to reuse a pooled session
+    driver = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls._owns_driver = cls.driver is None
+        if cls._owns_driver:
+            cls.driver = new_driver()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._owns_driver:
+            cls.driver.quit()
+            cls.driver = None
+
+    def setUp(self):
+        self.driver.delete_all_cookies()
+'''
+
+ISOLATED_TEST_CLASS = '''class {name}(unittest.TestCase):
+    """
+    Tests of {page} whose preconditions need a browser of their own.
+    """
+    # Set by backend.services.test_runner to reuse a pooled browser session
+    driver = None
+
+    def setUp(self):
+        self._owns_driver = self.driver is None
+        if self._owns_driver:
+            self.driver = new_driver()
+
+    def tearDown(self):
+        if self._owns_driver:
+            self.driver.quit()
+'''
+
+
+def page_class_name(page: str, taken: set = ()) -> str:
+    """
+    "checkout.html" -> "CheckoutPage"; a suffix is added if the name is in `taken`.
+    """
+    words = re.findall(r"[0-9a-zA-Z]+", os.path.splitext(page)[0])
+    name = "".join(word[:1].upper() + word[1:] for word in words) or "Html"
+    if name[0].isdigit():
+        name = "Page" + name
+    name += "Page"
+    candidate, suffix = name, 2
+    while candidate in taken:
+        candidate, suffix = f"{name}{suffix}", suffix + 1
+    return candidate
+
+
+def needs_own_browser(tc: dict) -> bool:
+    return any(ISOLATED_PRECONDITION_RE.search(str(p)) for p in tc.get("preconditions") or [])
+
+
+def _write_page_object_test(w: CodeWriter, tc: dict, page_class: str, steps: list, timeout: float) -> None:
+    with w.block(f"def test_{tc.get('test_id').lower()}(self):"):
+        w.line(f"print({'Executing ' + str(tc.get('title'))!r})")
+        for precondition in tc.get("preconditions") or []:
+            w.line(comment(f"Precondition: {precondition}"))
+        w.line(f"page = {page_class}(self.driver, {timeout!r}).open()")
+        for step in steps:
+            if step.get("warning"):
+                w.line(comment(step["warning"]))
+            if "by" not in step:
+                continue
+            if step["clickable"]:
+                w.line(f"page.click({step['element']!r})")
+            else:
+                w.line(f"page.fill({step['element']!r}, {step['data']!r})")
+        w.line("page.wait_until_loaded()")
+        w.line("# Example assertion:")
+        w.line("# self.assertIn('Payment Successful', self.driver.page_source)")
+    w.line()
+
+
+def _write_page_objects(w: CodeWriter, cases: list) -> None:
+    """
+    `cases` holds (tc, page, steps, timeout) in selection order: one page
+    class per page used, then per page a test class sharing one browser and
+    one for the tests that need their own.
+    """
+    classes, locators = {}, {}
+    for _, page, steps, _ in cases:
+        classes.setdefault(page, page_class_name(page, set(classes.values())))
+        for step in steps:
+            if "by" in step:
+                locators.setdefault(page, {}).setdefault(step["element"], (step["by"], step["value"]))
+
+    for page, class_name in classes.items():
+        w.line()
+        with w.block(f"class {class_name}(BasePage):"):
+            w.line(f"PATH = PAGES[{page!r}]")
+            with w.block("LOCATORS = {"):
+                for element, (by, value) in locators.get(page, {}).items():
+                    w.line(f"{element!r}: ({by}, {value!r}),")
+            w.line("}")
+        w.line()
+
+    groups = {}  # (page, needs own browser) -> cases
+    for case in cases:
+        groups.setdefault((case[1], needs_own_browser(case[0])), []).append(case)
+
+    for page, class_name in classes.items():
+        for isolated, template, suffix in ((False, SHARED_TEST_CLASS, ""), (True, ISOLATED_TEST_CLASS, "Isolated")):
+            tests = groups.get((page, isolated))
+            if not tests:
+                continue
+            w.line()
+            w.lines(template.format(name=f"Test{class_name}{suffix}", page=page))
+            with w.block():
+                for tc, _, steps, timeout in tests:
+                    _write_page_object_test(w, tc, class_name, steps, timeout)
+
+
+# ───────────────────────────────────────────────
+# 5️⃣ Module
+# ───────────────────────────────────────────────
+def selected_test_cases(test_cases: dict, selected_test_ids: list[str]) -> list[dict]:
+    selected = set(selected_test_ids)
+    return [tc for tc in test_cases.get("test_cases", []) if tc.get("test_id") in selected]
+
+
+def case_page(tc: dict, pages: dict) -> str:
+    """
+    Page a test case runs on: its own "page" if known, else the first page.
+    Raises ValueError when the knowledge base has no pages.
+    """
+    if not pages:
+        raise ValueError(NO_PAGES_ERROR)
+    return tc.get("page") if tc.get("page") in pages else next(iter(pages))
+
+
+def generate_scripts(test_cases: dict, knowledge: dict, selected_test_ids: list[str],
+                     index: dict = None, report: list = None, mode: str = "basic",
+                     default_timeout: float = DEFAULT_STEP_TIMEOUT, timeouts: dict = None) -> str:
+    """
+    Build a Selenium unittest module for the selected test cases.
+
+    `index` is the precomputed selector index (built from `knowledge` if omitted).
+    References that match several elements are listed in `report`, when given,
+    and flagged with a comment in the generated code.
+
+    In "explicit" mode every step waits for its element via the shared
+    selenium_helpers module (see helpers_code) using a per-test timeout:
+    `timeouts[test_id]`, else the test case's own "timeout", else `default_timeout`.
+
+    "page_object" mode emits one page class per HTML page (locators resolved
+    once, found elements cached until the page is reopened, explicit waits
+    with the same per-test timeout) and one test class per page whose tests
+    share a browser opened in setUpClass; tests whose preconditions ask for
+    a fresh browser get a class with a browser per test.
+    """
+    if mode not in SCRIPT_MODES:
+        raise ValueError(f"Unknown script mode '{mode}'. Choose one of: {list(SCRIPT_MODES)}")
+    timeouts = timeouts or {}
+    pages = knowledge_pages(knowledge)
+    if not pages:
+        raise ValueError(NO_PAGES_ERROR)
+    selected_cases = [(tc, case_page(tc, pages)) for tc in selected_test_cases(test_cases, selected_test_ids)]
+    # Only the pages the selected cases use are indexed and read
+    used_pages = [page for _, page in selected_cases]
+    if index is None:
+        index = build_selector_index(knowledge, used_pages)
+    else:
+        add_pages(index, knowledge, used_pages)
+    elements = {}  # page -> its ui_elements, loaded only for pages the selected cases use
+
+    cases = []
+    for tc, page in selected_cases:
+        steps = _resolve_steps(tc, page, index, knowledge, elements, report)
+        cases.append((tc, page, steps, _step_timeout(tc, timeouts, default_timeout)))
+
+    w = CodeWriter()
+    page_paths = {name: info["path"] for name, info in pages.items()}
+    if mode == "page_object":
+        w.lines(PAGE_OBJECT_HEADER.format(pages=page_paths).rstrip("\n"))
+        w.line()
+        _write_page_objects(w, cases)
+    else:
+        explicit = mode == "explicit"
+        w.lines(INLINE_HEADER.format(
+            pages=page_paths,
+            helpers_import=f"import {HELPERS_MODULE} as qa\n" if explicit else "",
+        ).rstrip("\n"))
+        with w.block():
+            for tc, page, steps, timeout in cases:
+                _write_inline_test(w, tc, page, steps, explicit, timeout)
+    w.lines(MAIN_FOOTER)
+    return w.render()
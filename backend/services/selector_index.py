@@ -0,0 +1,169 @@
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.services.knowledge_base import knowledge_pages, pages_elements
+from backend.services.storage import (
+    DEFAULT_PROJECT, knowledge_file, read_json, selector_index_file, write_json,
+)
+
+# Attributes a used_elements reference is matched against, highest priority first
+SELECTOR_PRIORITY = ["id", "data-testid", "name", "css", "text"]
+# Bumped when index keys change, so cached indexes are rebuilt
+SELECTOR_INDEX_VERSION = 2
+
+
+def css_identifier(value: str) -> str:
+    """
+    Escape `value` for use as a CSS identifier (class, id), like CSS.escape():
+    "col:6" -> "col\\:6", "1st" -> "\\31 st".
+    """
+    escaped = []
+    for i, char in enumerate(value):
+        code = ord(char)
+        if code == 0:
+            escaped.append("\ufffd")
+        elif code < 0x20 or code == 0x7f or (char.isdigit() and char.isascii()
+                                              and (i == 0 or (i == 1 and value[0] == "-"))):
+            escaped.append(f"\\{code:x} ")
+        elif char == "-" and i == 0 and len(value) == 1:
+            escaped.append("\\-")
+        elif code >= 0x80 or char in "-_" or char.isalnum():
+            escaped.append(char)
+        else:
+            escaped.append("\\" + char)
+    return "".join(escaped)
+
+
+def css_string(value: str) -> str:
+    """
+    Double-quoted CSS string (attribute selector values).
+    """
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return '"' + "".join(f"\\{ord(char):x} " if ord(char) < 0x20 or ord(char) == 0x7f else char
+                         for char in escaped) + '"'
+
+
+def element_css(elem: Dict[str, Any]) -> Optional[str]:
+    """
+    Tag + classes CSS selector (e.g. "button.btn.primary"), class names
+    escaped; None without classes.
+    """
+    if not elem.get("class") or not elem.get("tag"):
+        return None
+    return css_identifier(elem["tag"]) + "".join(f".{css_identifier(cls)}" for cls in elem["class"].split())
+
+
+def _lookup_values(elem: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    return {
+        "id": elem.get("id"),
+        "data-testid": elem.get("data-testid"),
+        "name": elem.get("name"),
+        "css": element_css(elem),
+        "text": elem.get("text"),
+    }
+
+
+def element_references(elem: Dict[str, Any]) -> set:
+    """
+    Every used_elements reference that resolves to this element (id, name, text, ...).
+    """
+    return {value for value in _lookup_values(elem).values() if value}
+
+
+def _page_index(ui_elements: List[Dict[str, Any]]) -> Dict[str, Dict[str, list]]:
+    index = {key: {} for key in SELECTOR_PRIORITY}
+    for position, elem in enumerate(ui_elements):
+        for key, value in _lookup_values(elem).items():
+            if not value:
+                continue
+            entry = index[key].setdefault(value, [position, 0])
+            entry[1] += 1
+    return index
+
+
+def build_selector_index(knowledge: Dict[str, Any], pages: Iterable[str] = None) -> Dict[str, Any]:
+    """
+    Hash indexes per page: page -> attribute -> value -> [first element position, match count].
+    Positions refer to the page's list in page_elements(knowledge, page).
+    Only `pages` (default: all) are indexed, and only their elements are read.
+    """
+    pages = knowledge_pages(knowledge) if pages is None else pages
+    elements = pages_elements(knowledge, pages)
+    return {"version": SELECTOR_INDEX_VERSION, "pages": {page: _page_index(elements[page]) for page in elements}}
+
+
+def add_pages(index: Dict[str, Any], knowledge: Dict[str, Any], pages: Iterable[str]) -> bool:
+    """
+    Index the `pages` that `index` is still missing; returns whether any were added.
+    """
+    missing = [page for page in dict.fromkeys(pages) if page not in index["pages"]]
+    if missing:
+        index["pages"].update(build_selector_index(knowledge, missing)["pages"])
+    return bool(missing)
+
+
+def load_selector_index(knowledge: Dict[str, Any], project_id: str = DEFAULT_PROJECT,
+                        pages: Iterable[str] = None) -> Dict[str, Any]:
+    """
+    Selector index of `pages` (default: all) for the project's saved knowledge
+    base, cached next to the knowledge file. Pages are indexed the first time
+    they are asked for, and the cache is dropped when the knowledge file is newer.
+    """
+    path = knowledge_file(project_id)
+    index_path = selector_index_file(project_id)
+    knowledge_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    index = None
+    if knowledge_mtime is not None and os.path.exists(index_path):
+        cached = read_json(index_path)
+        if cached.get("knowledge_mtime") == knowledge_mtime and cached.get("version") == SELECTOR_INDEX_VERSION:
+            index = cached
+    if index is None:
+        index = {"version": SELECTOR_INDEX_VERSION, "knowledge_mtime": knowledge_mtime, "pages": {}}
+
+    if add_pages(index, knowledge, knowledge_pages(knowledge) if pages is None else pages) and knowledge_mtime is not None:
+        write_json(index_path, index, indent=None)
+    return index
+
+
+def xpath_literal(text: str) -> str:
+    if "'" not in text:
+        return f"'{text}'"
+    if '"' not in text:
+        return f'"{text}"'
+    parts = text.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+
+def locator_for(key: str, value: str) -> Tuple[str, str]:
+    """
+    Selenium (By.*, value) pair for an index hit.
+    """
+    if key in ("id", "name") and css_string(value) != f'"{value}"':
+        # Selenium turns By.ID / By.NAME into [id="..."] without escaping quotes or backslashes
+        return "By.CSS_SELECTOR", f"[{key}={css_string(value)}]"
+    if key == "id":
+        return "By.ID", value
+    if key == "name":
+        return "By.NAME", value
+    if key == "data-testid":
+        return "By.CSS_SELECTOR", f"[data-testid={css_string(value)}]"
+    if key == "css":
+        return "By.CSS_SELECTOR", value
+    return "By.XPATH", f"//*[text()={xpath_literal(value)}]"
+
+
+def resolve_selector(index: Dict[str, Any], page: str, reference: str) -> Optional[Dict[str, Any]]:
+    """
+    Resolve a used_elements reference on a page in SELECTOR_PRIORITY order.
+    Returns {"by", "value", "matched_by", "position", "matches"} or None;
+    matches > 1 means the reference is ambiguous and the first element in
+    document order was chosen.
+    """
+    page_index = index["pages"].get(page, {})
+    for key in SELECTOR_PRIORITY:
+        hit = page_index.get(key, {}).get(reference)
+        if hit:
+            by, value = locator_for(key, reference)
+            return {"by": by, "value": value, "matched_by": key, "position": hit[0], "matches": hit[1]}
+    return None
+
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Root of all backend state; the "default" project keeps the historical layout
+DATA_DIR = os.getenv("DATA_DIR", "backend/data")
+PROJECTS_DIR = os.path.join(DATA_DIR, "projects")
+DEFAULT_PROJECT = "default"
+# "json" (knowledge.json) or "sqlite" (knowledge.sqlite3, sections loaded lazily)
+KNOWLEDGE_BACKEND = os.getenv("KNOWLEDGE_BACKEND", "json")
+# Loaded knowledge bases kept in memory (LRU), invalidated when the file changes
+KNOWLEDGE_CACHE_SIZE = int(os.getenv("KNOWLEDGE_CACHE_SIZE", "8"))
+
+_PROJECT_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Project layout
+# ───────────────────────────────────────────────
+def project_dir(project_id: str = DEFAULT_PROJECT) -> str:
+    """
+    Directory holding one project's files. Raises ValueError for IDs that are
+    not 1-64 letters, digits, "-" or "_".
+    """
+    if not _PROJECT_ID_RE.match(project_id or ""):
+        raise ValueError(f"Invalid project id '{project_id}': use letters, digits, '-' or '_' (max 64).")
+    if project_id == DEFAULT_PROJECT:
+        return DATA_DIR
+    return os.path.join(PROJECTS_DIR, project_id)
+
+
+def project_path(project_id: str, *parts: str) -> str:
+    return os.path.join(project_dir(project_id), *parts)
+
+
+def knowledge_file(project_id: str = DEFAULT_PROJECT, backend: str = None) -> str:
+    """
+    Knowledge base file of the project for `backend` (default KNOWLEDGE_BACKEND).
+    """
+    backend = backend or KNOWLEDGE_BACKEND
+    if backend not in ("json", "sqlite"):
+        raise ValueError(f"Unknown knowledge backend '{backend}'. Choose 'json' or 'sqlite'.")
+    return project_path(project_id, "knowledge.sqlite3" if backend == "sqlite" else "knowledge.json")
+
+
+def test_cases_file(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "test_cases.json")
+
+
+def scripts_file(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "generated_scripts.py")
+
+
+def selector_index_file(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "selector_index.json")
+
+
+def pages_dir(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "pages")
+
+
+def uploads_dir(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "uploaded_docs")
+
+
+def reports_dir(project_id: str = DEFAULT_PROJECT) -> str:
+    return project_path(project_id, "reports")
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Atomic file I/O
+# ───────────────────────────────────────────────
+def atomic_write(path: str, data: Union[str, bytes]) -> None:
+    """
+    Write to a temp file in the same directory, then rename it over `path`,
+    so readers see either the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json(path: str, value: Any, indent: Optional[int] = 2) -> None:
+    atomic_write(path, json.dumps(value, indent=indent))
+
+
+def read_json(path: str) -> Any:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Knowledge base cache + project locks
+# ───────────────────────────────────────────────
+class KnowledgeCache:
+    """
+    In-process LRU of parsed JSON files keyed by path. An entry is only served
+    while the file's mtime and size are unchanged, so writes from other
+    processes are picked up on the next read.
+    """
+
+    def __init__(self, max_entries: int = KNOWLEDGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> Optional[Any]:
+        try:
+            signature = self._signature(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def load(self, path: str, loader=read_json) -> Any:
+        """
+        Cached value for `path`, loading it with `loader` on a miss.
+        The signature is taken before reading, so a concurrent write is never
+        cached under the new file's signature.
+        """
+        value = self.get(path)
+        if value is None:
+            signature = self._signature(path)
+            value = loader(path)
+            self._store(path, signature, value)
+        return value
+
+    def put(self, path: str, value: Any) -> None:
+        self._store(path, self._signature(path), value)
+
+    def _store(self, path: str, signature: Tuple[int, int], value: Any) -> None:
+        with self._lock:
+            self._entries[path] = (signature, value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+knowledge_cache = KnowledgeCache()
+
+# Seconds between attempts to take a project's file lock held by another process
+PROJECT_LOCK_POLL_SECONDS = float(os.getenv("PROJECT_LOCK_POLL_SECONDS", "0.05"))
+
+_project_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _try_lock_file(f) -> bool:
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ProjectLock:
+    """
+    `async with` lock of one project, held across processes (API workers,
+    `backend.worker` processes): an asyncio.Lock queues this process's
+    coroutines, then an OS lock is taken on `<project>/.lock`. The file lock
+    is polled without blocking, so a cancelled waiter never ends up holding it.
+    """
+
+    def __init__(self, project_id: str):
+        self.path = project_path(project_id, ".lock")
+        self._local = asyncio.Lock()
+        self._file = None
+
+    async def __aenter__(self) -> "ProjectLock":
+        await self._local.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            f = open(self.path, "a+b")
+            try:
+                while not _try_lock_file(f):
+                    await asyncio.sleep(PROJECT_LOCK_POLL_SECONDS)
+            except BaseException:
+                f.close()
+                raise
+            self._file = f
+            return self
+        except BaseException:
+            self._local.release()
+            raise
+
+    async def __aexit__(self, *exc) -> None:
+        f, self._file = self._file, None
+        try:
+            _unlock_file(f)
+        finally:
+            f.close()
+            self._local.release()
+
+
+def project_lock(project_id: str) -> ProjectLock:
+    """
+    Serialises read-modify-write updates of one project (ingestion, document
+    removal, saving generated artifacts) across coroutines and processes.
+    """
+    lock = _project_locks.get(project_id)
+    if lock is None:
+        lock = _project_locks.setdefault(project_id, ProjectLock(project_id))
+    return lock
@@ -1,34 +1,159 @@
+import asyncio
 import json
-from backend.utils.llm_client import GeminiLLM
+import os
+from typing import Callable
+from pydantic import ValidationError
+from backend.models import TestCase, TestCaseList
+from backend.services.dedup import DEDUP_MODE, dedup_test_cases
+from backend.services.knowledge_base import LexicalIndex, elements_by_page, knowledge_chunks
+from backend.services.selector_index import element_references
+from backend.utils import metrics
+from backend.utils.json_repair import repair_json, salvage_items, strip_fences
+from backend.utils.json_stream import JSONArrayItemStream
+from backend.utils.llm_client import BaseLLM, get_llm, llm_stats
+from backend.utils.prompt_compaction import compact_knowledge, estimate_tokens
+from backend.utils.response_cache import make_key, response_cache
+
+# Bump whenever build_prompt changes so stale cached responses are not reused
+PROMPT_VERSION = "5"
+
+# Chunks retrieved per feature area; below RETRIEVAL_MIN_CHARS everything is sent as-is
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_MIN_CHARS = int(os.getenv("RETRIEVAL_MIN_CHARS", "6000"))
+
+# Max requirement chunks per generation shard (shards run in parallel)
+SHARD_MAX_CHUNKS = int(os.getenv("SHARD_MAX_CHUNKS", "8"))
+
+# Estimated prompt tokens per shard (0 = unlimited); see utils/prompt_compaction
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+
+# Follow-up requests for the test cases lost to malformed output (0 = keep what was salvaged)
+LLM_REPAIR_RETRIES = int(os.getenv("LLM_REPAIR_RETRIES", "1"))
+
+def known_elements(ui_elements: list) -> set:
+    # Any attribute the selector index resolves (an element with both id and name is known by either)
+    return {reference for elem in ui_elements for reference in element_references(elem)}
+
+
+def validate_test_case(tc: dict, valid_elements: set, page: str = None) -> dict:
+    """
+    Flags a single test case that references UI elements unknown to its page.
+    Cases without a page are assigned `page` (the page they were generated for).
+    """
+    if page and not tc.get("page"):
+        tc["page"] = page
+    invalid = set(tc.get("used_elements", [])) - valid_elements
+    if invalid:
+        tc["validation_warning"] = f"⚠ Invalid elements referenced: {list(invalid)}"
+    return tc
 
-llm = GeminiLLM()
 
 def validate_test_cases(test_cases: dict, knowledge: dict):
     """
-    Validates that used_elements in each test case actually map to known UI elements from ingestion.
+    Validates that used_elements in each test case actually map to known UI elements
+    from ingestion, on the test case's own page when it names one.
     """
-    valid_elements = {
-        elem.get("id") or elem.get("name") or elem.get("text")
-        for elem in knowledge.get("ui_elements", [])
-    }
+    with metrics.VALIDATION_DURATION.time():
+        pages = {page: known_elements(elements) for page, elements in elements_by_page(knowledge).items()}
+        all_elements = known_elements(knowledge.get("ui_elements", []))
+        default_page = knowledge.get("page")
 
-    for tc in test_cases.get("test_cases", []):
-        invalid = set(tc.get("used_elements", [])) - valid_elements
-        if invalid:
-            tc["validation_warning"] = f"⚠ Invalid elements referenced: {list(invalid)}"
+        for tc in test_cases.get("test_cases", []):
+            page = tc.get("page") or default_page
+            validate_test_case(tc, pages.get(page, all_elements), default_page)
 
     return test_cases
 
 
-def generate_test_cases(knowledge: dict) -> dict:
-    prompt = f"""
+def feature_areas(knowledge: dict) -> list[tuple[str, str]]:
+    """
+    One (name, retrieval query) pair per UI element, built from its identifying attributes.
+    """
+    areas = []
+    for elem in knowledge.get("ui_elements", []):
+        name = elem.get("id") or elem.get("name") or elem.get("text")
+        if not name:
+            continue
+        fields = ("id", "name", "text", "label", "placeholder")
+        query = " ".join(str(elem.get(field)) for field in fields if elem.get(field))
+        areas.append((name, query))
+    return areas
+
+
+def select_requirements(knowledge: dict, top_k: int = RETRIEVAL_TOP_K) -> list[dict]:
+    """
+    Pick the requirement chunks relevant to the knowledge base's feature areas:
+    the top_k BM25 hits per area, returned in document order.
+    """
+    chunks = knowledge_chunks(knowledge)
+    if sum(len(chunk["text"]) for chunk in chunks) <= RETRIEVAL_MIN_CHARS:
+        return chunks
+
+    index = LexicalIndex(chunks)
+    areas = feature_areas(knowledge)
+    selected = set()
+    for _, query in areas:
+        selected.update(idx for _, idx in index.search(query, top_k))
+    if not selected:
+        combined = " ".join(query for _, query in areas)
+        selected.update(idx for _, idx in index.search(combined, top_k))
+
+    return [chunks[idx] for idx in sorted(selected)]
+
+
+def build_shards(knowledge: dict, max_chunks: int = SHARD_MAX_CHUNKS) -> list[dict]:
+    """
+    Partition the knowledge base into shards that are generated independently:
+    one set of shards per HTML page, each holding that page's elements and the
+    requirement chunks retrieved for them. Each document is split into groups
+    of at most max_chunks; consecutive small groups are packed together, so a
+    small single-page knowledge base stays a single shard.
+    """
+    pages = elements_by_page(knowledge)
+    shards = []
+    for page, ui_elements in pages.items():
+        page_knowledge = dict(knowledge, ui_elements=ui_elements)
+        by_source = {}
+        for chunk in select_requirements(page_knowledge):
+            by_source.setdefault(chunk.get("source", ""), []).append(
+                {"id": chunk["id"], "text": chunk["text"]}
+            )
+
+        groups = []
+        for source_chunks in by_source.values():
+            for i in range(0, len(source_chunks), max_chunks):
+                groups.append(source_chunks[i:i + max_chunks])
+
+        packed = []
+        for group in groups:
+            if packed and len(packed[-1]) + len(group) <= max_chunks:
+                packed[-1].extend(group)
+            else:
+                packed.append(list(group))
+
+        for group in packed or [[]]:
+            name = group[0]["id"] if group else "all"
+            shards.append({
+                "name": f"{page}:{name}" if len(pages) > 1 else name,
+                "page": page,
+                "requirements": group,
+                "ui_elements": ui_elements,
+            })
+    return shards
+
+
+def _prompt_text(knowledge_json: str) -> str:
+    return f"""
 You are an autonomous QA agent specializing in test planning and Selenium UI automation.
 
 Your task is to generate **valid JSON test cases STRICTLY based on the provided knowledge base**.
 
 🚨 CRITICAL RULES 🚨
-- Only use UI elements from "ui_elements".
-- Only reference requirements from "requirements".
+- Only use UI elements from "ui_elements"; they all belong to the HTML page named in "page".
+- Each UI element is written as `tag#id key=value ...`; list elements in "used_elements" by their id
+  (or their name, or text, when they have no id).
+- Set "page" of every test case to that page name.
+- Only reference requirements from "requirements" (requirement id -> text), using those ids in "related_requirements".
 - Do ❌ NOT hallucinate any features or extra fields.
 - Do ❌ NOT wrap output in ```json or markdown or add explanations.
 - Do only return **valid JSON** exactly in format shown below.
@@ -40,7 +165,8 @@ Example format (MUST FOLLOW):
     {{
       "test_id": "TC_001",
       "title": "Short but clear test title",
-      "related_requirements": ["R1"],
+      "page": "checkout.html",
+      "related_requirements": ["product_specification.txt#0"],
       "used_elements": ["emailInput"],
       "preconditions": ["User must be on the checkout page"],
       "steps": ["Enter email", "Click pay button"],
@@ -53,28 +179,452 @@ Example format (MUST FOLLOW):
 📌 No markdown formatting, no triple backticks.
 
 Knowledge Base:
-{json.dumps(knowledge, indent=2)}
+{knowledge_json}
 """
 
-    try:
-        raw_output = llm.generate(prompt).strip()
 
-        # Remove markdown or code fencing if any (safely)
-        if raw_output.startswith("```"):
-            raw_output = raw_output.replace("```json", "").replace("```", "").strip()
+# Tokens of the prompt around the knowledge base, counted against the budget
+PROMPT_OVERHEAD_TOKENS = estimate_tokens(_prompt_text(""))
+
+
+def compact_shard(shard: dict) -> tuple[dict, dict]:
+    """
+    The shard's prompt knowledge, compacted to PROMPT_TOKEN_BUDGET, and the
+    compaction report (tokens before / after, what was dropped). Computed once per shard.
+    """
+    if "prompt_knowledge" not in shard:
+        shard["prompt_knowledge"], shard["prompt_report"] = compact_knowledge(
+            shard["page"], shard["requirements"], shard["ui_elements"],
+            PROMPT_TOKEN_BUDGET, PROMPT_OVERHEAD_TOKENS,
+        )
+    return shard["prompt_knowledge"], shard["prompt_report"]
+
+
+def prompt_knowledge(shard: dict) -> dict:
+    """
+    The part of a shard that is sent to the LLM.
+    """
+    return compact_shard(shard)[0]
+
+
+def prompt_report(knowledge: dict) -> dict:
+    """
+    Estimated prompt tokens per shard before and after compaction, without calling the LLM.
+    """
+    shards = []
+    for shard in build_shards(knowledge):
+        report = compact_shard(shard)[1]
+        shards.append({"shard": shard["name"], **report})
+    before = sum(shard["tokens_before"] for shard in shards)
+    after = sum(shard["tokens_after"] for shard in shards)
+    return {
+        "budget": PROMPT_TOKEN_BUDGET,
+        "tokens_before": before,
+        "tokens_after": after,
+        "saved": round(1 - after / before, 3) if before else 0.0,
+        "shards": shards,
+    }
 
-        # Try to parse JSON
-        test_cases = json.loads(raw_output)
 
-        # Validate UI element references
-        test_cases = validate_test_cases(test_cases, knowledge)
+def build_prompt(shard: dict, exclude: list = None) -> str:
+    """
+    Build the Gemini prompt for one shard of the knowledge base. `exclude` lists
+    test cases already generated, when only the missing ones are re-requested.
+    """
+    knowledge, report = compact_shard(shard)
+    prompt = _prompt_text(json.dumps(knowledge, ensure_ascii=False, separators=(",", ":")))
+    tokens = report["tokens_after"]
+    if exclude:
+        titles = "\n".join(f"- {tc.get('title')}" for tc in exclude)
+        suffix = f"""
+These test cases were already generated. Return ONLY the remaining test cases, in the same format:
+{titles}
+"""
+        prompt += suffix
+        tokens += estimate_tokens(suffix)
+    metrics.PROMPT_CHARS.observe(len(prompt))
+    metrics.PROMPT_TOKENS.observe(tokens)
+    return prompt
+
+
+def is_valid_case(item) -> bool:
+    """
+    True if `item` has every field of the TestCase schema.
+    """
+    try:
+        TestCase.model_validate(item)
+        return True
+    except ValidationError:
+        return False
 
-        return test_cases
 
+def extract_test_cases(raw_output: str) -> tuple[list[dict], str]:
+    """
+    The schema-valid test cases in raw LLM output and how they were recovered:
+    "ok" (valid JSON), "repaired" (fixed locally, see json_repair), "salvaged"
+    (only the complete array items were kept) or "failed". Cases that do not
+    match the schema are dropped, which also makes the result "salvaged".
+    """
+    with metrics.RESPONSE_PARSE_DURATION.time():
+        cases, status = _extract_test_cases(raw_output)
+    metrics.LLM_RESPONSES.inc(status=status)
+    return cases, status
+
+
+def _extract_test_cases(raw_output: str) -> tuple[list[dict], str]:
+    text = strip_fences(raw_output)
+    try:
+        parsed, status = json.loads(text), "ok"
     except json.JSONDecodeError:
+        parsed, status = repair_json(text), "repaired"
+    items = parsed.get("test_cases") if isinstance(parsed, dict) else None
+    if not isinstance(items, list):
+        items, status = salvage_items(text), "salvaged"
+
+    cases = [item for item in items if is_valid_case(item)]
+    if len(cases) < len(items):
+        status = "salvaged"
+    if not cases and status == "salvaged":
+        status = "failed"
+    return cases, status
+
+
+def parse_llm_output(raw_output: str, knowledge: dict) -> dict:
+    """
+    Parse raw LLM output into validated test cases (or an error dict),
+    repairing malformed JSON and keeping every valid case it contains.
+    """
+    cases, status = extract_test_cases(raw_output)
+    if status == "failed":
         return {
             "error": "⚠ Gemini returned invalid JSON. Try regenerating.",
-            "raw_output": raw_output
+            "raw_output": raw_output.strip()
         }
+    # Validate UI element references
+    return validate_test_cases({"test_cases": cases}, knowledge)
+
+
+class ShardAttempts:
+    """
+    The LLM calls of one shard: valid cases are kept from every response and,
+    while a response came back incomplete, only the missing cases are
+    re-requested (up to LLM_REPAIR_RETRIES follow-ups).
+    """
+
+    def __init__(self, shard: dict):
+        self.shard = shard
+        self.cases = []
+        self.complete = False
+        self.calls = 0
+        self.statuses = []
+        self.error = None
+        self.raw_output = ""
+        self._seen = set()
+
+    @property
+    def done(self) -> bool:
+        return self.complete or self.error is not None or self.calls > LLM_REPAIR_RETRIES
+
+    def prompt(self) -> str:
+        return build_prompt(self.shard, self.cases if self.calls else None)
+
+    def add(self, raw_output: str) -> list[dict]:
+        """
+        Record one response; returns the new cases it contributed.
+        """
+        self.calls += 1
+        self.raw_output = raw_output
+        cases, status = extract_test_cases(raw_output)
+        self.statuses.append(status)
+        self.complete = status in ("ok", "repaired")
+        added = []
+        for tc in cases:
+            signature = _case_signature(tc)
+            if signature not in self._seen:
+                self._seen.add(signature)
+                added.append(tc)
+        self.cases.extend(added)
+        return added
+
+    def fail(self, error: str) -> None:
+        self.error = error
+
+    def result(self) -> dict:
+        if not self.cases and not self.complete:
+            if self.error:
+                return {"error": self.error}
+            return {"error": "⚠ Gemini returned invalid JSON. Try regenerating.", "raw_output": self.raw_output.strip()}
+        return validate_test_cases({"test_cases": self.cases}, self.shard)
+
+    def counters(self) -> dict:
+        report = compact_shard(self.shard)[1]
+        return {
+            "prompt_tokens_before": report["tokens_before"],
+            "prompt_tokens_after": report["tokens_after"],
+            "generations": 1,
+            "llm_calls": self.calls,
+            "retries": max(0, self.calls - 1),
+            "successes": int(bool(self.cases) or self.complete),
+            "failures": int(not self.cases and not self.complete),
+            "repaired": self.statuses.count("repaired"),
+            "salvaged": self.statuses.count("salvaged"),
+        }
+
+
+def generation_stats() -> dict:
+    """
+    Test case generation counters (all processes); `retries_per_success` is
+    the follow-up LLM calls made per successfully generated shard; prompt
+    tokens are estimates of the first prompt of each shard, before and after
+    compaction. "client" holds this process's LLM client counters (upstream
+    calls, backoff retries, 429s, coalesced prompts, time spent rate limited).
+    """
+    counters = response_cache.counters()
+    names = ("generations", "llm_calls", "retries", "successes", "failures", "repaired", "salvaged",
+             "prompt_tokens_before", "prompt_tokens_after")
+    stats = {name: counters.get(name, 0) for name in names}
+    stats["retries_per_success"] = round(stats["retries"] / stats["successes"], 3) if stats["successes"] else 0.0
+    stats["client"] = llm_stats()
+    return stats
+
+
+def cache_key(shard: dict, client: BaseLLM) -> str:
+    """
+    Cache key: prompt template version + model + the knowledge actually sent.
+    """
+    return make_key(PROMPT_VERSION, client.model_name, prompt_knowledge(shard))
+
+
+def _case_signature(tc: dict) -> tuple:
+    def norm(text):
+        return " ".join(str(text).lower().split())
+
+    return (
+        tc.get("page"),
+        norm(tc.get("title", "")),
+        tuple(norm(step) for step in tc.get("steps", [])),
+        tuple(sorted(tc.get("used_elements", []))),
+    )
+
+
+class TestCaseMerger:
+    """
+    Accumulates test cases from several shards: drops duplicates, renumbers
+    test IDs as TC_001, TC_002, ... in arrival order and records shard failures.
+    Near-duplicates (reworded copies) are merged or dropped in `result` (see dedup).
+    """
+
+    def __init__(self, dedup: str = None):
+        self.test_cases = []
+        self.errors = []
+        self.dedup = dedup or DEDUP_MODE
+        self._seen = set()
+
+    def add(self, tc: dict):
+        """
+        Returns the renumbered test case, or None if it duplicates an earlier one.
+        """
+        signature = _case_signature(tc)
+        if signature in self._seen:
+            return None
+        self._seen.add(signature)
+        tc = dict(tc, test_id=f"TC_{len(self.test_cases) + 1:03d}")
+        self.test_cases.append(tc)
+        return tc
+
+    def add_error(self, shard: dict, result: dict) -> dict:
+        error = {"shard": shard["name"], **result}
+        self.errors.append(error)
+        return error
+
+    def result(self) -> dict:
+        if self.errors and not self.test_cases:
+            if len(self.errors) == 1:
+                error = dict(self.errors[0])
+                error.pop("shard")
+                return error
+            return {"error": "Test generation failed for every shard.", "shard_errors": self.errors}
+
+        test_cases = {"test_cases": self.test_cases}
+        if self.errors:
+            test_cases["shard_errors"] = self.errors
+        return dedup_test_cases(test_cases, self.dedup)
+
+
+def merge_shard_results(shards: list[dict], results: list[dict], dedup: str = None) -> dict:
+    """
+    Merge per-shard results in shard order, keeping partial results if shards failed.
+    """
+    merger = TestCaseMerger(dedup)
+    for shard, result in zip(shards, results):
+        if "error" in result:
+            merger.add_error(shard, result)
+            continue
+        for tc in result.get("test_cases", []):
+            merger.add(tc)
+    return merger.result()
+
+
+def _generate_shard(shard: dict, force: bool) -> dict:
+    llm = get_llm()
+    key = cache_key(shard, llm)
+    if not force:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+    attempts = ShardAttempts(shard)
+    try:
+        while not attempts.done:
+            attempts.add(llm.complete(attempts.prompt(), TestCaseList))
+    except Exception as e:
+        attempts.fail(f"Test generation failed: {str(e)}")
+    response_cache.count(**attempts.counters())
+    test_cases = attempts.result()
+    # Incomplete results are returned but not cached
+    if attempts.complete:
+        response_cache.put(key, test_cases)
+    return test_cases
+
+
+async def _agenerate_shard(shard: dict, client: BaseLLM, force: bool) -> dict:
+    key = cache_key(shard, client)
+    if not force:
+        cached = await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            return cached
+    attempts = ShardAttempts(shard)
+    try:
+        while not attempts.done:
+            attempts.add(await client.agenerate(attempts.prompt(), TestCaseList))
+    except asyncio.TimeoutError:
+        attempts.fail(f"Test generation timed out after {client.timeout:g}s. Try regenerating.")
     except Exception as e:
-        return {"error": f"Test generation failed: {str(e)}"}
+        attempts.fail(f"Test generation failed: {str(e)}")
+    await asyncio.to_thread(response_cache.count, **attempts.counters())
+    test_cases = attempts.result()
+    if attempts.complete:
+        await asyncio.to_thread(response_cache.put, key, test_cases)
+    return test_cases
+
+
+def generate_test_cases(knowledge: dict, force: bool = False, dedup: str = None) -> dict:
+    """
+    Generate test cases shard by shard, reusing cached shard results unless
+    `force` is set. Only successful generations are cached.
+    """
+    shards = build_shards(knowledge)
+    results = [_generate_shard(shard, force) for shard in shards]
+    return merge_shard_results(shards, results, dedup)
+
+
+async def agenerate_test_cases(knowledge: dict, client: BaseLLM = None, force: bool = False,
+                               progress: Callable[[int, int], None] = None, dedup: str = None) -> dict:
+    """
+    Non-blocking variant of generate_test_cases for use inside the API event loop;
+    shards are generated concurrently (bounded by the client's concurrency limit).
+    `client` defaults to the LLM_PROVIDER client (get_llm); pass a FakeLLM to run offline.
+    `progress(done, total)` is called as each shard finishes. `dedup` overrides
+    DEDUP_MODE for near-duplicate test cases (merge, drop or off).
+    """
+    client = client or get_llm()
+    shards = build_shards(knowledge)
+    finished = 0
+
+    async def run(shard: dict) -> dict:
+        nonlocal finished
+        result = await _agenerate_shard(shard, client, force)
+        finished += 1
+        if progress:
+            progress(finished, len(shards))
+        return result
+
+    results = await asyncio.gather(*(run(shard) for shard in shards))
+    return merge_shard_results(shards, results, dedup)
+
+
+async def _astream_shard(shard: dict, client: BaseLLM, force: bool, queue: asyncio.Queue) -> None:
+    """
+    Stream one shard, putting ("test_case", shard, tc) on the queue as soon as each
+    object is complete, ("shard_error", shard, result) on failure and finally
+    ("shard_done", shard, None).
+    """
+    try:
+        key = cache_key(shard, client)
+        cached = None if force else await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            for tc in cached.get("test_cases", []):
+                await queue.put(("test_case", shard, tc))
+            return
+
+        valid_elements = known_elements(shard["ui_elements"])
+        attempts = ShardAttempts(shard)
+        emitted = set()  # signatures of the cases already put on the queue
+
+        async def emit(tc: dict) -> None:
+            signature = _case_signature(tc)
+            if signature in emitted:
+                return
+            emitted.add(signature)
+            await queue.put(("test_case", shard, validate_test_case(dict(tc), valid_elements, shard["page"])))
+
+        try:
+            # First response streamed, cases emitted as they complete
+            parser = JSONArrayItemStream()
+            pieces = []
+            async for piece in client.astream(attempts.prompt(), TestCaseList):
+                pieces.append(piece)
+                for item in parser.feed(piece):
+                    if is_valid_case(item):
+                        await emit(item)
+            # Cases only recovered by repairing the full response are emitted now
+            for tc in attempts.add("".join(pieces)):
+                await emit(tc)
+            # Follow-ups for missing cases are small; emitted when they arrive
+            while not attempts.done:
+                for tc in attempts.add(await client.agenerate(attempts.prompt(), TestCaseList)):
+                    await emit(tc)
+        except asyncio.TimeoutError:
+            attempts.fail(f"Test generation timed out after {client.timeout:g}s. Try regenerating.")
+        except Exception as e:
+            attempts.fail(f"Test generation failed: {str(e)}")
+
+        await asyncio.to_thread(response_cache.count, **attempts.counters())
+        test_cases = attempts.result()
+        if "error" in test_cases:
+            await queue.put(("shard_error", shard, test_cases))
+        elif attempts.complete:
+            await asyncio.to_thread(response_cache.put, key, test_cases)
+    finally:
+        await queue.put(("shard_done", shard, None))
+
+
+async def astream_test_cases(knowledge: dict, client: BaseLLM = None, force: bool = False, dedup: str = None):
+    """
+    Generate test cases for all shards concurrently and yield (event, data)
+    pairs as results arrive: ("test_case", tc) for every new (de-duplicated,
+    renumbered, validated) case, ("shard_error", error) for failed shards and
+    a final ("done", merged_result). Near-duplicates are only removed from the
+    merged result, as they can only be recognised once every case has arrived.
+    """
+    client = client or get_llm()
+    shards = build_shards(knowledge)
+    queue = asyncio.Queue()
+    tasks = [asyncio.create_task(_astream_shard(shard, client, force, queue)) for shard in shards]
+    merger = TestCaseMerger(dedup)
+
+    try:
+        pending = len(tasks)
+        while pending:
+            event, shard, data = await queue.get()
+            if event == "shard_done":
+                pending -= 1
+            elif event == "shard_error":
+                yield "shard_error", merger.add_error(shard, data)
+            else:
+                tc = merger.add(data)
+                if tc is not None:
+                    yield "test_case", tc
+        yield "done", merger.result()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,365 @@
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import unittest
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List
+
+from lxml import etree, html as lxml_html
+
+from backend.services.selector_index import xpath_literal
+from backend.services.storage import DATA_DIR, atomic_write, write_json
+
+REPORTS_DIR = os.path.join(DATA_DIR, "reports")
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", "4"))
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Browser drivers
+# ───────────────────────────────────────────────
+def make_chrome_driver(headless: bool = True):
+    """
+    Headless Chrome session for one runner worker.
+    """
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    return webdriver.Chrome(options=options)
+
+
+_CSS_NAME = r"(?:[\w-]|\\[0-9a-fA-F]{1,6} ?|\\[^0-9a-fA-F])+"
+_CSS_PART_RE = re.compile(rf"""([#.])({_CSS_NAME})|\[([\w-]+)(?:=(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'|([\w-]+)))?\]""")
+_CSS_ESCAPE_RE = re.compile(r"\\([0-9a-fA-F]{1,6}) ?|\\(.)")
+
+
+def _css_unescape(text: str) -> str:
+    return _CSS_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)) if m.group(1) else m.group(2), text)
+
+
+def _css_to_xpath(selector: str) -> str:
+    """
+    Translate a simple compound CSS selector (tag, #id, .class, [attr], [attr=value])
+    to XPath. Enough for the selectors generate_scripts emits, escapes included.
+    """
+    match = re.match(r"^[a-zA-Z][\w-]*|^\*", selector)
+    tag = match.group(0) if match else "*"
+    rest = selector[match.end():] if match else selector
+    conditions = []
+    for part in _CSS_PART_RE.finditer(rest):
+        prefix, name, attr, double, single, bare = part.groups()
+        value = next((v for v in (double, single, bare) if v is not None), None)
+        if prefix == "#":
+            conditions.append(f"@id={xpath_literal(_css_unescape(name))}")
+        elif prefix == ".":
+            literal = xpath_literal(f" {_css_unescape(name)} ")
+            conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), {literal})")
+        elif value is None:
+            conditions.append(f"@{attr}")
+        else:
+            conditions.append(f"@{attr}={xpath_literal(_css_unescape(value))}")
+    if _CSS_PART_RE.sub("", rest).strip():
+        raise ValueError(f"FakeDriver only supports simple CSS selectors: {selector}")
+    return f"//{tag}" + "".join(f"[{condition}]" for condition in conditions)
+
+
+class FakeElement:
+    def __init__(self, node):
+        self._node = node
+
+    @property
+    def text(self) -> str:
+        return self._node.text_content().strip()
+
+    @property
+    def tag_name(self) -> str:
+        return self._node.tag
+
+    def get_attribute(self, name: str):
+        return self._node.get(name)
+
+    def is_displayed(self) -> bool:
+        return self._node.get("type") != "hidden"
+
+    def is_enabled(self) -> bool:
+        return self._node.get("disabled") is None
+
+    def click(self) -> None:
+        if self._node.get("type") in ("checkbox", "radio"):
+            self._node.set("checked", "checked")
+
+    def clear(self) -> None:
+        self._node.set("value", "")
+
+    def send_keys(self, *values) -> None:
+        self._node.set("value", (self._node.get("value") or "") + "".join(map(str, values)))
+
+
+class FakeDriver:
+    """
+    Browser-free WebDriver stand-in for CI: loads file:// pages with lxml and
+    resolves By.ID / By.NAME / By.XPATH / simple By.CSS_SELECTOR locators, so
+    generated suites can be checked for broken selectors without Chrome.
+    """
+
+    def __init__(self):
+        self._tree = None
+        self.current_url = None
+
+    def get(self, url: str) -> None:
+        if not url.startswith("file://"):
+            raise ValueError(f"FakeDriver can only open file:// URLs, got {url}")
+        path = url[len("file://"):]
+        path = path.lstrip("/") if os.name == "nt" else "/" + path.lstrip("/")
+        self._tree = lxml_html.parse(path)
+        self.current_url = url
+
+    @property
+    def page_source(self) -> str:
+        return etree.tostring(self._tree, encoding="unicode") if self._tree is not None else ""
+
+    @property
+    def title(self) -> str:
+        titles = self._tree.xpath("//title/text()") if self._tree is not None else []
+        return titles[0] if titles else ""
+
+    def execute_script(self, script: str, *args):
+        if "readyState" in script:
+            return "complete"
+        return None
+
+    def find_elements(self, by: str, value: str) -> List[FakeElement]:
+        if self._tree is None:
+            return []
+        if by == "id":
+            nodes = self._tree.xpath("//*[@id=$value]", value=value)
+        elif by == "name":
+            nodes = self._tree.xpath("//*[@name=$value]", value=value)
+        elif by == "xpath":
+            nodes = self._tree.xpath(value)
+        elif by == "css selector":
+            nodes = self._tree.xpath(_css_to_xpath(value))
+        else:
+            raise ValueError(f"FakeDriver does not support locator strategy: {by}")
+        return [FakeElement(node) for node in nodes]
+
+    def find_element(self, by: str, value: str) -> FakeElement:
+        from selenium.common.exceptions import NoSuchElementException
+
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"Unable to locate element: {by}={value}")
+        return elements[0]
+
+    def delete_all_cookies(self) -> None:
+        pass
+
+    def quit(self) -> None:
+        self._tree = None
+
+
+DRIVER_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "chrome": make_chrome_driver,
+    "fake": FakeDriver,
+}
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Suite execution
+# ───────────────────────────────────────────────
+def load_tests(script_path: str) -> List[unittest.TestCase]:
+    """
+    Import a generated suite and return its test cases in definition order.
+    """
+    module_name = f"generated_suite_{uuid.uuid4().hex}"
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+
+    # Generated suites may import helper modules saved next to them
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    sys.path.insert(0, script_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(script_dir)
+
+    tests = []
+
+    def flatten(suite):
+        for item in suite:
+            if isinstance(item, unittest.TestSuite):
+                flatten(item)
+            else:
+                tests.append(item)
+
+    flatten(unittest.defaultTestLoader.loadTestsFromModule(module))
+    return tests
+
+
+def _run_one(test: unittest.TestCase, driver) -> Dict[str, Any]:
+    test.driver = driver  # session reuse: setUp/tearDown leave a provided driver alone
+    result = unittest.TestResult()
+    start = time.perf_counter()
+    test.run(result)
+    duration = time.perf_counter() - start
+
+    status, message = "passed", None
+    if result.errors:
+        status, message = "error", result.errors[0][1]
+    elif result.failures:
+        status, message = "failed", result.failures[0][1]
+    elif result.skipped:
+        status, message = "skipped", result.skipped[0][1]
+
+    return {
+        "name": test._testMethodName,
+        "classname": type(test).__name__,
+        "status": status,
+        "duration": round(duration, 4),
+        "message": message,
+    }
+
+
+def run_suite(script_path: str, workers: int = RUNNER_WORKERS, driver: str = "chrome") -> Dict[str, Any]:
+    """
+    Run a generated suite on a pool of `workers` browser sessions. Each worker
+    owns one driver for its whole lifetime and pulls tests from a shared queue.
+    """
+    if driver not in DRIVER_FACTORIES:
+        raise ValueError(f"Unknown driver '{driver}'. Choose one of: {sorted(DRIVER_FACTORIES)}")
+    factory = DRIVER_FACTORIES[driver]
+
+    tests = load_tests(script_path)
+    pending = queue.Queue()
+    for position, test in enumerate(tests):
+        pending.put((position, test))
+    results: List[Dict[str, Any]] = [None] * len(tests)
+
+    def worker(worker_id: int) -> None:
+        session = None
+        try:
+            while True:
+                try:
+                    position, test = pending.get_nowait()
+                except queue.Empty:
+                    return
+                if session is None:
+                    session = factory()
+                else:
+                    session.delete_all_cookies()
+                outcome = _run_one(test, session)
+                outcome["worker"] = worker_id
+                results[position] = outcome
+        finally:
+            if session is not None:
+                session.quit()
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(i,), daemon=True)
+        for i in range(max(1, min(workers, len(tests))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Tests a crashed worker never reached
+    for position, test in enumerate(tests):
+        if results[position] is None:
+            results[position] = {
+                "name": test._testMethodName,
+                "classname": type(test).__name__,
+                "status": "error",
+                "duration": 0.0,
+                "message": "Not executed: browser worker failed to start.",
+                "worker": None,
+            }
+
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in ("passed", "failed", "error", "skipped")}
+    return {
+        "summary": {
+            "total": len(results),
+            **counts,
+            "workers": len(threads),
+            "driver": driver,
+            "duration": round(time.perf_counter() - started, 4),
+        },
+        "tests": results,
+    }
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Reports
+# ───────────────────────────────────────────────
+def to_junit_xml(report: Dict[str, Any]) -> str:
+    summary = report["summary"]
+    suite = ET.Element("testsuite", {
+        "name": "generated_scripts",
+        "tests": str(summary["total"]),
+        "failures": str(summary["failed"]),
+        "errors": str(summary["error"]),
+        "skipped": str(summary["skipped"]),
+        "time": str(summary["duration"]),
+    })
+    for test in report["tests"]:
+        case = ET.SubElement(suite, "testcase", {
+            "classname": test["classname"],
+            "name": test["name"],
+            "time": str(test["duration"]),
+        })
+        if test["status"] in ("failed", "error", "skipped"):
+            tag = {"failed": "failure", "error": "error", "skipped": "skipped"}[test["status"]]
+            message = test["message"] or ""
+            lines = message.strip().splitlines()
+            ET.SubElement(case, tag, {"message": lines[-1] if lines else ""}).text = message
+    return ET.tostring(suite, encoding="unicode")
+
+
+def write_reports(report: Dict[str, Any], reports_dir: str = REPORTS_DIR) -> Dict[str, str]:
+    """
+    Save the run as JSON and JUnit XML; returns the file paths.
+    """
+    json_path = os.path.join(reports_dir, "report.json")
+    junit_path = os.path.join(reports_dir, "junit.xml")
+    write_json(json_path, report)
+    atomic_write(junit_path, to_junit_xml(report))
+    return {"json": json_path, "junit": junit_path}
+
+
+# ───────────────────────────────────────────────
+# 4️⃣ Command line (one process per run)
+# ───────────────────────────────────────────────
+def main() -> None:
+    """
+    Run a suite in this process, write its reports and print the report as
+    JSON on stdout (the tests' own output goes to stderr). The API runs every
+    suite this way, so generated code never executes in the API process.
+    """
+    parser = argparse.ArgumentParser(description="Run a generated Selenium suite and write its reports.")
+    parser.add_argument("script", help="generated suite to run")
+    parser.add_argument("--workers", type=int, default=RUNNER_WORKERS, help="browser sessions")
+    parser.add_argument("--driver", default="chrome", choices=sorted(DRIVER_FACTORIES))
+    parser.add_argument("--reports-dir", default=REPORTS_DIR, help="where report.json and junit.xml go")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_suite(args.script, args.workers, args.driver)
+        report["reports"] = write_reports(report, args.reports_dir)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
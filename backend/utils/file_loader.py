@@ -1,19 +1,143 @@
 import os
+from typing import Dict, Iterator, Optional
 
-def load_text_from_file(file_path: str) -> str:
+from backend.utils.log import logger
+
+# Plain text is streamed out in blocks of about this size, split on paragraph boundaries
+TEXT_BLOCK_CHARS = 1024 * 1024
+
+
+class Extractor:
     """
-    Loads text from supported document formats.
-    Currently supports .txt, .md; PDFs can be added later using PyPDF2 or pdfplumber.
+    Extracts a document's text page by page.
 
-    You can expand this based on what formats you plan to use.
+    `page_count` lets callers split one large document into page ranges that
+    are extracted in parallel; formats without pages report a single page.
     """
-    ext = os.path.splitext(file_path)[1].lower()
 
-    if ext in [".txt", ".md"]:
+    extensions: tuple = ()
+
+    def page_count(self, file_path: str) -> int:
+        return 1
+
+    def pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+
+def register_extractor(cls):
+    """
+    Class decorator: make an Extractor available for its file extensions.
+    """
+    extractor = cls()
+    for ext in cls.extensions:
+        EXTRACTORS[ext] = extractor
+    return cls
+
+
+def extractor_for(file_path: str) -> Optional[Extractor]:
+    return EXTRACTORS.get(os.path.splitext(file_path)[1].lower())
+
+
+@register_extractor
+class TextExtractor(Extractor):
+    extensions = (".txt", ".md")
+
+    def pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        # One logical page, yielded in paragraph-aligned blocks to bound memory
+        if start > 0:
+            return
+        block = []
+        size = 0
         with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+            for line in f:
+                block.append(line)
+                size += len(line)
+                # Prefer a blank line; hard-split runaway blocks without any
+                if (size >= TEXT_BLOCK_CHARS and not line.strip()) or size >= 4 * TEXT_BLOCK_CHARS:
+                    yield "".join(block)
+                    block, size = [], 0
+        if block:
+            yield "".join(block)
+
+
+@register_extractor
+class PDFExtractor(Extractor):
+    extensions = (".pdf",)
+
+    def page_count(self, file_path: str) -> int:
+        from pypdf import PdfReader
+
+        return len(PdfReader(file_path).pages)
 
-    else:
-        # For unsupported formats, just ignore for now
-        print(f"[Warning] Unsupported file format: {ext} ({file_path})")
+    def pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_path)
+        for number in range(start, min(stop or len(reader.pages), len(reader.pages))):
+            yield reader.pages[number].extract_text() or ""
+
+
+@register_extractor
+class DocxExtractor(Extractor):
+    extensions = (".docx",)
+
+    def pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        # .docx has no fixed pages: paragraphs, then tables row by row
+        from docx import Document
+
+        if start > 0:
+            return
+        document = Document(file_path)
+        paragraphs = [p.text for p in document.paragraphs if p.text.strip()]
+        for table in document.tables:
+            for row in table.rows:
+                paragraphs.append(" | ".join(cell.text.strip() for cell in row.cells))
+        yield "\n\n".join(paragraphs)
+
+
+HTML_TEXT_BLOCKS = ("h1", "h2", "h3", "h4", "p", "li", "dt", "dd", "td", "th", "pre")
+
+
+@register_extractor
+class HTMLDocExtractor(Extractor):
+    # .html uploads are UI pages; HTML documentation is uploaded as .htm / .xhtml
+    extensions = (".htm", ".xhtml")
+
+    def pages(self, file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        from lxml import html as lxml_html
+
+        if start > 0:
+            return
+        tree = lxml_html.parse(file_path)
+        for node in tree.xpath("//script | //style"):
+            node.drop_tree()
+        # Outermost text blocks only, so nested blocks are not repeated
+        tags = " or ".join(f"self::{tag}" for tag in HTML_TEXT_BLOCKS)
+        ancestors = " or ".join(f"ancestor::{tag}" for tag in HTML_TEXT_BLOCKS)
+        nodes = tree.xpath(f"//*[{tags}][not({ancestors})]")
+        blocks = (" ".join(node.text_content().split()) for node in nodes)
+        yield "\n\n".join(block for block in blocks if block)
+
+
+def extract_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> list:
+    """
+    Text of pages [start, stop) of a document; picklable entry point for process pools.
+    """
+    extractor = extractor_for(file_path)
+    return list(extractor.pages(file_path, start, stop)) if extractor else []
+
+
+def load_text_from_file(file_path: str) -> str:
+    """
+    Loads text from supported document formats (see EXTRACTORS: .txt, .md,
+    .pdf, .docx, .htm). Unsupported formats are skipped with a warning.
+    """
+    extractor = extractor_for(file_path)
+    if extractor is None:
+        ext = os.path.splitext(file_path)[1].lower()
+        logger.warning(f"Unsupported file format: {ext} ({file_path})")
         return ""
+    return "\n\n".join(extractor.pages(file_path))
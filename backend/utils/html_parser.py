@@ -1,24 +1,155 @@
+import io
+import os
 from bs4 import BeautifulSoup
+from lxml import etree
 
-def parse_html_structure(html_content: str):
+# "bs4" builds a full BeautifulSoup tree; "lxml" streams the document in a single pass
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "lxml")
+
+SUPPORTED_TAGS = ["input", "button", "select", "textarea", "a"]
+
+# Controls that a preceding <label> without a "for" attribute is attached to
+FORM_CONTROLS = {"input", "select", "textarea"}
+
+
+def _element_info(tag: str, attrs, text: str) -> dict:
     """
-    Parse HTML content to extract form fields, buttons, and inputs
-    used for generating selectors in Selenium test scripts.
+    Build the ui_elements entry shared by both parser backends.
     """
+    classes = attrs.get("class")
+    if isinstance(classes, list):
+        classes = " ".join(classes)
+    aria = {key: value for key, value in attrs.items() if key.startswith("aria-")}
+    return {
+        "tag": tag,
+        "id": attrs.get("id"),
+        "name": attrs.get("name"),
+        "type": attrs.get("type"),
+        "text": text,
+        "class": " ".join(classes.split()) if classes and classes.strip() else None,
+        "label": None,
+        "placeholder": attrs.get("placeholder"),
+        "data-testid": attrs.get("data-testid"),
+        "aria": aria or None,
+    }
+
+
+def _apply_for_labels(ui_elements: list, labels_for: dict) -> list:
+    # <label for="..."> wins over wrapping or preceding labels
+    for elem_info in ui_elements:
+        if elem_info["id"] in labels_for:
+            elem_info["label"] = labels_for[elem_info["id"]]
+    return ui_elements
+
+
+def _parse_bs4(html_content: str) -> list:
     soup = BeautifulSoup(html_content, "lxml")
-    
+
     ui_elements = []
-    supported_tags = ["input", "button", "select", "textarea", "a"]
-
-    for element in soup.find_all(supported_tags):
-        elem_info = {
-            "tag": element.name,
-            "id": element.get("id"),
-            "name": element.get("name"),
-            "type": element.get("type"),
-            "text": element.get_text(strip=True),
-            "class": " ".join(element.get("class")) if element.get("class") else None
-        }
+    labels_for = {}
+    pending_label = None
+
+    for element in soup.find_all(["label"] + SUPPORTED_TAGS):
+        if element.name == "label":
+            text = element.get_text(strip=True)
+            if element.get("for"):
+                labels_for.setdefault(element.get("for"), text)
+            elif not element.find(SUPPORTED_TAGS):
+                pending_label = text
+            continue
+
+        elem_info = _element_info(element.name, element.attrs, element.get_text(strip=True))
+        wrapping = element.find_parent("label")
+        if wrapping is not None and not wrapping.get("for"):
+            elem_info["label"] = wrapping.get_text(strip=True)
+        elif element.name in FORM_CONTROLS and pending_label is not None:
+            elem_info["label"] = pending_label
+            pending_label = None
         ui_elements.append(elem_info)
 
-    return ui_elements
+    return _apply_for_labels(ui_elements, labels_for)
+
+
+def _stripped_text(element) -> str:
+    # Same result as BeautifulSoup's get_text(strip=True)
+    return "".join(text.strip() for text in element.itertext() if text.strip())
+
+
+def _parse_lxml_stream(source) -> list:
+    """
+    Single-pass extraction with lxml's event parser. Subtrees that are not
+    inside a label or a supported element are discarded as soon as they end,
+    so memory stays bounded for very large pages.
+    """
+    ui_elements = []
+    labels_for = {}
+    pending_label = None
+    open_labels = []     # [for attribute, indexes of wrapped elements]
+    open_elements = []   # indexes of supported elements being parsed
+    tracked_depth = 0
+
+    for event, element in etree.iterparse(source, events=("start", "end"), html=True,
+                                          recover=True, huge_tree=True):
+        tag = element.tag.lower() if isinstance(element.tag, str) else None
+
+        if event == "start":
+            if tag == "label":
+                open_labels.append([element.get("for"), []])
+                tracked_depth += 1
+            elif tag in SUPPORTED_TAGS:
+                elem_info = _element_info(tag, element.attrib, "")
+                index = len(ui_elements)
+                if open_labels and not open_labels[-1][0]:
+                    open_labels[-1][1].append(index)
+                elif tag in FORM_CONTROLS and pending_label is not None:
+                    elem_info["label"] = pending_label
+                    pending_label = None
+                ui_elements.append(elem_info)
+                open_elements.append(index)
+                tracked_depth += 1
+            continue
+
+        if tag in SUPPORTED_TAGS:
+            ui_elements[open_elements.pop()]["text"] = _stripped_text(element)
+            tracked_depth -= 1
+        elif tag == "label":
+            label_for, wrapped = open_labels.pop()
+            text = _stripped_text(element)
+            if label_for:
+                labels_for.setdefault(label_for, text)
+            elif wrapped:
+                for index in wrapped:
+                    ui_elements[index]["label"] = text
+            else:
+                pending_label = text
+            tracked_depth -= 1
+
+        if tracked_depth == 0:
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+
+    return _apply_for_labels(ui_elements, labels_for)
+
+
+def parse_html_structure(html_content: str, backend: str = None):
+    """
+    Parse HTML content to extract form fields, buttons, and inputs
+    used for generating selectors in Selenium test scripts.
+    Labels, placeholder, data-testid and aria-* attributes are captured as well.
+    """
+    if (backend or HTML_PARSER_BACKEND) == "lxml":
+        return _parse_lxml_stream(io.BytesIO(html_content.encode("utf-8")))
+    return _parse_bs4(html_content)
+
+
+def parse_html_file(path: str, backend: str = None):
+    """
+    Same as parse_html_structure, reading from a file; the lxml backend
+    streams it from disk instead of loading it into memory first.
+    """
+    if (backend or HTML_PARSER_BACKEND) == "lxml":
+        return _parse_lxml_stream(path)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return _parse_bs4(f.read())
@@ -0,0 +1,70 @@
+import json
+import re
+from typing import Any, List, Optional
+
+from backend.utils.json_stream import JSONArrayItemStream
+
+_FENCE_RE = re.compile(r"^```[A-Za-z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def strip_fences(text: str) -> str:
+    return _FENCE_RE.sub("", text.strip())
+
+
+def _close_truncated(text: str) -> str:
+    """
+    Close the strings, objects and arrays left open by a truncated response,
+    after dropping a dangling key, ":" or "," at the cut.
+    """
+    stack = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?\s*$', r"\1", text.rstrip())
+    text = text.rstrip().rstrip(",:")
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort parse of almost-JSON LLM output: markdown fences, prose around
+    the JSON, trailing commas and truncated output are fixed. None if it is
+    still not valid JSON.
+    """
+    text = strip_fences(text)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    text = _TRAILING_COMMA_RE.sub(r"\1", text[start:])
+    end = max(text.rfind("}"), text.rfind("]"))
+    candidates = [text[:end + 1]] if end >= 0 else []
+    candidates.append(_close_truncated(text))
+    for candidate in candidates:
+        try:
+            return json.loads(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def salvage_items(text: str) -> List[Any]:
+    """
+    Every complete object inside a JSON array of `text`, even if the document
+    as a whole is invalid (e.g. a broken or truncated last item).
+    """
+    return JSONArrayItemStream().feed(strip_fences(text))
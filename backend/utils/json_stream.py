@@ -0,0 +1,63 @@
+import json
+from typing import Any, List
+
+
+class JSONArrayItemStream:
+    """
+    Incrementally extracts complete objects that are items of a JSON array
+    (e.g. each test case inside {"test_cases": [...]}) from streamed text.
+
+    Only the outermost array items are emitted; text outside JSON (markdown
+    fences, prose) is ignored. Consumed text is discarded, so memory stays
+    bounded by the size of the object currently being streamed.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self._start_depth = 0
+
+    def feed(self, text: str) -> List[Any]:
+        self._buffer += text
+        buf = self._buffer
+        items = []
+
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "{" and self._start is None and self._stack and self._stack[-1] == "[":
+                    self._start = i
+                    self._start_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._start is not None and len(self._stack) == self._start_depth:
+                    try:
+                        items.append(json.loads(buf[self._start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._start = None
+            i += 1
+
+        # Drop text that can no longer be part of an item
+        keep = self._start if self._start is not None else i
+        self._buffer = buf[keep:]
+        self._pos = i - keep
+        if self._start is not None:
+            self._start = 0
+        return items
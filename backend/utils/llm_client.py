@@ -1,14 +1,513 @@
-import google.generativeai as genai
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Type, Union
+from pydantic import BaseModel
+from backend.utils import metrics
+from backend.utils.prompt_compaction import parse_compact_element
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-class GeminiLLM:
-    def __init__(self):
+# Max LLM calls in flight per client, and per-call deadline (seconds, all retries included)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+# Client-side rate limit (calls/second, 0 = off) and burst size
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "0"))
+LLM_RATE_LIMIT_BURST = float(os.getenv("LLM_RATE_LIMIT_BURST", "0")) or None
+
+# Retries of quota (429) and transient errors: exponential backoff with full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# "gemini", "openai" (any OpenAI-compatible chat completions API) or "stub" (offline, deterministic)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+STUB_LLM_LATENCY_SECONDS = float(os.getenv("STUB_LLM_LATENCY_SECONDS", "0"))
+
+
+def gemini_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    A pydantic model as a Gemini response schema (the OpenAPI subset it accepts:
+    no $ref, defaults or titles; Optional[X] becomes a nullable X).
+    """
+    root = model.model_json_schema()
+    definitions = root.get("$defs", {})
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            return convert(definitions[node["$ref"].split("/")[-1]])
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            return dict(convert(options[0]), nullable=True)
+        schema = {"type": node["type"].upper()}
+        if node["type"] == "array":
+            schema["items"] = convert(node["items"])
+        elif node["type"] == "object" and "properties" in node:
+            schema["properties"] = {name: convert(prop) for name, prop in node["properties"].items()}
+            schema["required"] = node.get("required", [])
+        return schema
+
+    return convert(root)
+
+
+class LLMError(Exception):
+    """
+    An upstream error with its HTTP status and the Retry-After it asked for (seconds).
+    """
+
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """
+    Seconds to wait before retrying `exc` (0 = no preference), or None if it
+    is not worth retrying. Quota errors (429) and transient server errors are
+    retried; google.api_core errors carry their HTTP status as `code`.
+    """
+    status = getattr(exc, "status", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and status in RETRY_STATUSES:
+        return getattr(exc, "retry_after", None) or 0.0
+    if isinstance(exc, ConnectionError):
+        return 0.0
+    return None
+
+
+class TokenBucket:
+    """
+    Rate limiter: `rate` calls per second on average, bursts of up to `capacity`.
+    reserve() takes a token (going into debt when empty, so callers are served
+    in order) and returns how long the caller must wait. Thread-safe.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class BaseLLM:
+    """
+    Common interface for LLM clients.
+
+    Subclasses implement `generate` (blocking) and may override `_agenerate`
+    with a native async call. `agenerate` bounds how many calls run at once,
+    rate limits them (token bucket), retries quota and transient errors with
+    exponential backoff and full jitter, and gives up when the call's deadline
+    (`timeout`, covering every attempt) passes, so slow calls never block the
+    event loop. Identical prompts in flight at the same time share one
+    upstream call. `complete` is the blocking equivalent (not coalesced).
+
+    `schema` (a pydantic model) asks for JSON output of that shape; clients
+    whose model has no structured output mode ignore it.
+    """
+
+    model_name = "base"
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None,
+                 rate_limit: float = None, max_retries: int = None):
+        self.timeout = timeout or LLM_TIMEOUT_SECONDS
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self._slots = asyncio.Semaphore(max_concurrency or LLM_MAX_CONCURRENCY)
+        self._bucket = TokenBucket(LLM_RATE_LIMIT_RPS if rate_limit is None else rate_limit, LLM_RATE_LIMIT_BURST)
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.stats = {"calls": 0, "upstream_calls": 0, "coalesced": 0, "retries": 0,
+                      "rate_limited": 0, "throttled_seconds": 0.0}
+
+    def generate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        raise NotImplementedError
+
+    async def _agenerate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        # Fallback: run the blocking call on a worker thread
+        return await asyncio.to_thread(self.generate, prompt, schema)
+
+    def _retry_wait(self, exc: Exception, attempt: int) -> Optional[float]:
+        """
+        Backoff before retry number `attempt + 1`, or None to give up.
+        """
+        requested = retry_after(exc)
+        if requested is None or attempt >= self.max_retries:
+            return None
+        if getattr(exc, "status", None) == 429 or getattr(exc, "code", None) == 429:
+            self.stats["rate_limited"] += 1
+        backoff = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+        return max(requested, backoff)
+
+    def _record(self, started: float, exc: Exception = None) -> None:
+        """
+        Latency and outcome (ok, timeout, error) of one upstream attempt.
+        """
+        outcome = "ok" if exc is None else "timeout" if isinstance(exc, asyncio.TimeoutError) else "error"
+        metrics.LLM_REQUESTS.inc(model=self.model_name, outcome=outcome)
+        metrics.LLM_DURATION.observe(time.perf_counter() - started, model=self.model_name, outcome=outcome)
+
+    def _retried(self) -> None:
+        self.stats["retries"] += 1
+        metrics.LLM_RETRIES.inc(model=self.model_name)
+
+    def _reserve(self, now: float, deadline: float) -> float:
+        wait = self._bucket.reserve()
+        if now + wait >= deadline:
+            raise asyncio.TimeoutError()
+        self.stats["throttled_seconds"] += wait
+        return wait
+
+    async def _call(self, prompt: str, schema: Optional[Type[BaseModel]], deadline: float) -> str:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._reserve(loop.time(), deadline))
+            async with self._slots:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                self.stats["upstream_calls"] += 1
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(self._agenerate(prompt, schema), timeout=remaining)
+                except Exception as e:
+                    self._record(started, e)
+                    wait = self._retry_wait(e, attempt)
+                    if wait is None or loop.time() + wait >= deadline:
+                        raise
+                else:
+                    self._record(started)
+                    return response
+            # Back off without holding a concurrency slot
+            self._retried()
+            await asyncio.sleep(wait)
+
+    async def agenerate(self, prompt: str, schema: Optional[Type[BaseModel]] = None, timeout: float = None) -> str:
+        loop = asyncio.get_running_loop()
+        self.stats["calls"] += 1
+        key = (id(loop), prompt, schema)
+        call = self._inflight.get(key)
+        if call is None:
+            call = loop.create_task(self._call(prompt, schema, loop.time() + (timeout or self.timeout)))
+            self._inflight[key] = call
+            call.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded: one caller giving up does not cancel the others
+        return await asyncio.shield(call)
+
+    def complete(self, prompt: str, schema: Optional[Type[BaseModel]] = None, timeout: float = None) -> str:
+        """
+        Blocking generate with the rate limit, retries and deadline of agenerate.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._reserve(time.monotonic(), deadline))
+            self.stats["upstream_calls"] += 1
+            started = time.perf_counter()
+            try:
+                response = self.generate(prompt, schema)
+            except Exception as e:
+                self._record(started, e)
+                wait = self._retry_wait(e, attempt)
+                if wait is None or time.monotonic() + wait >= deadline:
+                    raise
+            else:
+                self._record(started)
+                return response
+            self._retried()
+            time.sleep(wait)
+
+    async def _astream(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> AsyncIterator[str]:
+        # Fallback: a single piece holding the whole response
+        yield await self._agenerate(prompt, schema)
+
+    async def astream(self, prompt: str, schema: Optional[Type[BaseModel]] = None,
+                      timeout: float = None) -> AsyncIterator[str]:
+        """
+        Yield the response text piece by piece as the model produces it.
+        Holds one concurrency slot for the whole stream; the deadline applies
+        to the stream as a whole. Errors are only retried until the first
+        piece has been yielded.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._reserve(loop.time(), deadline))
+            async with self._slots:
+                self.stats["upstream_calls"] += 1
+                pieces = self._astream(prompt, schema).__aiter__()
+                started, began = False, time.perf_counter()
+                try:
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            piece = await asyncio.wait_for(pieces.__anext__(), timeout=remaining)
+                        except StopAsyncIteration:
+                            self._record(began)
+                            return
+                        started = True
+                        yield piece
+                except Exception as e:
+                    self._record(began, e)
+                    wait = None if started else self._retry_wait(e, attempt)
+                    if wait is None or loop.time() + wait >= deadline:
+                        raise
+            self._retried()
+            await asyncio.sleep(wait)
+
+
+class GeminiLLM(BaseLLM):
+    model_name = "gemini-2.5-flash"  # as per your requirement
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None, **limits):
+        super().__init__(max_concurrency, timeout, **limits)
+        # Imported here: the SDK is slow to import and only needed by this provider
+        import google.generativeai as genai
+
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel("gemini-2.5-flash")  # as per your requirement
+        self._genai = genai
+        self.model = genai.GenerativeModel(self.model_name)
 
-    def generate(self, prompt: str):
-        response = self.model.generate_content(prompt)
+    def _config(self, schema: Optional[Type[BaseModel]]):
+        # JSON mode constrained to the schema (structured output)
+        if schema is None:
+            return None
+        return self._genai.GenerationConfig(response_mime_type="application/json", response_schema=gemini_schema(schema))
+
+    def generate(self, prompt: str, schema: Optional[Type[BaseModel]] = None):
+        response = self.model.generate_content(
+            prompt, generation_config=self._config(schema), request_options={"timeout": self.timeout}
+        )
+        return response.text
+
+    async def _agenerate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        response = await self.model.generate_content_async(
+            prompt, generation_config=self._config(schema), request_options={"timeout": self.timeout}
+        )
         return response.text
+
+    async def _astream(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(
+            prompt, stream=True, generation_config=self._config(schema), request_options={"timeout": self.timeout}
+        )
+        async for chunk in response:
+            yield chunk.text
+
+
+class OpenAICompatibleLLM(BaseLLM):
+    """
+    Any chat completions API in the OpenAI format (OpenAI, vLLM, Ollama, LM
+    Studio, ...) at OPENAI_BASE_URL, authenticated with OPENAI_API_KEY.
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None, base_url: str = None,
+                 model: str = None, api_key: str = None, **limits):
+        super().__init__(max_concurrency, timeout, **limits)
+        import requests
+
+        self.url = (base_url or OPENAI_BASE_URL).rstrip("/") + "/chat/completions"
+        self.model_name = model or OPENAI_MODEL
+        # One pooled session: connections are reused across calls
+        self.session = requests.Session()
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def generate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        body = {"model": self.model_name, "messages": [{"role": "user", "content": prompt}]}
+        if schema is not None:
+            body["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()},
+            }
+        response = self.session.post(self.url, json=body, timeout=self.timeout)
+        if response.status_code >= 400:
+            retry_after = response.headers.get("Retry-After")
+            raise LLMError(
+                f"{self.url} returned HTTP {response.status_code}: {response.text[:200]}",
+                status=response.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None,
+            )
+        return response.json()["choices"][0]["message"]["content"]
+
+
+class StubLLM(BaseLLM):
+    """
+    Offline, deterministic provider: reads the knowledge base JSON embedded in
+    the prompt (compact or verbose elements) and synthesizes one test case per identifiable UI element,
+    linked to the requirement sharing the most words with it. Titles listed
+    after the knowledge base (already generated) are skipped. For load tests
+    and end-to-end benchmarks without an API key or quota.
+    """
+
+    model_name = "stub"
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None, latency: float = None, **limits):
+        super().__init__(max_concurrency, timeout, **limits)
+        self.latency = STUB_LLM_LATENCY_SECONDS if latency is None else latency
+
+    @staticmethod
+    def _knowledge(prompt: str) -> tuple:
+        """
+        (knowledge dict, text after it) from "Knowledge Base:" onwards.
+        """
+        start = prompt.find("{", prompt.find("Knowledge Base:"))
+        knowledge, end = json.JSONDecoder().raw_decode(prompt, start)
+        return knowledge, prompt[end:]
+
+    @staticmethod
+    def _words(text: str) -> set:
+        return set(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+    def synthesize(self, prompt: str) -> Dict[str, Any]:
+        knowledge, rest = self._knowledge(prompt)
+        skip = {line[2:].strip() for line in rest.splitlines() if line.startswith("- ")}
+        requirements = knowledge.get("requirements", {})
+        if isinstance(requirements, list):
+            requirements = {req["id"]: req["text"] for req in requirements}
+        requirement_words = [(req_id, self._words(text)) for req_id, text in requirements.items()]
+
+        test_cases = []
+        for elem in knowledge.get("ui_elements", []):
+            if isinstance(elem, str):
+                elem = parse_compact_element(elem)
+            name = elem.get("id") or elem.get("name") or elem.get("text")
+            if not name:
+                continue
+            label = elem.get("label") or elem.get("placeholder") or name
+            title = f"Verify {label} ({name})"
+            if title in skip:
+                continue
+            words = self._words(" ".join(str(v) for v in elem.values() if isinstance(v, str)))
+            related = max(requirement_words, key=lambda req: len(req[1] & words), default=None)
+            if elem.get("tag") in ("input", "textarea"):
+                action = f"Enter a valid value in {name}"
+            elif elem.get("tag") == "select":
+                action = f"Select an option in {name}"
+            else:
+                action = f"Click {name}"
+            test_cases.append({
+                "test_id": f"TC_{len(test_cases) + 1:03d}",
+                "title": title,
+                "page": knowledge.get("page"),
+                "related_requirements": [related[0]] if related else [],
+                "used_elements": [name],
+                "preconditions": [f"User is on {knowledge.get('page') or 'the page'}"],
+                "steps": [f"Open {knowledge.get('page') or 'the page'}", action],
+                "expected_result": f"{label} behaves as the requirements describe",
+            })
+        return {"test_cases": test_cases}
+
+    def generate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        time.sleep(self.latency)
+        return json.dumps(self.synthesize(prompt))
+
+    async def _agenerate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        await asyncio.sleep(self.latency)
+        return json.dumps(self.synthesize(prompt))
+
+
+class FakeLLM(BaseLLM):
+    """
+    Local stand-in for GeminiLLM: returns a canned response after a fixed delay.
+    Useful for exercising the API and concurrency limits without network access.
+    A list of responses is returned one per call, repeating the last one.
+    """
+
+    model_name = "fake"
+
+    def __init__(self, response: Union[str, List[str]] = '{"test_cases": []}', latency: float = 0.0,
+                 max_concurrency: int = None, timeout: float = None, **limits):
+        super().__init__(max_concurrency, timeout, **limits)
+        self.response = response
+        self.latency = latency
+        self.calls = 0
+
+    def _next_response(self) -> str:
+        self.calls += 1
+        if isinstance(self.response, str):
+            return self.response
+        return self.response[min(self.calls, len(self.response)) - 1]
+
+    def generate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        response = self._next_response()
+        time.sleep(self.latency)
+        return response
+
+    async def _agenerate(self, prompt: str, schema: Optional[Type[BaseModel]] = None) -> str:
+        response = self._next_response()
+        await asyncio.sleep(self.latency)
+        return response
+
+    async def _astream(self, prompt: str, schema: Optional[Type[BaseModel]] = None, pieces: int = 8) -> AsyncIterator[str]:
+        # Spread the latency evenly over a few pieces of the canned response
+        response = self._next_response()
+        size = max(1, -(-len(response) // pieces))
+        for i in range(0, len(response), size):
+            await asyncio.sleep(self.latency / pieces)
+            yield response[i:i + size]
+
+
+LLM_PROVIDERS: Dict[str, Type[BaseLLM]] = {
+    "gemini": GeminiLLM,
+    "openai": OpenAICompatibleLLM,
+    "stub": StubLLM,
+    "fake": FakeLLM,
+}
+
+_llm: Optional[BaseLLM] = None
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> BaseLLM:
+    """
+    The process-wide client of LLM_PROVIDER, created on first use.
+    """
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                if LLM_PROVIDER not in LLM_PROVIDERS:
+                    raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'. Choose one of {sorted(LLM_PROVIDERS)}.")
+                _llm = LLM_PROVIDERS[LLM_PROVIDER]()
+    return _llm
+
+
+def set_llm(client: Optional[BaseLLM]) -> None:
+    """
+    Replace the process-wide client (e.g. with a FakeLLM); None resets it.
+    """
+    global _llm
+    with _llm_lock:
+        _llm = client
+
+
+def llm_stats() -> Dict[str, Any]:
+    """
+    Counters of the process-wide client, empty if it was never created.
+    """
+    if _llm is None:
+        return {}
+    return dict(_llm.stats, throttled_seconds=round(_llm.stats["throttled_seconds"], 3))
@@ -0,0 +1,55 @@
+"""
+Structured (one JSON object per line) logging, tagged with the ID of the
+HTTP request being served.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+
+# Log level of the "qa_agent" logger (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# X-Request-ID of the request being handled (set by the API middleware)
+request_id = contextvars.ContextVar("request_id", default=None)
+
+logger = logging.getLogger("qa_agent")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", None) or request_id.get()
+        if rid:
+            entry["request_id"] = rid
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging() -> None:
+    """
+    Send "qa_agent" logs as JSON lines to stderr (idempotent).
+    """
+    if any(isinstance(handler.formatter, JSONFormatter) for handler in logger.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log_event(message: str, level: int = logging.INFO, **fields) -> None:
+    """
+    Log `message` with extra JSON fields, e.g. log_event("request", status=200).
+    """
+    logger.log(level, message, extra={"fields": fields})
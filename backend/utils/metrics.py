@@ -0,0 +1,156 @@
+"""
+In-process metrics in the Prometheus text format (served at GET /metrics).
+
+Counters and histograms are per process: dedicated job workers
+(python -m backend.worker) keep their own, not visible from the API.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+# Seconds; fine at the low end for parsing / validation, up to multi-minute LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._format_labels(key)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observe the duration of the `with` block, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(key)} {_number(total)}"
+            yield f"{self.name}_count{self._format_labels(key)} {count}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """
+    Every metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# ───────────────────────────────────────────────
+# Metrics of the backend
+# ───────────────────────────────────────────────
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+
+INGEST_BYTES = Counter("ingest_bytes_total", "Bytes received by /ingest (bytes/s = rate of this / rate of ingest_duration_seconds_sum).")
+INGEST_FILES = Counter("ingest_files_total", "Files received by /ingest by outcome.", ("outcome",))
+INGEST_DURATION = Histogram("ingest_duration_seconds", "Time to receive, extract and parse one /ingest upload.")
+HTML_PARSE_DURATION = Histogram("html_parse_duration_seconds", "Time to parse one HTML page.")
+HTML_ELEMENTS = Counter("html_elements_parsed_total", "UI elements extracted from HTML pages.")
+EXTRACT_DURATION = Histogram("document_extract_duration_seconds", "Time to extract the text of the changed documents of an upload.")
+
+PROMPT_CHARS = Histogram("prompt_chars", "Characters per test case generation prompt.", buckets=tuple(b * 4 for b in SIZE_BUCKETS))
+PROMPT_TOKENS = Histogram("prompt_tokens", "Estimated tokens per test case generation prompt.", buckets=SIZE_BUCKETS)
+
+LLM_REQUESTS = Counter("llm_requests_total", "Upstream LLM calls by outcome (ok, error, timeout).", ("model", "outcome"))
+LLM_DURATION = Histogram("llm_request_duration_seconds", "Latency of one upstream LLM call.", ("model", "outcome"))
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after a quota or transient error.", ("model",))
+
+LLM_RESPONSES = Counter("llm_responses_total", "Parsed LLM responses by status (ok, repaired, salvaged, failed).", ("status",))
+RESPONSE_PARSE_DURATION = Histogram("llm_response_parse_duration_seconds", "Time to parse and repair one LLM response.")
+VALIDATION_DURATION = Histogram("test_case_validation_duration_seconds", "Time to validate the test cases of one result.")
+DEDUP_REMOVED = Counter("test_cases_deduplicated_total", "Near-duplicate test cases merged or dropped.", ("mode",))
+COVERAGE_DURATION = Histogram("coverage_analysis_duration_seconds", "Time to analyze requirement coverage and step grounding.")
+
+SCRIPT_GENERATION_DURATION = Histogram("script_generation_duration_seconds", "Time to generate one Selenium module.", ("mode",))
+JOB_DURATION = Histogram("job_duration_seconds", "Background job run time.", ("kind", "status"))
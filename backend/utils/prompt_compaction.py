@@ -0,0 +1,142 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Attributes that may be dropped (in this order) when a prompt is over its token budget;
+# identifiers (id, name, text) and tag/type are always kept
+OPTIONAL_ATTRIBUTES = ("class", "aria", "data-testid", "placeholder", "label")
+
+_BARE_VALUE_RE = re.compile(r"^[\w.:/@+-]+$")
+_ATTRIBUTE_RE = re.compile(r'([\w-]+)=("(?:[^"\\]|\\.)*"|\S+)')
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Token estimate
+# ───────────────────────────────────────────────
+def estimate_tokens(text: str) -> int:
+    """
+    Local estimate of LLM tokens: one per punctuation mark and one per ~4
+    characters of each word, which tracks BPE tokenizers closely enough for
+    budgeting without downloading a vocabulary.
+    """
+    return sum(-(-len(token) // 4) for token in _TOKEN_RE.findall(text))
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Compact element notation
+# ───────────────────────────────────────────────
+def _value(value: Any) -> str:
+    value = str(value)
+    return value if _BARE_VALUE_RE.match(value) else json.dumps(value, ensure_ascii=False)
+
+
+def compact_element(elem: Dict[str, Any], drop: Tuple[str, ...] = ()) -> str:
+    """
+    One-line notation of a UI element, e.g.
+    `input#emailInput type=email label="Email:"`: tag, "#id", then every
+    non-empty attribute as key=value (quoted when needed), aria-* flattened.
+    The page is left out (a prompt covers a single page).
+    """
+    parts = [str(elem.get("tag") or "element") + (f"#{elem['id']}" if elem.get("id") else "")]
+    for key, value in elem.items():
+        if key in ("tag", "id", "page") or key in drop or value in (None, "", [], {}):
+            continue
+        if isinstance(value, dict):
+            parts.extend(f"{sub}={_value(v)}" for sub, v in value.items() if v not in (None, ""))
+        else:
+            parts.append(f"{key}={_value(value)}")
+    return " ".join(parts)
+
+
+def parse_compact_element(notation: str) -> Dict[str, Any]:
+    """
+    Inverse of compact_element (aria-* attributes come back as top-level keys).
+    """
+    head, _, rest = notation.partition(" ")
+    tag, _, elem_id = head.partition("#")
+    elem = {"tag": tag, "id": elem_id or None}
+    for key, value in _ATTRIBUTE_RE.findall(rest):
+        elem[key] = json.loads(value) if value.startswith('"') else value
+    return elem
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Requirement de-duplication
+# ───────────────────────────────────────────────
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def dedup_requirements(requirements: List[Dict[str, str]]) -> Dict[str, str]:
+    """
+    {chunk id: text} without paragraphs already seen in an earlier chunk
+    (e.g. the same rule pasted in several documents); chunks left empty are dropped.
+    """
+    seen = set()
+    compacted = {}
+    for chunk in requirements:
+        paragraphs = []
+        for paragraph in chunk["text"].split("\n\n"):
+            key = _normalise(paragraph)
+            if key and key not in seen:
+                seen.add(key)
+                paragraphs.append(paragraph.strip())
+        if paragraphs:
+            compacted[chunk["id"]] = "\n\n".join(paragraphs)
+    return compacted
+
+
+# ───────────────────────────────────────────────
+# 4️⃣ Budget
+# ───────────────────────────────────────────────
+def compact_knowledge(page: str, requirements: List[Dict[str, str]], ui_elements: List[Dict[str, Any]],
+                      budget: Optional[int] = None, overhead: int = 0) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Compact prompt knowledge for one page and a report of what it cost.
+
+    Nulls are stripped, repeated requirement text removed and elements written
+    in compact notation. If the estimate (plus `overhead` tokens of prompt
+    template) is still over `budget`, optional element attributes are dropped
+    first, then the last requirement chunks, then the last chunk is truncated.
+    UI elements themselves are never dropped; `over_budget` reports a prompt
+    that still does not fit.
+    """
+    def size(knowledge: Dict[str, Any]) -> int:
+        return overhead + estimate_tokens(json.dumps(knowledge, ensure_ascii=False, separators=(",", ":")))
+
+    verbose = {
+        "page": page,
+        "requirements": requirements,
+        "ui_elements": [{k: v for k, v in elem.items() if k != "page"} for elem in ui_elements],
+    }
+    report = {"tokens_before": overhead + estimate_tokens(json.dumps(verbose, indent=2)), "dropped": []}
+
+    reqs = dedup_requirements(requirements)
+    report["duplicate_chunks"] = len(requirements) - len(reqs)
+    knowledge = {"page": page, "requirements": reqs, "ui_elements": [compact_element(elem) for elem in ui_elements]}
+
+    if budget:
+        drop = ()
+        for attribute in OPTIONAL_ATTRIBUTES:
+            if size(knowledge) <= budget:
+                break
+            drop += (attribute,)
+            elements = [compact_element(elem, drop) for elem in ui_elements]
+            if elements != knowledge["ui_elements"]:
+                knowledge["ui_elements"] = elements
+                report["dropped"].append(f"attribute:{attribute}")
+        while size(knowledge) > budget and len(reqs) > 1:
+            chunk_id = list(reqs)[-1]
+            del reqs[chunk_id]
+            report["dropped"].append(chunk_id)
+        if size(knowledge) > budget and reqs:
+            # Truncate the remaining chunk to what is left of the budget (~4 chars per token)
+            chunk_id = next(iter(reqs))
+            spare = budget - size(dict(knowledge, requirements={chunk_id: ""}))
+            reqs[chunk_id] = reqs[chunk_id][:max(0, spare) * 4]
+            report["dropped"].append(f"truncated:{chunk_id}")
+
+    report["tokens_after"] = size(knowledge)
+    report["over_budget"] = bool(budget) and report["tokens_after"] > budget
+    return knowledge, report
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+from backend.services.storage import DATA_DIR
+
+# On-disk cache of LLM results; SQLite (WAL) keeps it safe across uvicorn workers
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DATA_DIR, "cache", "llm_cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CACHE_MAX_AGE_SECONDS = float(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Content-address a set of JSON-serialisable parts (order-insensitive for dict keys).
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent key -> JSON cache with age and size based (LRU) eviction.
+    Every call opens its own connection, so one instance is safe to share
+    between threads, and several processes can use the same file.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES, max_age: float = CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+        # Counters of the callers (generation stats), kept apart so clear() leaves them alone
+        conn.execute("CREATE TABLE IF NOT EXISTS usage_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row is None:
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        payload = json.dumps(value, separators=(",", ":"))
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.max_age,))
+        # Keep the most recently used entries that fit both the count and byte limits
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM ("
+            "  SELECT key,"
+            "   ROW_NUMBER() OVER (ORDER BY accessed_at DESC) AS rank,"
+            "   SUM(size) OVER (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING) AS running"
+            "  FROM entries)"
+            " WHERE rank > ? OR running > ?)",
+            (self.max_entries, self.max_bytes),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {"hits": counters["hits"], "misses": counters["misses"], "entries": entries, "bytes": size}
+        finally:
+            conn.close()
+
+    def count(self, **deltas: int) -> None:
+        """
+        Add to named usage counters, created on first use (e.g. count(llm_calls=2)).
+        """
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO usage_counters VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(deltas.items()),
+            )
+        finally:
+            conn.close()
+
+    def counters(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT name, value FROM usage_counters").fetchall())
+        finally:
+            conn.close()
+
+    def clear(self) -> None:
+        """
+        Drop all entries and reset hits/misses; usage counters are kept.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM entries")
+            conn.execute("UPDATE counters SET value = 0 WHERE name IN ('hits', 'misses')")
+        finally:
+            conn.close()
+
+
+# Shared cache for the backend
+response_cache = ResponseCache()
@@ -0,0 +1,46 @@
+"""
+Explicit-wait helpers shared by generated Selenium suites.
+
+generate_scripts(mode="explicit") copies this file next to the generated
+script, which imports it as `selenium_helpers`. Every interaction waits for
+the element's expected condition instead of sleeping for a fixed time.
+"""
+import os
+
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+DEFAULT_TIMEOUT = 10
+POLL_FREQUENCY = 0.1
+
+
+def _wait(driver, timeout):
+    return WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY)
+
+
+def wait_for_page(driver, timeout=DEFAULT_TIMEOUT):
+    _wait(driver, timeout).until(
+        lambda d: d.execute_script("return document.readyState") == "complete"
+    )
+
+
+def open_page(driver, path, timeout=DEFAULT_TIMEOUT):
+    driver.get(f"file:///{os.path.abspath(path)}")
+    wait_for_page(driver, timeout)
+
+
+def find(driver, by, value, timeout=DEFAULT_TIMEOUT):
+    return _wait(driver, timeout).until(EC.presence_of_element_located((by, value)))
+
+
+def click(driver, by, value, timeout=DEFAULT_TIMEOUT):
+    element = _wait(driver, timeout).until(EC.element_to_be_clickable((by, value)))
+    element.click()
+    return element
+
+
+def fill(driver, by, value, text, timeout=DEFAULT_TIMEOUT):
+    element = _wait(driver, timeout).until(EC.visibility_of_element_located((by, value)))
+    element.clear()
+    element.send_keys(text)
+    return element
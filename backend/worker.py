@@ -0,0 +1,63 @@
+"""
+Dedicated job worker for generation jobs queued by the API.
+
+    python -m backend.worker --processes 4
+
+Each process claims jobs from the shared SQLite queue (JOBS_DB_PATH) and runs
+up to JOB_CONCURRENCY of them at once; set JOB_WORKERS=0 on the API to leave
+all jobs to these workers.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backend.services.jobs import JOB_POLL_SECONDS, job_store, worker_loop, worker_name
+from backend.utils.log import configure_logging
+
+
+def run_worker(poll: float = JOB_POLL_SECONDS) -> None:
+    # SIGTERM behaves like Ctrl+C: the running job is put back in the queue
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    configure_logging()
+
+    async def main():
+        await worker_loop(job_store, worker_name("worker"), asyncio.Event(), poll)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background generation job workers.")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--poll", type=float, default=JOB_POLL_SECONDS, help="seconds between queue polls")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.poll)
+        return
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    processes = [multiprocessing.Process(target=run_worker, args=(args.poll,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
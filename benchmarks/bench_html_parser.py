@@ -0,0 +1,80 @@
+"""
+Compare the BeautifulSoup and streaming lxml backends of parse_html_file
+on large generated pages.
+
+    python -m benchmarks.bench_html_parser --elements 20000 50000 --filler 20
+
+Each backend runs in a fresh process so peak RSS is measured independently.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from backend.utils.html_parser import parse_html_file
+from benchmarks.common import max_rss_mb, run_isolated
+
+
+def write_fixture(path: str, elements: int, filler: int) -> None:
+    """
+    A page with `elements` labelled form controls, each surrounded by
+    `filler` nested non-interactive divs (typical SPA markup).
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html><html><head><title>Bench</title></head><body><form>\n")
+        for i in range(elements):
+            f.write("<div class='row'>" * filler)
+            if i % 3 == 0:
+                f.write(f"<label for='field{i}'>Field {i}</label>"
+                        f"<input id='field{i}' name='f{i}' type='text' placeholder='Value {i}' "
+                        f"data-testid='field-{i}' aria-required='true' class='input wide'>")
+            elif i % 3 == 1:
+                f.write(f"<label>Choice {i}<select name='s{i}'><option>A</option><option>B</option></select></label>")
+            else:
+                f.write(f"<button id='btn{i}' class='btn' aria-label='Action {i}'>Action <span>{i}</span></button>")
+            f.write("<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>" + "</div>" * filler + "\n")
+        f.write("</form></body></html>\n")
+
+
+def _run(path: str, backend: str, queue) -> None:
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    ui_elements = parse_html_file(path, backend=backend)
+    elapsed = time.perf_counter() - start
+    queue.put({
+        "backend": backend,
+        "seconds": round(elapsed, 3),
+        "elements": len(ui_elements),
+        "peak_rss_mb": round(max_rss_mb(), 1),
+        "rss_growth_mb": round(max_rss_mb() - baseline, 1),
+    })
+
+
+def measure(path: str, backend: str) -> dict:
+    return run_isolated(_run, path, backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--filler", type=int, default=10, help="nested divs around each element")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for elements in args.elements:
+            path = os.path.join(tmp, f"page_{elements}.html")
+            write_fixture(path, elements, args.filler)
+            size_mb = round(os.path.getsize(path) / (1024 * 1024), 1)
+            for backend in ("bs4", "lxml"):
+                result = measure(path, backend)
+                result.update({"fixture_elements": elements, "fixture_mb": size_mb})
+                results.append(result)
+                print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
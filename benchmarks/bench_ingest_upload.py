@@ -0,0 +1,206 @@
+"""
+Peak RSS and throughput of receiving a large upload in /ingest.
+
+    python -m benchmarks.bench_ingest_upload --mb 300 [--check]
+
+Scenarios (each in a fresh process, reading the same on-disk upload):
+  read_all          the previous approach: await file.read(), hash, write
+  stream            save_upload: chunked write + hash while streaming
+  ingest_unchanged  ingest_files re-uploading an unchanged document
+                    (streamed, hashed and skipped without being held in memory)
+  app               POST /ingest through the ASGI app (middleware, multipart
+                    parsing, ingest_files) with a chunked body, no Content-Length;
+                    then over-limit uploads, chunked and with Content-Length
+
+With --check, assert that the app accepts the upload within CHECK_RSS_GROWTH_MB
+of peak RSS growth, and answers over-limit uploads with 413 without reading
+their whole body.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from starlette.datastructures import UploadFile
+
+from benchmarks.common import max_rss_mb, run_isolated
+
+SCENARIOS = ("read_all", "stream", "ingest_unchanged", "app")
+CHUNK = 1024 * 1024
+# Peak RSS growth allowed by --check, far below the default 300 MiB upload
+CHECK_RSS_GROWTH_MB = 64
+
+
+def write_fixture(path: str, mb: int) -> str:
+    """
+    A text document of `mb` MiB, written (and hashed) in 1 MiB pieces. Returns its sha256.
+    """
+    line = "The order total must include taxes and shipping before payment.\n"
+    block = (line * (CHUNK // len(line) + 1))[:CHUNK].encode()
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        for _ in range(mb):
+            f.write(block)
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def _multipart(boundary: str, files: list, sent: dict):
+    """
+    A multipart/form-data body streamed in CHUNK pieces from `files`, [(field filename, path, repeat)];
+    counts the bytes handed to the app in sent["bytes"].
+    """
+    for filename, path, repeat in files:
+        head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+                f"Content-Type: application/octet-stream\r\n\r\n").encode()
+        sent["bytes"] += len(head)
+        yield head
+        for _ in range(repeat):
+            with open(path, "rb") as f:
+                while chunk := f.read(CHUNK):
+                    sent["bytes"] += len(chunk)
+                    yield chunk
+        sent["bytes"] += 2
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+async def _post_ingest(client, files: list, headers: dict = None) -> tuple:
+    """
+    POST `files` to /ingest as a streamed multipart body. Returns (response, bytes sent).
+    """
+    boundary = "bench-boundary"
+    sent = {"bytes": 0}
+    response = await client.post(
+        "/ingest", params={"project_id": "bench"}, content=_multipart(boundary, files, sent),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}", **(headers or {})},
+    )
+    return response, sent["bytes"]
+
+
+async def _app_scenario(path: str, size: int) -> dict:
+    from backend.main import app
+
+    html = os.path.join(os.path.dirname(path), "checkout.html")
+    with open(html, "w") as f:
+        f.write('<html><body><button id="pay">Pay</button></body></html>')
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=None) as client:
+        # An unsupported format is stored without extraction, so only receiving the upload is measured
+        response, _ = await _post_ingest(client, [("checkout.html", html, 1), ("assets.bin", path, 1)])
+        assert response.status_code == 200, response.text
+        result = {"status": response.status_code, "app_peak_rss_mb": round(max_rss_mb(), 1)}
+
+        limit = int(os.environ["MAX_UPLOAD_REQUEST_BYTES"])
+        response, sent = await _post_ingest(client, [("assets.bin", path, 2)])
+        result["chunked_over_limit"] = {"status": response.status_code, "sent_mb": round(sent / CHUNK, 1),
+                                        "body_mb": round(2 * size / CHUNK, 1)}
+
+        response, sent = await _post_ingest(client, [("assets.bin", path, 2)],
+                                            headers={"Content-Length": str(limit + 1)})
+        result["content_length_over_limit"] = {"status": response.status_code, "sent_mb": round(sent / CHUNK, 1)}
+    return result
+
+
+async def _scenario(path: str, scenario: str, digest: str, size: int) -> dict:
+    from backend.services.ingestion import ingest_files, save_upload
+
+    if scenario == "app":
+        return await _app_scenario(path, size)
+
+    upload_dir = os.path.join(os.path.dirname(path), "uploads")
+    with open(path, "rb") as f:
+        upload = UploadFile(file=f, filename="spec.txt")
+        if scenario == "read_all":
+            content = await upload.read()
+            hashlib.sha256(content).hexdigest()
+            os.makedirs(upload_dir, exist_ok=True)
+            with open(os.path.join(upload_dir, "spec.txt"), "wb") as out:
+                out.write(content)
+        elif scenario == "stream":
+            tmp_path, _, _ = await save_upload(upload, upload_dir, max_bytes=size)
+            os.replace(tmp_path, os.path.join(upload_dir, "spec.txt"))
+        else:
+            existing = {
+                "requirements": [], "chunks": [], "ui_elements": [], "pages": {},
+                "documents": {
+                    "spec.txt": {"sha256": digest, "kind": "doc", "size": size},
+                    "checkout.html": {"sha256": "0" * 64, "kind": "html", "size": 0},
+                },
+            }
+            knowledge = await ingest_files([upload], existing, project_id="bench")
+            assert knowledge["last_ingest"]["unchanged"] == ["spec.txt"]
+    return {}
+
+
+def _run(path: str, scenario: str, digest: str, size: int, queue) -> None:
+    # Imported up front, so the baseline covers the app and growth is the upload alone
+    import backend.main  # noqa: F401
+
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    extra = asyncio.run(_scenario(path, scenario, digest, size))
+    elapsed = time.perf_counter() - start
+    # The app scenario reports the peak right after its accepted upload
+    peak = extra.pop("app_peak_rss_mb", None) or max_rss_mb()
+    queue.put({
+        "scenario": scenario,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / CHUNK / elapsed, 1),
+        "peak_rss_mb": round(peak, 1),
+        "rss_growth_mb": round(peak - baseline, 1),
+        **extra,
+    })
+
+
+def check(result: dict, limit: int) -> None:
+    """
+    Asserts for --check on the app scenario: bounded memory and early 413s.
+    """
+    assert result["status"] == 200, result
+    assert result["rss_growth_mb"] < CHECK_RSS_GROWTH_MB, \
+        f"peak RSS grew {result['rss_growth_mb']} MB for a {result['upload_mb']} MB upload"
+    chunked = result["chunked_over_limit"]
+    assert chunked["status"] == 413, chunked
+    # Rejected once past the limit, give or take the chunk in flight
+    assert chunked["sent_mb"] * CHUNK <= limit + 2 * CHUNK < chunked["body_mb"] * CHUNK, chunked
+    declared = result["content_length_over_limit"]
+    assert declared == {"status": 413, "sent_mb": 0}, declared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=int, nargs="+", default=[300])
+    parser.add_argument("--check", action="store_true", help="assert memory and 413s of the app scenario")
+    args = parser.parse_args()
+
+    results = []
+    for mb in args.mb:
+        with tempfile.TemporaryDirectory() as tmp:
+            # ingest_files writes project files under DATA_DIR; keep them in the temp dir
+            os.environ["DATA_DIR"] = tmp
+            path = os.path.join(tmp, "spec.txt")
+            digest = write_fixture(path, mb)
+            size = os.path.getsize(path)
+            # Raise the limits so the fixture is accepted, plus room for the HTML page and multipart framing
+            limit = size + CHUNK
+            os.environ["MAX_UPLOAD_FILE_BYTES"] = str(size)
+            os.environ["MAX_UPLOAD_REQUEST_BYTES"] = str(limit)
+            for scenario in ("app",) if args.check else SCENARIOS:
+                result = run_isolated(_run, path, scenario, digest, size)
+                result.update({"upload_mb": mb})
+                results.append(result)
+                print(json.dumps(result))
+                if args.check:
+                    check(result, limit)
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare load time and peak RSS of the JSON and SQLite knowledge base backends.
+
+    python -m benchmarks.bench_knowledge_store --elements 10000 100000
+
+Scenarios (each in a fresh process):
+  json_full       parse knowledge.json (what every request did before)
+  sqlite_full     open knowledge.sqlite3 and read every section
+  sqlite_elements read only pages + ui_elements (selector index rebuild)
+  sqlite_page     read the elements of a single page (script generation)
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from backend.services.knowledge_db import load_knowledge_db, save_knowledge_db
+from backend.services.storage import read_json, write_json
+from benchmarks.common import max_rss_mb, run_isolated
+
+ELEMENTS_PER_PAGE = 500
+SCENARIOS = ("json_full", "sqlite_full", "sqlite_elements", "sqlite_page")
+
+
+def make_knowledge(elements: int) -> dict:
+    """
+    Synthetic knowledge base: `elements` UI elements over pages of 500 and
+    one ~800 character requirement chunk per 10 elements.
+    """
+    pages = {}
+    ui_elements = []
+    for i in range(elements):
+        page = f"page{i // ELEMENTS_PER_PAGE}.html"
+        pages.setdefault(page, {"path": f"backend/data/pages/{page}", "elements": 0})["elements"] += 1
+        ui_elements.append({
+            "tag": "input", "id": f"field{i}", "name": f"f{i}", "type": "text", "text": None,
+            "class": "input wide", "label": f"Field {i}", "placeholder": f"Value {i}",
+            "data-testid": f"field-{i}", "aria": {"required": "true"}, "page": page,
+        })
+    sentence = "The checkout form must validate every field before the order is submitted. "
+    chunks = [
+        {"id": f"spec.txt#{i}", "source": "spec.txt", "text": f"Requirement {i}. " + sentence * 10}
+        for i in range(max(1, elements // 10))
+    ]
+    return {
+        "requirements": ["\n\n".join(chunk["text"] for chunk in chunks)],
+        "chunks": chunks,
+        "ui_elements": ui_elements,
+        "pages": pages,
+        "documents": {"spec.txt": {"sha256": "0" * 64, "kind": "doc", "size": 0}},
+    }
+
+
+def _run(directory: str, scenario: str, queue) -> None:
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    if scenario == "json_full":
+        knowledge = read_json(os.path.join(directory, "knowledge.json"))
+        touched = len(knowledge["ui_elements"])
+    else:
+        knowledge = load_knowledge_db(os.path.join(directory, "knowledge.sqlite3"))
+        if scenario == "sqlite_full":
+            touched = sum(len(knowledge[key]) for key in knowledge)
+        elif scenario == "sqlite_elements":
+            touched = len(knowledge["pages"]) + len(knowledge["ui_elements"])
+        else:
+            touched = len(knowledge.page_elements("page0.html"))
+    elapsed = time.perf_counter() - start
+    queue.put({
+        "scenario": scenario,
+        "seconds": round(elapsed, 3),
+        "items": touched,
+        "peak_rss_mb": round(max_rss_mb(), 1),
+        "rss_growth_mb": round(max_rss_mb() - baseline, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    results = []
+    for elements in args.elements:
+        with tempfile.TemporaryDirectory() as tmp:
+            knowledge = make_knowledge(elements)
+            write_json(os.path.join(tmp, "knowledge.json"), knowledge)
+            save_knowledge_db(os.path.join(tmp, "knowledge.sqlite3"), knowledge)
+            del knowledge
+            sizes = {
+                "json_mb": round(os.path.getsize(os.path.join(tmp, "knowledge.json")) / (1024 * 1024), 1),
+                "sqlite_mb": round(os.path.getsize(os.path.join(tmp, "knowledge.sqlite3")) / (1024 * 1024), 1),
+            }
+            for scenario in SCENARIOS:
+                result = run_isolated(_run, tmp, scenario)
+                result.update({"fixture_elements": elements, **sizes})
+                results.append(result)
+                print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
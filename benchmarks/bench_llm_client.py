@@ -0,0 +1,165 @@
+"""
+Exercise the LLM client's retries, rate limiting and request coalescing:
+OpenAICompatibleLLM against the local fake LLM server (429s and latency injected).
+
+    python -m benchmarks.bench_llm_client --requests 40 --max-rps 5 --error-rate 0.1
+
+Scenarios (the same burst of concurrent requests each):
+  no_retries    max_retries=0: every 429 is a failed call
+  backoff       exponential backoff with jitter, honouring Retry-After
+  rate_limited  backoff + a client token bucket just under the server's limit
+  coalesced     backoff, but only --distinct different prompts in the burst
+
+With --check, assert the client's behaviour against the fake server instead:
+429s are retried after Retry-After, per-call deadlines raise, and identical
+concurrent prompts reach the server once.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from backend.utils.llm_client import BaseLLM, OpenAICompatibleLLM
+from benchmarks.common import percentiles
+from benchmarks.fake_llm_server import start_server
+
+
+async def _burst(client: BaseLLM, prompts: list) -> dict:
+    latencies, failures = [], 0
+
+    async def one(prompt: str):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await client.agenerate(prompt)
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(prompt) for prompt in prompts))
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "succeeded": len(latencies),
+        "failed": failures,
+        **{name: round(value, 3) for name, value in percentiles(latencies).items() if value is not None},
+    }
+
+
+def _client(server, **options) -> OpenAICompatibleLLM:
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return OpenAICompatibleLLM(options.pop("max_concurrency", 8), options.pop("timeout", 30),
+                               base_url=base_url, model="fake", **options)
+
+
+async def _timed(client: BaseLLM, prompt: str) -> float:
+    start = time.perf_counter()
+    await client.agenerate(prompt)
+    return time.perf_counter() - start
+
+
+async def check_retry_after(retry_after: float = 1.0) -> dict:
+    """
+    With a 1 request/s server, the second of two concurrent prompts is
+    refused with 429 and succeeds once retried, no sooner than Retry-After.
+    """
+    server = start_server(max_rps=1, retry_after=retry_after)
+    try:
+        client = _client(server, max_retries=3)
+        durations = sorted(await asyncio.gather(_timed(client, "first"), _timed(client, "second")))
+        assert server.counters["rate_limited"] >= 1, server.counters
+        assert server.counters["ok"] == 2, server.counters
+        assert client.stats["retries"] >= 1 and client.stats["rate_limited"] >= 1, client.stats
+        assert durations[1] >= retry_after, f"retried after {durations[1]:.3f}s, Retry-After is {retry_after}s"
+        return {"check": "retry_after", "seconds": [round(d, 3) for d in durations], "server": dict(server.counters)}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+async def check_deadline(latency: float = 1.0, timeout: float = 0.2) -> dict:
+    """
+    A call slower than the client's per-call timeout raises TimeoutError at the deadline.
+    """
+    server = start_server(latency=latency)
+    try:
+        client = _client(server, timeout=timeout, max_retries=3)
+        start = time.perf_counter()
+        try:
+            await client.agenerate("slow")
+        except asyncio.TimeoutError:
+            seconds = time.perf_counter() - start
+        else:
+            raise AssertionError(f"a {latency}s call did not time out after {timeout}s")
+        assert seconds < latency, f"timed out after {seconds:.3f}s, deadline was {timeout}s"
+        return {"check": "deadline", "seconds": round(seconds, 3)}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+async def check_coalescing(callers: int = 10) -> dict:
+    """
+    Identical prompts in flight at the same time make a single upstream request.
+    """
+    server = start_server(latency=0.2)
+    try:
+        client = _client(server)
+        responses = await asyncio.gather(*(client.agenerate("same prompt") for _ in range(callers)))
+        assert len(set(responses)) == 1, responses
+        assert server.counters["requests"] == 1, server.counters
+        assert client.stats["coalesced"] == callers - 1, client.stats
+        return {"check": "coalescing", "callers": callers, "server": dict(server.counters)}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_checks() -> list:
+    results = []
+    for check in (check_retry_after, check_deadline, check_coalescing):
+        result = asyncio.run(check())
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--distinct", type=int, default=5, help="different prompts in the coalesced scenario")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--max-rps", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--check", action="store_true", help="assert retries, deadlines and coalescing, then exit")
+    args = parser.parse_args()
+    if args.check:
+        return run_checks()
+
+    scenarios = {
+        "no_retries": ({"max_retries": 0}, args.requests),
+        "backoff": ({"max_retries": 6}, args.requests),
+        "rate_limited": ({"max_retries": 6, "rate_limit": args.max_rps * 0.9}, args.requests),
+        "coalesced": ({"max_retries": 6}, args.distinct),
+    }
+    results = []
+    for scenario, (options, distinct) in scenarios.items():
+        server = start_server(latency=args.latency, error_rate=args.error_rate,
+                              max_rps=args.max_rps, retry_after=args.retry_after)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        client = OpenAICompatibleLLM(args.concurrency, 120, base_url=base_url, model="fake", **options)
+        prompts = [f"prompt {i % distinct}" for i in range(args.requests)]
+        result = {"scenario": scenario, **asyncio.run(_burst(client, prompts))}
+        result["client"] = dict(client.stats, throttled_seconds=round(client.stats["throttled_seconds"], 3))
+        result["server"] = dict(server.counters)
+        server.shutdown()
+        server.server_close()
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+End-to-end pipeline benchmark: the FastAPI app driven in-process against the
+offline stub LLM, on a synthetic project.
+
+    python -m benchmarks.bench_pipeline --docs 5 --elements 200 --pages 4 --cases 100 \\
+        --iterations 5 --llm-latency 0.05 --output run.json [--compare baseline.json]
+
+Stages timed on every iteration (a fresh project each time):
+  ingest               POST /ingest with every document and page
+  parse_html           parse_html_structure of every page
+  build_prompts        build_shards + build_prompt (retrieval and compaction)
+  generate_test_cases  POST /generate-test-cases job, until it has finished
+  validate_test_cases  validate_test_cases on K test cases
+  generate_scripts     POST /generate-scripts job for K test cases
+
+Reports latency percentiles and throughput per stage plus peak RSS as JSON.
+With --compare, the p50 of every stage is compared to an earlier --output file.
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import max_rss_mb, percentiles, run_isolated
+
+STAGES = ("ingest", "parse_html", "build_prompts", "generate_test_cases", "validate_test_cases", "generate_scripts")
+
+
+# ───────────────────────────────────────────────
+# 1️⃣ Synthetic project
+# ───────────────────────────────────────────────
+def make_page(page: int, elements: int) -> str:
+    rows = []
+    for i in range(elements):
+        field = f"field_{page}_{i}"
+        if i % 10 == 9:
+            rows.append(f'<button id="{field}" type="submit">Submit step {i}</button>')
+        elif i % 10 == 5:
+            rows.append(f'<label for="{field}">Option {i}</label><select id="{field}"><option>A</option></select>')
+        else:
+            rows.append(
+                f'<label for="{field}">Field {i}</label>'
+                f'<input id="{field}" name="f{i}" type="text" placeholder="Value {i}" class="input wide">'
+            )
+    return f"<html><body><form id='page{page}'>{''.join(rows)}</form></body></html>"
+
+
+def make_doc(doc: int, docs: int, pages: int, elements: int, iteration: int) -> str:
+    # Mentions every field once across all documents, so retrieval has something to find
+    lines = [f"Specification {doc} (revision {iteration})"]
+    for page in range(pages):
+        for i in range(doc, elements, docs):
+            lines.append(
+                f"Field {i} on page {page} (field_{page}_{i}) is mandatory and must be validated "
+                f"before the form is submitted; invalid values show an error below the field."
+            )
+    return "\n\n".join(lines)
+
+
+def write_project(directory: str, docs: int, pages: int, elements: int, iteration: int) -> list:
+    """
+    Files of one synthetic project; `elements` UI elements split over `pages` pages.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    per_page = max(1, elements // pages)
+    for page in range(pages):
+        path = os.path.join(directory, f"page{page}.html")
+        with open(path, "w") as f:
+            f.write(make_page(page, per_page))
+        paths.append(path)
+    for doc in range(docs):
+        path = os.path.join(directory, f"spec{doc}.txt")
+        with open(path, "w") as f:
+            f.write(make_doc(doc, docs, pages, per_page, iteration))
+        paths.append(path)
+    return paths
+
+
+# ───────────────────────────────────────────────
+# 2️⃣ Run (in a fresh process)
+# ───────────────────────────────────────────────
+def _wait_for_job(client, job_id: str, project_id: str) -> dict:
+    while True:
+        job = client.get(f"/jobs/{job_id}", params={"project_id": project_id}).json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            if job["status"] != "succeeded":
+                raise RuntimeError(f"Job {job_id} {job['status']}: {job.get('error')}")
+            return client.get(f"/jobs/{job_id}/result", params={"project_id": project_id}).json()
+        time.sleep(0.01)
+
+
+def _run(config: dict, queue) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Everything the app writes goes to the temp dir; must be set before importing it
+        os.environ.update({
+            "DATA_DIR": os.path.join(tmp, "data"),
+            "JOBS_DB_PATH": os.path.join(tmp, "data", "jobs.sqlite3"),
+            "LLM_CACHE_PATH": os.path.join(tmp, "data", "llm_cache.sqlite3"),
+            "LLM_PROVIDER": "stub",
+            "STUB_LLM_LATENCY_SECONDS": str(config["llm_latency"]),
+            "JOB_WORKERS": "1",
+            "JOB_POLL_SECONDS": "0.01",
+        })
+        from fastapi.testclient import TestClient
+        from backend.main import app
+        from backend.services.knowledge_base import load_knowledge
+        from backend.services.test_case_generator import build_prompt, build_shards, validate_test_cases
+        from backend.utils.html_parser import parse_html_structure
+
+        timings = {stage: [] for stage in STAGES}
+        items = {}
+        baseline_rss = max_rss_mb()
+        start = time.perf_counter()
+
+        def timed(stage: str, count: int, fn, *args, **kwargs):
+            began = time.perf_counter()
+            result = fn(*args, **kwargs)
+            timings[stage].append(time.perf_counter() - began)
+            items[stage] = count
+            return result
+
+        with TestClient(app) as client:
+            for iteration in range(config["iterations"]):
+                project = {"project_id": f"bench{iteration}"}
+                paths = write_project(os.path.join(tmp, f"files{iteration}"), config["docs"], config["pages"],
+                                      config["elements"], iteration)
+
+                files = [("files", (os.path.basename(path), open(path, "rb"))) for path in paths]
+                response = timed("ingest", len(files), client.post, "/ingest", files=files, params=project)
+                for _, (_, handle) in files:
+                    handle.close()
+                response.raise_for_status()
+
+                pages = [open(path).read() for path in paths if path.endswith(".html")]
+                elements = timed("parse_html", len(pages), lambda: sum(len(parse_html_structure(p)) for p in pages))
+
+                knowledge = load_knowledge(project["project_id"], cached=False)
+                shards = build_shards(knowledge)
+                timed("build_prompts", len(shards), lambda: [build_prompt(shard) for shard in build_shards(knowledge)])
+
+                def generate():
+                    job = client.post("/generate-test-cases", params={**project, "force_regenerate": True}).json()
+                    return _wait_for_job(client, job["job_id"], project["project_id"])
+
+                generated = timed("generate_test_cases", len(shards), generate)["test_cases"]
+                cases = generated.get("test_cases", [])[:config["cases"]]
+                selected = [tc["test_id"] for tc in cases]
+
+                timed("validate_test_cases", len(cases),
+                      validate_test_cases, {"test_cases": copy.deepcopy(cases)}, knowledge)
+
+                def scripts():
+                    job = client.post("/generate-scripts", json={"selected_test_ids": selected}, params=project).json()
+                    return _wait_for_job(client, job["job_id"], project["project_id"])
+
+                timed("generate_scripts", len(selected), scripts)
+
+        total = time.perf_counter() - start
+        stages = {}
+        for stage, seconds in timings.items():
+            p50 = percentiles(seconds)["p50"]
+            stages[stage] = {
+                **{name: round(value, 4) for name, value in percentiles(seconds).items()},
+                "mean": round(sum(seconds) / len(seconds), 4),
+                "items": items[stage],
+                "items_per_second": round(items[stage] / p50, 1) if p50 else None,
+            }
+        queue.put({
+            "config": config,
+            "ui_elements": elements,
+            "test_cases": len(cases),
+            "stages": stages,
+            "total_seconds": round(total, 3),
+            "peak_rss_mb": round(max_rss_mb(), 1),
+            "rss_growth_mb": round(max_rss_mb() - baseline_rss, 1),
+        })
+
+
+# ───────────────────────────────────────────────
+# 3️⃣ Report
+# ───────────────────────────────────────────────
+def compare(result: dict, baseline: dict) -> dict:
+    """
+    p50 of every stage relative to the baseline run (>1 = slower).
+    """
+    ratios = {}
+    for stage, stats in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage, {}).get("p50")
+        ratios[stage] = round(stats["p50"] / before, 3) if before else None
+    ratios["peak_rss_mb"] = round(result["peak_rss_mb"] / baseline["peak_rss_mb"], 3) if baseline.get("peak_rss_mb") else None
+    return ratios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=5)
+    parser.add_argument("--elements", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--cases", type=int, default=100, help="test cases validated / turned into scripts")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per stub LLM call")
+    parser.add_argument("--output", help="write the result JSON to this file")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in ("docs", "elements", "pages", "cases", "iterations", "llm_latency")}
+    result = run_isolated(_run, config)
+    if args.compare:
+        with open(args.compare) as f:
+            result["p50_vs_baseline"] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
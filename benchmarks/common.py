@@ -0,0 +1,44 @@
+import multiprocessing
+import resource
+import sys
+
+
+def max_rss_mb() -> float:
+    # Linux: VmHWM is reset on exec, unlike ru_maxrss which spawned children inherit
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_isolated(target, *args) -> dict:
+    """
+    Run `target(*args, queue)` in a fresh spawned process, so peak RSS is
+    measured independently of earlier runs, and return what it puts on the queue.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def percentiles(values, points=(50, 95, 99)) -> dict:
+    """
+    Nearest-rank percentiles of `values`, e.g. {"p50": ..., "p95": ..., "p99": ...}.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{point}": None for point in points}
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
@@ -0,0 +1,135 @@
+"""
+Local OpenAI-compatible LLM server that injects latency and quota errors.
+
+    python -m benchmarks.fake_llm_server --port 8089 --latency 0.2 --error-rate 0.2 --max-rps 5
+
+POST /v1/chat/completions answers with a canned completion after `latency`
+seconds (+/- `jitter`). A request is refused with 429 (and Retry-After) when
+more than `max_rps` requests arrived in the last second, or at random with
+probability `error_rate`. GET /stats returns the request counters.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, response: str = '{"test_cases": []}', latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, max_rps: float = 0,
+                 retry_after: float = 1.0, seed: int = 0):
+        super().__init__(address, FakeLLMHandler)
+        self.response = response
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.arrivals = deque()
+        self.counters = {"requests": 0, "ok": 0, "rate_limited": 0, "injected_errors": 0}
+
+    def admit(self) -> str:
+        """
+        "ok", "rate_limited" (over max_rps) or "injected_errors".
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.counters["requests"] += 1
+            while self.arrivals and self.arrivals[0] <= now - 1:
+                self.arrivals.popleft()
+            if self.max_rps and len(self.arrivals) >= self.max_rps:
+                outcome = "rate_limited"
+            elif self.random.random() < self.error_rate:
+                outcome = "injected_errors"
+            else:
+                self.arrivals.append(now)
+                outcome = "ok"
+            self.counters[outcome] += 1
+            return outcome
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    server: FakeLLMServer
+
+    def _send(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (deadline passed)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                self._send(200, dict(self.server.counters))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/v1/chat/completions":
+            self._send(404, {"error": "not found"})
+            return
+        if self.server.admit() != "ok":
+            retry_after = {"Retry-After": f"{self.server.retry_after:g}"}
+            self._send(429, {"error": {"message": "Resource exhausted", "code": 429}}, retry_after)
+            return
+        time.sleep(max(0.0, self.server.latency + self.server.random.uniform(-1, 1) * self.server.jitter))
+        self._send(200, {
+            "object": "chat.completion",
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.server.response}}],
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, **options) -> FakeLLMServer:
+    """
+    Start a FakeLLMServer on a background thread; port 0 picks a free port
+    (see server.server_address). Stop it with server.shutdown().
+    """
+    server = FakeLLMServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--response-file", help="file holding the completion text")
+    args = parser.parse_args()
+
+    response = open(args.response_file).read() if args.response_file else '{"test_cases": []}'
+    server = FakeLLMServer(("127.0.0.1", args.port), response=response, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate, max_rps=args.max_rps,
+                           retry_after=args.retry_after)
+    print(f"Fake LLM server on http://127.0.0.1:{args.port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import json
+import time
 import streamlit as st
 import requests
 
@@ -134,6 +136,15 @@ st.markdown("""
 # Backend URL
 BACKEND_URL = "http://127.0.0.1:8000"
 
+# Each project (team) has its own knowledge base, test cases and scripts on the backend
+project_id = st.sidebar.text_input("🗂 Project", value="default",
+                                   help="Letters, digits, '-' or '_'. Switch to work on another team's files.")
+PROJECT = {"project_id": project_id}
+if st.session_state.get("project_id") != project_id:
+    for key in ("knowledge_built", "test_cases", "selected_test_ids"):
+        st.session_state.pop(key, None)
+    st.session_state["project_id"] = project_id
+
 # -------------------- HEADER --------------------
 st.markdown("""
 <h1 style="text-align:center;">
@@ -150,7 +161,7 @@ st.write("---")
 st.markdown("### 🌸 Step 1: Upload Documents & HTML")
 st.info("✨ Please upload **checkout.html** and 3–5 support documents (requirements, API mock, UI/UX guidelines, etc.)")
 
-uploaded_files = st.file_uploader("💖 Drop your files here:", type=["txt", "html", "pdf", "docx"], accept_multiple_files=True)
+uploaded_files = st.file_uploader("💖 Drop your files here:", type=["txt", "md", "html", "htm", "xhtml", "pdf", "docx"], accept_multiple_files=True)
 
 if st.button("🚀 Build Knowledge Base", use_container_width=True):
     if not uploaded_files:
@@ -159,7 +170,7 @@ if st.button("🚀 Build Knowledge Base", use_container_width=True):
         with st.spinner("📚 Reading your files... sip some tea 🍵"):
             try:
                 files = [("files", (f.name, f.getvalue(), f.type)) for f in uploaded_files]
-                response = requests.post(f"{BACKEND_URL}/ingest", files=files)
+                response = requests.post(f"{BACKEND_URL}/ingest", files=files, params=PROJECT)
                 response.raise_for_status()
                 st.success("🎯 Yay! Knowledge Base Built Successfully! ✨")
                 st.json(response.json()["knowledge_summary"])
@@ -172,30 +183,62 @@ st.write("---")
 # -------------------- STEP 2 --------------------
 st.markdown("### 🍭 Step 2: Generate Test Cases")
 
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif not line and data_lines:
+            yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+
+
+dedup = st.selectbox("🧹 Near-duplicate test cases", ["merge", "drop", "off"],
+                     help="merge: keep one case per group with all their requirements; drop: keep one case; off: keep all")
+
 if st.button("📝 Generate Test Cases", use_container_width=True):
     if not st.session_state.get("knowledge_built"):
         st.warning("⚠ Honey, please build the knowledge base first!")
     else:
-        with st.spinner("🧠 Brainstorming test cases... 💭"):
-            response = requests.post(f"{BACKEND_URL}/generate-test-cases")
-
-        if response.status_code == 200:
-            st.success("✔ Perfect! Test cases generated successfully. 💖")
-            response_json = response.json()
-
-            # 🔍 Safely extract test cases
-            test_cases_data = response_json.get("test_cases")
-            if isinstance(test_cases_data, dict) and "test_cases" in test_cases_data:
-                st.session_state["test_cases"] = test_cases_data["test_cases"]
-            elif isinstance(test_cases_data, list):
-                st.session_state["test_cases"] = test_cases_data
-            else:
-                st.error("🚨 Unexpected response format! Cannot extract test cases.")
-                st.write("Debug →", response_json)
-                st.stop()
-
+        st.session_state.pop("test_cases", None)
+        status = st.empty()
+        live_cases = st.container()
+        status.info("🧠 Brainstorming test cases... 💭")
+        streamed, result = [], None
+
+        try:
+            params = {**PROJECT, "dedup": dedup}
+            with requests.post(f"{BACKEND_URL}/generate-test-cases/stream", params=params, stream=True) as response:
+                response.raise_for_status()
+                for event, data in iter_sse_events(response):
+                    if event == "test_case":
+                        streamed.append(data)
+                        status.info(f"🧠 Brainstorming test cases... {len(streamed)} so far 💭")
+                        live_cases.markdown(f"✅ **{data['test_id']}** — {data.get('title', '')}")
+                    elif event == "shard_error":
+                        live_cases.warning(f"⚠ Part of the knowledge base failed: {data.get('error')}")
+                    elif event == "done":
+                        result = data
+                    elif event == "error":
+                        result = data
+        except requests.exceptions.RequestException:
+            status.error("❌ Backend not reachable. Is FastAPI running?")
+            st.stop()
+
+        # 🔍 Safely extract test cases
+        if isinstance(result, dict) and isinstance(result.get("test_cases"), list):
+            status.success(f"✔ Perfect! {len(result['test_cases'])} test cases generated successfully. 💖")
+            if result.get("dedup", {}).get("removed"):
+                action = "merged" if result["dedup"]["mode"] == "merge" else "dropped"
+                st.info(f"🧹 {result['dedup']['removed']} near-duplicate test cases were {action}.")
+            st.session_state["test_cases"] = result["test_cases"]
         else:
-            st.error("❌ Failed to generate test cases.")
+            status.error("❌ Failed to generate test cases.")
+            st.write("Debug →", result)
+            st.stop()
 
 
 # 🟡 Show dropdown only if valid test cases exist
@@ -220,17 +263,41 @@ st.write("---")
 # -------------------- STEP 3 --------------------
 st.markdown("### 🦋 Step 3: Generate Selenium Scripts")
 
+explicit_waits = st.checkbox("⏱ Use explicit waits (WebDriverWait helpers instead of bare find_element)", value=True)
+page_objects = st.checkbox("🧩 Page objects (one class per page, browser shared per test class)")
+step_timeout = st.number_input("Step timeout (seconds)", min_value=1, max_value=120, value=10)
+
+def wait_for_job(job_id, progress_bar, poll_seconds=0.5):
+    """Poll a backend job until it finishes; returns the final /result response."""
+    while True:
+        job = requests.get(f"{BACKEND_URL}/jobs/{job_id}", params=PROJECT).json()
+        progress_bar.progress(job.get("progress") or 0.0, text=job.get("message") or job["status"])
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return requests.get(f"{BACKEND_URL}/jobs/{job_id}/result", params=PROJECT)
+        time.sleep(poll_seconds)
+
+
 if st.button("⚙ Generate Selenium Scripts", use_container_width=True):
     if not st.session_state.get("selected_test_ids"):
         st.warning("⚠ Please select test cases first!")
     else:
+        payload = {
+            "selected_test_ids": st.session_state["selected_test_ids"],
+            "mode": "page_object" if page_objects else ("explicit" if explicit_waits else "basic"),
+            "default_timeout": step_timeout,
+        }
         with st.spinner("🧪 Brewing your magic potion (Selenium Script)... 🪄"):
-            response = requests.post(f"{BACKEND_URL}/generate-scripts", json=st.session_state["selected_test_ids"])
+            response = requests.post(f"{BACKEND_URL}/generate-scripts", json=payload, params=PROJECT)
+            if response.status_code == 202:
+                response = wait_for_job(response.json()["job_id"], st.progress(0.0))
         if response.status_code == 200:
             script_code = response.json()["code"]
             st.success("🎉 Woohoo! Selenium Scripts Generated! 💃")
             st.code(script_code, language="python")
             st.download_button("⬇ Download Python Script 🐍", script_code, "generated_selenium_test.py", "text/x-python")
+            if response.json().get("helpers_code"):
+                st.download_button("⬇ Download Helpers Module (save next to the script) 🧰",
+                                   response.json()["helpers_code"], "selenium_helpers.py", "text/x-python")
         else:
             st.error(f"❌ Error: {response.json().get('detail')}")
 